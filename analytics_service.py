@@ -0,0 +1,377 @@
+# ScoreWise AI - Incrementally Maintained Dashboard Analytics
+import os
+import logging
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Numeric, case, cast, exists, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Assignment, Submission, SubmissionScore, User, UserAnalytics
+from feedback_themes import feedback_themes
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BINS = 5
+# Trend x values are days since this date, which keeps the regression sums small
+TREND_EPOCH = date(2024, 1, 1).toordinal()
+GRADES = ("A", "B", "C", "D", "F")
+# Student trends: moving average over the last few submissions, prediction a week past the last one
+MOVING_AVERAGE_WINDOW = int(os.getenv("TREND_MOVING_AVERAGE_WINDOW", "3"))
+PREDICTION_HORIZON_DAYS = 7
+
+
+def _histogram_bins(histogram: Dict[str, int]) -> Dict:
+    """Equal-width bins between the lowest and highest score, as shown on the dashboard chart"""
+    scores = sorted((int(score), count) for score, count in histogram.items() if count)
+    if not scores:
+        return {"labels": [], "data": []}
+
+    low, high = scores[0][0], scores[-1][0]
+    width = (high - low) / HISTOGRAM_BINS
+    labels, data = [], [0] * HISTOGRAM_BINS
+    for i in range(HISTOGRAM_BINS):
+        labels.append(f"{round(low + i * width)}-{round(low + (i + 1) * width)}%")
+    for score, count in scores:
+        # The highest score falls in the last bin
+        index = HISTOGRAM_BINS - 1 if width == 0 else min(int((score - low) / width), HISTOGRAM_BINS - 1)
+        data[index] += count
+    return {"labels": labels, "data": data}
+
+
+def fit_trends(groups: np.ndarray, x: np.ndarray, y: np.ndarray,
+               window: int = MOVING_AVERAGE_WINDOW, horizon: int = PREDICTION_HORIZON_DAYS) -> Dict[str, np.ndarray]:
+    """Least-squares score trend of every group at once.
+
+    groups are dense ids (0..n-1), x days and y scores, one entry per
+    observation in any order. Returns per-group arrays: count, slope (points
+    per day), moving average of the last `window` scores and the predicted
+    score `horizon` days after the group's last observation (NaN with fewer
+    than two observations).
+    """
+    order = np.lexsort((x, groups))
+    groups, x, y = groups[order], x[order].astype(np.float64), y[order].astype(np.float64)
+    size = int(groups.max()) + 1 if len(groups) else 0
+
+    # Centre x per group so the sums stay well conditioned for dates far from any epoch
+    n = np.bincount(groups, minlength=size).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = np.bincount(groups, weights=x, minlength=size) / n
+        mean_y = np.bincount(groups, weights=y, minlength=size) / n
+        dx = x - mean_x[groups]
+        sxx = np.bincount(groups, weights=dx * dx, minlength=size)
+        sxy = np.bincount(groups, weights=dx * (y - mean_y[groups]), minlength=size)
+    # Every observation on the same day: no trend, the mean is the best guess
+    slope = np.divide(sxy, sxx, out=np.zeros(size), where=sxx > 1e-9)
+
+    # Groups are contiguous after sorting, so each one's tail is a slice of a running sum
+    end = np.cumsum(n).astype(np.int64)
+    start = np.maximum(end - window, end - n.astype(np.int64))
+    running = np.concatenate(([0.0], np.cumsum(y)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        moving_average = (running[end] - running[start]) / (end - start)
+
+    predicted = np.clip(mean_y + slope * (x[end - 1] + horizon - mean_x), 0, 100)
+    predicted[n < 2] = np.nan
+    return {"count": n.astype(np.int64), "slope": slope, "moving_average": moving_average, "predicted": predicted}
+
+
+def _trend_summary(fit: Dict[str, np.ndarray], index: int) -> Dict:
+    predicted = fit["predicted"][index]
+    return {
+        "submissions": int(fit["count"][index]),
+        "slope_per_week": round(float(fit["slope"][index]) * 7, 2),
+        "moving_average": round(float(fit["moving_average"][index]), 1),
+        "predicted_score": None if np.isnan(predicted) else round(float(predicted), 1),
+    }
+
+
+class AnalyticsService:
+    """Per-user dashboard aggregates, folded in once per completed assignment"""
+
+    def _new_row(self, user_id: str) -> UserAnalytics:
+        return UserAnalytics(
+            user_id=user_id, assignments_count=0, submissions_count=0, average_score_sum=0,
+            grade_distribution={grade: 0 for grade in GRADES}, score_histogram={}, rubric_sums={},
+            trend_n=0, trend_sum_x=0, trend_sum_y=0, trend_sum_xx=0, trend_sum_xy=0,
+        )
+
+    def _fold(self, row: UserAnalytics, results: Dict, created_at) -> bool:
+        """Add one assignment's results to the row; False if it has nothing to aggregate"""
+        stats = results.get("overall_statistics") or {}
+        individual = results.get("individual_results") or []
+        if not stats:
+            return False
+
+        row.assignments_count += 1
+        row.submissions_count += stats.get("total_submissions", 0)
+        row.average_score_sum += stats.get("average_score", 0)
+        if stats.get("highest_score") is not None:
+            row.highest_score = max(stats["highest_score"], row.highest_score if row.highest_score is not None else float("-inf"))
+        if stats.get("lowest_score") is not None:
+            row.lowest_score = min(stats["lowest_score"], row.lowest_score if row.lowest_score is not None else float("inf"))
+        row.grade_distribution = {grade: row.grade_distribution.get(grade, 0) + stats.get("grade_distribution", {}).get(grade, 0)
+                                  for grade in GRADES}
+
+        # JSON columns are replaced rather than mutated so the change is persisted
+        histogram = dict(row.score_histogram)
+        rubric_sums = {criterion: list(totals) for criterion, totals in row.rubric_sums.items()}
+        x = created_at.toordinal() - TREND_EPOCH
+        for result in individual:
+            score = result.get("overall_score")
+            if isinstance(score, (int, float)):
+                bucket = str(max(0, min(100, round(score))))
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+                row.trend_n += 1
+                row.trend_sum_x += x
+                row.trend_sum_y += score
+                row.trend_sum_xx += x * x
+                row.trend_sum_xy += x * score
+            for criterion, value in (result.get("rubric_scores") or {}).items():
+                if isinstance(value, (int, float)):
+                    totals = rubric_sums.setdefault(criterion, [0, 0])
+                    totals[0] += value
+                    totals[1] += 1
+
+        row.score_histogram = histogram
+        row.rubric_sums = rubric_sums
+        row.trend_last_x = max(x, row.trend_last_x if row.trend_last_x is not None else x)
+        return True
+
+    def store_submissions(self, db: Session, assignment: Assignment, results: Dict):
+        """Write one Submission row (plus per-criterion scores) per graded submission; the caller commits"""
+        if db.query(exists().where(Submission.assignment_id == assignment.id)).scalar():
+            return
+        graded_at = assignment.completed_at or datetime.now()
+        for index, result in enumerate(results.get("individual_results") or [], 1):
+            submission_id = f"{assignment.id}_{result.get('submission_id') or index}"
+            score = result.get("overall_score")
+            db.add(Submission(
+                id=submission_id,
+                assignment_id=assignment.id,
+                student_name=result.get("student_name") or "Unknown",
+                file_path=result.get("file_path") or "",
+                overall_score=score if isinstance(score, (int, float)) else None,
+                rubric_scores=result.get("rubric_scores"),
+                feedback=result.get("feedback"),
+                detailed_feedback=result.get("detailed_feedback"),
+                strengths=result.get("strengths"),
+                areas_for_improvement=result.get("areas_for_improvement"),
+                graded_at=graded_at,
+            ))
+            for criterion, value in (result.get("rubric_scores") or {}).items():
+                if isinstance(value, (int, float)):
+                    db.add(SubmissionScore(submission_id=submission_id, criterion=criterion, score=value))
+
+    def _backfill_submissions(self, db: Session, user_id: str):
+        """Create Submission rows for assignments graded before they were stored"""
+        missing = db.query(Assignment).filter(
+            Assignment.user_id == user_id,
+            Assignment.status == "completed",
+            Assignment.results.isnot(None),
+            ~exists().where(Submission.assignment_id == Assignment.id),
+        )
+        backfilled = 0
+        for assignment in missing.yield_per(50):
+            if assignment.results:
+                self.store_submissions(db, assignment, assignment.results)
+                backfilled += 1
+        if backfilled:
+            db.flush()
+            logger.info(f"✓ Backfilled submissions of {backfilled} assignments for user {user_id}")
+
+    def rebuild(self, db: Session, user_id: str, exclude_assignment_id: Optional[str] = None) -> UserAnalytics:
+        """Aggregate a user's full history from scratch with SQL over the submissions table; the caller commits"""
+        row = db.get(UserAnalytics, user_id)
+        if row is None:
+            row = self._new_row(user_id)
+            db.add(row)
+        else:
+            fresh = self._new_row(user_id)
+            for column in UserAnalytics.__table__.columns.keys():
+                if column not in ("user_id", "updated_at"):
+                    setattr(row, column, getattr(fresh, column))
+        self._backfill_submissions(db, user_id)
+
+        # Served by idx_assignments_user_status_created and ix_submissions_assignment_id
+        completed = [Assignment.user_id == user_id, Assignment.status == "completed"]
+        if exclude_assignment_id:
+            completed.append(Assignment.id != exclude_assignment_id)
+        scored = db.query(Submission).join(Assignment).filter(*completed, Submission.overall_score.isnot(None))
+
+        # Per-assignment averages, matching the overall statistics the incremental path folds in
+        per_assignment = scored.with_entities(
+            func.avg(Submission.overall_score).label("average"),
+            func.count().label("submissions"),
+        ).group_by(Submission.assignment_id).subquery()
+        assignments, submissions, average_sum = db.query(
+            func.count(), func.sum(per_assignment.c.submissions), func.sum(func.round(cast(per_assignment.c.average, Numeric), 1)),
+        ).one()
+        if not assignments:
+            return row
+        row.assignments_count = assignments
+        row.submissions_count = int(submissions or 0)
+        row.average_score_sum = float(average_sum or 0)
+
+        score = Submission.overall_score
+        totals = scored.with_entities(
+            func.max(score), func.min(score),
+            func.sum(case((score >= 90, 1), else_=0)),
+            func.sum(case(((score >= 80) & (score < 90), 1), else_=0)),
+            func.sum(case(((score >= 70) & (score < 80), 1), else_=0)),
+            func.sum(case(((score >= 60) & (score < 70), 1), else_=0)),
+            func.sum(case((score < 60, 1), else_=0)),
+        ).one()
+        row.highest_score, row.lowest_score = totals[0], totals[1]
+        row.grade_distribution = {grade: int(count or 0) for grade, count in zip(GRADES, totals[2:])}
+
+        bucket = func.round(score)
+        row.score_histogram = {
+            str(max(0, min(100, int(value)))): count
+            for value, count in scored.with_entities(bucket, func.count()).group_by(bucket)
+        }
+        row.rubric_sums = {
+            criterion: [float(total), count]
+            for criterion, total, count in db.query(
+                SubmissionScore.criterion, func.sum(SubmissionScore.score), func.count())
+            .join(Submission).join(Assignment).filter(*completed)
+            .group_by(SubmissionScore.criterion)
+        }
+
+        # Scores grouped by day give the regression sums without reading every submission
+        day = func.date(Assignment.created_at)
+        for value, n, total in scored.with_entities(day, func.count(), func.sum(score)).group_by(day):
+            if isinstance(value, str):
+                value = date.fromisoformat(value)
+            x = value.toordinal() - TREND_EPOCH
+            row.trend_n += n
+            row.trend_sum_x += n * x
+            row.trend_sum_y += total
+            row.trend_sum_xx += n * x * x
+            row.trend_sum_xy += x * total
+            row.trend_last_x = max(x, row.trend_last_x if row.trend_last_x is not None else x)
+
+        user = db.get(User, user_id)
+        if user:
+            feedback_themes.rebuild(db, user, exclude_assignment_id)
+        return row
+
+    def record_completed(self, db: Session, assignment: Assignment, results: Dict):
+        """Fold a newly completed assignment into its owner's aggregates; the caller commits.
+
+        Call this in the same transaction that marks the assignment completed,
+        so each assignment is counted exactly once.
+        """
+        self.store_submissions(db, assignment, results)
+        user = db.get(User, assignment.user_id)
+        row = db.query(UserAnalytics).filter(
+            UserAnalytics.user_id == assignment.user_id).with_for_update().first()
+        if row is None:
+            # First completion since aggregates existed: include the user's history
+            try:
+                with db.begin_nested():
+                    row = self.rebuild(db, assignment.user_id, exclude_assignment_id=assignment.id)
+            except IntegrityError:
+                # Another worker created the row first
+                row = db.query(UserAnalytics).filter(
+                    UserAnalytics.user_id == assignment.user_id).with_for_update().first()
+        self._fold(row, results, assignment.created_at)
+        if user:
+            feedback_themes.record_results(db, user, assignment.subject, results)
+
+    def _predicted_score(self, row: UserAnalytics) -> Optional[int]:
+        """Linear trend of score over time, one week after the last assignment"""
+        n = row.trend_n
+        if n < 2:
+            return None
+        denominator = n * row.trend_sum_xx - row.trend_sum_x ** 2
+        if abs(denominator) < 1e-9:
+            # Every submission on the same day: no trend, the mean is the best guess
+            return int(row.trend_sum_y / n)
+        slope = (n * row.trend_sum_xy - row.trend_sum_x * row.trend_sum_y) / denominator
+        intercept = (row.trend_sum_y - slope * row.trend_sum_x) / n
+        return int(slope * (row.trend_last_x + 7) + intercept)
+
+    def student_trends(self, db: Session, user_id: str, student: Optional[str] = None) -> Dict:
+        """Per-student and per-criterion score trends over a user's full history, fitted in one batched pass"""
+        completed = [Assignment.user_id == user_id, Assignment.status == "completed",
+                     Submission.overall_score.isnot(None)]
+        if student:
+            completed.append(Submission.student_name == student)
+
+        scores = db.query(Submission.student_name, Assignment.created_at, Submission.overall_score).join(
+            Assignment).filter(*completed).all()
+        if not scores:
+            return {"students": [], "criteria": {}}
+        names, created, values = zip(*scores)
+        student_names, student_ids = np.unique(np.array(names, dtype=str), return_inverse=True)
+        days = np.array(created, dtype="datetime64[D]").astype(np.int64)
+        overall = fit_trends(student_ids, days, np.array(values, dtype=np.float64))
+
+        criterion_rows = db.query(Submission.student_name, Assignment.created_at,
+                                  SubmissionScore.criterion, SubmissionScore.score).select_from(SubmissionScore).join(
+            Submission).join(Assignment).filter(*completed).all()
+        students = [{"student": str(name), **_trend_summary(overall, i), "criteria": {}}
+                    for i, name in enumerate(student_names)]
+        criteria = {}
+        if criterion_rows:
+            names, created, criterion_names, values = zip(*criterion_rows)
+            # Criterion scores belong to scored submissions, so every student is in student_names
+            row_students = np.searchsorted(student_names, np.array(names, dtype=str))
+            criterion_list, criterion_ids = np.unique(np.array(criterion_names, dtype=str), return_inverse=True)
+            days = np.array(created, dtype="datetime64[D]").astype(np.int64)
+            values = np.array(values, dtype=np.float64)
+
+            class_fit = fit_trends(criterion_ids, days, values)
+            criteria = {str(name): _trend_summary(class_fit, i) for i, name in enumerate(criterion_list)}
+
+            pairs = row_students * len(criterion_list) + criterion_ids
+            pair_ids, pair_index = np.unique(pairs, return_inverse=True)
+            pair_fit = fit_trends(pair_index, days, values)
+            for i, pair in enumerate(pair_ids):
+                student_index, criterion_index = divmod(int(pair), len(criterion_list))
+                students[student_index]["criteria"][str(criterion_list[criterion_index])] = _trend_summary(pair_fit, i)
+
+        return {"students": students, "criteria": criteria}
+
+    def get_dashboard_analytics(self, db: Session, user_id: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Basic and advanced analytics for the dashboard, read from the aggregate row"""
+        row = db.get(UserAnalytics, user_id)
+        if row is None:
+            row = self.rebuild(db, user_id)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                row = db.get(UserAnalytics, user_id)
+
+        if not row.assignments_count:
+            return None, None
+
+        basic = {
+            "average_score": round(row.average_score_sum / row.assignments_count, 1),
+            "total_assignments": row.assignments_count,
+            "grade_distribution": dict(row.grade_distribution),
+        }
+        if not row.trend_n and not row.rubric_sums:
+            return basic, None
+
+        scope = f"user:{user_id}"
+        advanced = {
+            "highest_score": row.highest_score,
+            "lowest_score": row.lowest_score,
+            "total_submissions": row.submissions_count,
+            "score_histogram": _histogram_bins(row.score_histogram),
+            "rubric_averages": {criterion: round(total / count, 1)
+                                for criterion, (total, count) in row.rubric_sums.items() if count},
+            "top_strengths": [theme["theme"] for theme in feedback_themes.top_themes(db, scope, "strengths")],
+            "top_improvements": [theme["theme"] for theme in feedback_themes.top_themes(db, scope, "areas_for_improvement")],
+            "predicted_score": self._predicted_score(row),
+        }
+        return basic, advanced
+
+
+# Initialize analytics service instance
+analytics_service = AnalyticsService()
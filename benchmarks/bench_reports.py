@@ -0,0 +1,132 @@
+# ScoreWise AI - Benchmark for PDF report generation
+#
+# Compares reports per second of the shared-resource PDFReport against the
+# original per-document setup (fonts registered and the full-size logo
+# decoded for every report, every font embedded), and checks both lay out
+# the same pages. The outputs are not byte-identical: current reports embed
+# the pre-sized logo and only the fonts they use.
+#
+# Usage: python benchmarks/bench_reports.py [reports]
+import os
+import re
+import sys
+import asyncio
+import logging
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("PERPLEXITY_API_KEY", "benchmark")
+
+# The grader loads words.txt from the working directory on import
+WORK_DIR = tempfile.mkdtemp()
+os.chdir(WORK_DIR)
+if not os.path.exists("words.txt"):
+    with open("words.txt", "w") as f:
+        f.write("the\nwork\n")
+
+import grader
+from fpdf import FPDF
+
+logging.getLogger("grader").setLevel(logging.WARNING)
+
+
+class LegacyPDFReport(grader.PDFReport):
+    """The report setup as it was before the shared resource cache"""
+
+    def __init__(self):
+        FPDF.__init__(self)
+        self.set_auto_page_break(auto=True, margin=15)
+        self.fonts = {}
+        self.core_fonts = {}
+        self.logo_path = os.path.join(ROOT, "static", "scorewise_logo.png")
+        os.listdir(grader.FONTS_DIR)
+        self.add_font('DejaVu', '', os.path.join(grader.FONTS_DIR, 'DejaVuSans.ttf'), uni=True)
+        self.add_font('DejaVu', 'B', os.path.join(grader.FONTS_DIR, 'DejaVuSans-Bold.ttf'), uni=True)
+        self.add_font('DejaVu', 'I', os.path.join(grader.FONTS_DIR, 'DejaVuSans-Oblique.ttf'), uni=True)
+        self.add_font('DejaVu', 'BI', os.path.join(grader.FONTS_DIR, 'DejaVuSans-BoldOblique.ttf'), uni=True)
+        self.add_page()
+
+    def header(self):
+        if os.path.exists(self.logo_path):
+            self.image(self.logo_path, x=10, y=8, w=25, h=15)
+            self.set_xy(40, 8)
+            self.set_font('DejaVu', 'B', 18)
+            self.set_text_color(59, 130, 246)
+            self.cell(0, 8, 'ScoreWise AI', 0, 1, 'L')
+            self.set_xy(40, 16)
+            self.set_font('DejaVu', '', 12)
+            self.set_text_color(100, 100, 100)
+            self.cell(0, 6, 'AI-Powered Assignment Grading', 0, 1, 'L')
+            self.ln(5)
+            self.set_draw_color(200, 200, 200)
+            self.line(10, 28, 200, 28)
+            self.ln(10)
+        else:
+            self._text_only_header()
+        self.set_text_color(0, 0, 0)
+
+    def set_font(self, family, style='', size=0):
+        FPDF.set_font(self, family, style, size)
+
+    def output(self, name='', dest=''):
+        return FPDF.output(self, name, dest)
+
+
+def sample_results():
+    rubric = grader.grader.get_appropriate_rubric("physics", "exam")
+    results = []
+    for score, paragraphs in ((95, 1), (84, 20), (71, 60), (42, 120)):
+        results.append({
+            "overall_score": score,
+            "rubric_scores": {criterion: score - i for i, criterion in enumerate(rubric)},
+            "feedback": "Your derivation of the net force is clear and well organised. " * 4,
+            "strengths": ["clear free-body diagrams", "consistent units"],
+            "areas_for_improvement": ["show intermediate steps", "check the sign of the work done"],
+            "detailed_feedback": "The momentum analysis is correct but the energy step skips a term. " * paragraphs,
+        })
+    return rubric, results
+
+
+def page_count(path):
+    with open(path, "rb") as f:
+        return len(re.findall(rb"/Type /Page\b", f.read()))
+
+
+async def render(report_class, rubric, results, count, out_dir):
+    grader.PDFReport = report_class
+    paths = []
+    for i in range(count):
+        path = os.path.join(out_dir, f"{report_class.__name__}_{i % len(results)}.pdf")
+        await grader.grader.generate_pdf_report("Ada Lovelace", results[i % len(results)], rubric,
+                                                "physics", "exam", path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    shared_class = grader.PDFReport
+    rubric, results = sample_results()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        legacy_paths = asyncio.run(render(LegacyPDFReport, rubric, results, len(results), out_dir))
+        shared_paths = asyncio.run(render(shared_class, rubric, results, len(results), out_dir))
+        for legacy, shared in zip(legacy_paths, shared_paths):
+            assert page_count(legacy) == page_count(shared), f"{legacy} and {shared} have different page counts"
+        print(f"✓ {len(results)} multi-page reports with the same pages "
+              f"({sum(map(os.path.getsize, legacy_paths)) // 1024} KB before, "
+              f"{sum(map(os.path.getsize, shared_paths)) // 1024} KB now)")
+
+        for label, report_class in (("per-document setup", LegacyPDFReport), ("shared resources", shared_class)):
+            start = time.perf_counter()
+            asyncio.run(render(report_class, rubric, results, count, out_dir))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>20}: {count / elapsed:6.1f} reports/s  ({elapsed / count * 1000:6.1f} ms/report)")
+
+    grader.PDFReport = shared_class
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# ScoreWise AI - Micro-benchmark for the OCR text quality analyzer
+#
+# Compares TextQualityAnalyzer / clean_ocr_text against the original
+# multi-regex implementations on OCR-sized inputs, and checks that both
+# produce the same indicators and OCR normalization. Also times a true
+# single-scan analyzer (one finditer over the text, indicators counted per
+# match), checked against the same samples: per-match Python work makes it
+# slower than several C-level regex passes, which is why it is not used.
+#
+# Usage: python benchmarks/bench_text_quality.py [words.txt]
+import os
+import re
+import sys
+import random
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_quality import TextQualityAnalyzer, clean_ocr_text
+from wordlist import load_word_index
+
+WORDS = ("the force acting on a block of mass is equal to its acceleration times "
+         "velocity energy momentum friction coefficient newton second law answer "
+         "therefore we find that kinetic potential gravity hence solution").split()
+NOISE = ["\u01c2", "\u00ac", "\u00a7", "w\u0305", "x\u20d7", "|", "~", "@", "#", "strngth", "q", "l", "I", "\u00e9t\u00e9"]
+OCR_SPECIALS = ["\u2081", "\u2082", "\u207b", "\u2076", "\u2079", "\u00b2", "\u00b5"]
+
+
+def legacy_valid_word_ratio(text, word_set):
+    words = re.findall(r'\b[a-zA-Z]{2,}\b', text)
+    if not words:
+        return 0.0
+    return sum(1 for w in words if w.lower() in word_set) / len(words)
+
+
+def legacy_garbled_ratio(text):
+    if not text or len(text) < 10:
+        return 1.0
+    garbled_indicators = 0
+    total_chars = max(len(text), 1)
+    special_char_matches = re.findall(r'[^\w\s\.\,\!\?\-\(\)\'\":;]', text)
+    garbled_indicators += min(len(special_char_matches) / total_chars * 5, 1.0)
+    consonant_clusters = re.findall(r'[bcdfghjklmnpqrstvwxyzBCDFGHJKLMNPQRSTVWXYZ]{4,}', text)
+    garbled_indicators += min(len(consonant_clusters) / max(len(text.split()), 1) * 3, 1.0)
+    isolated_chars = re.findall(r'\b[a-zA-Z]\b', text)
+    garbled_indicators += min(len(isolated_chars) / max(len(text.split()), 1) * 2, 1.0)
+    unusual_chars = re.findall(r'[\u0300-\u036f\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]', text)
+    garbled_indicators += min(len(unusual_chars) / total_chars * 10, 1.0)
+    return min(garbled_indicators / 4, 1.0)
+
+
+def legacy_clean_ocr_content(content):
+    content = content.replace('\u2081', '1').replace('\u2082', '2')
+    content = content.replace('\u207b', '-').replace('\u2076', '6')
+    content = content.replace('\u2079', '9').replace('\u00b2', '^2')
+    content = content.replace('\u00b5', '\u00b5')
+    content = content.replace('. ', '.\n')
+    content = content.replace('? ', '?\n')
+    content = content.replace(': ', ':\n')
+    content = re.sub(r'\n\s*\n', '\n\n', content)
+    return content.strip()
+
+
+_SINGLE_SCAN = re.compile(
+    r"(?P<run>(?<!\w)[a-zA-Z]+(?!\w))"       # letter runs: words and isolated letters
+    r"|(?P<inner>[a-zA-Z]+)"                  # letters inside longer tokens, for consonant clusters
+    r"|(?P<special>[^\w\s\.\,\!\?\-\(\)\'\":;])"
+    r"|(?P<space>\s+)"
+)
+_CLUSTER = re.compile(r"[bcdfghjklmnpqrstvwxyzBCDFGHJKLMNPQRSTVWXYZ]{4,}")
+_UNUSUAL = re.compile(r"[\u0300-\u036f\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+
+def single_scan_garbled_ratio(text):
+    """The garbled ratio from one pass over the text"""
+    if len(text) < 10:
+        return 1.0
+    specials = unusual = clusters = isolated = spaces = 0
+    for match in _SINGLE_SCAN.finditer(text):
+        kind, value = match.lastgroup, match.group()
+        if kind == "space":
+            spaces += 1
+        elif kind == "special":
+            specials += 1
+            unusual += bool(_UNUSUAL.match(value))
+        elif kind == "run" and len(value) == 1:
+            isolated += 1
+        elif len(value) >= 4:
+            clusters += len(_CLUSTER.findall(value))
+    # Whitespace runs separate tokens, except at either end of the text
+    tokens = spaces + 1 - text[:1].isspace() - text[-1:].isspace()
+    per_token = max(tokens, 1)
+    garbled = min(specials / len(text) * 5, 1.0)
+    garbled += min(clusters / per_token * 3, 1.0)
+    garbled += min(isolated / per_token * 2, 1.0)
+    garbled += min(unusual / len(text) * 10, 1.0)
+    return min(garbled / 4, 1.0)
+
+
+def make_text(rng, n_tokens, noise_rate):
+    tokens = []
+    for _ in range(n_tokens):
+        if rng.random() < noise_rate:
+            tokens.append(rng.choice(NOISE + OCR_SPECIALS))
+        else:
+            tokens.append(rng.choice(WORDS))
+        tokens.append(rng.choice([" ", " ", " ", ". ", ", ", "? ", ": ", "\n", " \n \n", "  "]))
+    return "".join(tokens)
+
+
+def check_equivalence(analyzer, word_set, rng, samples=2000):
+    for i in range(samples):
+        text = make_text(rng, rng.randint(0, 300), rng.choice([0.0, 0.05, 0.3, 0.8]))
+        quality = analyzer.analyze(text)
+        assert quality["garbled_ratio"] == legacy_garbled_ratio(text), text
+        assert quality["valid_word_ratio"] == legacy_valid_word_ratio(text, word_set), text
+        assert single_scan_garbled_ratio(text) == legacy_garbled_ratio(text), text
+        assert clean_ocr_text(text) == legacy_clean_ocr_content(text), text
+    print(f"✓ {samples} random samples: identical ratios and OCR normalization")
+
+
+def main():
+    rng = random.Random(1234)
+    source = sys.argv[1] if len(sys.argv) > 1 else None
+    with tempfile.TemporaryDirectory() as tmp:
+        if not source:
+            source = os.path.join(tmp, "words.txt")
+            with open(source, "w") as f:
+                f.write("\n".join(WORDS))
+        index = load_word_index(source, os.path.join(tmp, "words.bin"))
+        with open(source) as f:
+            word_set = set(word.strip().lower() for word in f if word.strip())
+
+        analyzer = TextQualityAnalyzer(index)
+        check_equivalence(analyzer, word_set, rng)
+
+        # ~1 KB detection samples (2 pages x 500 chars) and 8 KB OCR page transcripts
+        for label, n_tokens in (("detection sample ~1KB", 170), ("OCR page ~8KB", 1400)):
+            texts = [make_text(rng, n_tokens, 0.1) for _ in range(50)]
+
+            def legacy():
+                for t in texts:
+                    legacy_garbled_ratio(t)
+                    legacy_valid_word_ratio(t, word_set)
+                    legacy_clean_ocr_content(t)
+
+            def current():
+                for t in texts:
+                    analyzer.analyze(t)
+                    clean_ocr_text(t)
+
+            def single_scan():
+                for t in texts:
+                    single_scan_garbled_ratio(t)
+                    legacy_valid_word_ratio(t, word_set)
+                    clean_ocr_text(t)
+
+            legacy_time, current_time, scan_time = (
+                min(timeit.repeat(run, number=20, repeat=5)) / (20 * len(texts))
+                for run in (legacy, current, single_scan))
+            print(f"{label:>22}: legacy {legacy_time * 1e6:8.1f} µs   "
+                  f"current {current_time * 1e6:8.1f} µs ({legacy_time / current_time:.2f}x)   "
+                  f"single scan {scan_time * 1e6:8.1f} µs ({legacy_time / scan_time:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# ScoreWise AI - Micro-benchmark for the batched student trend fit
+#
+# Compares analytics_service.fit_trends against a per-student np.polyfit
+# loop on an institution-sized history, and checks both give the same
+# slopes and predictions.
+#
+# Usage: python benchmarks/bench_trends.py [students] [submissions per student]
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_service import fit_trends, PREDICTION_HORIZON_DAYS
+
+
+def make_history(students, per_student, seed=7):
+    rng = np.random.default_rng(seed)
+    groups = np.repeat(np.arange(students), per_student)
+    days = 19700 + rng.integers(0, 365, size=groups.size)
+    base = rng.uniform(50, 90, size=students)
+    drift = rng.normal(0, 0.05, size=students)
+    scores = np.clip(base[groups] + drift[groups] * (days - 19700) + rng.normal(0, 5, size=groups.size), 0, 100)
+    # Rows arrive in database order, not grouped by student
+    order = rng.permutation(groups.size)
+    return groups[order], days[order], scores[order]
+
+
+def polyfit_loop(groups, days, scores):
+    slopes, predicted = [], []
+    for student in range(groups.max() + 1):
+        mask = groups == student
+        x, y = days[mask].astype(float), scores[mask]
+        slope, intercept = np.polyfit(x, y, 1)
+        slopes.append(slope)
+        predicted.append(min(max(slope * (x.max() + PREDICTION_HORIZON_DAYS) + intercept, 0), 100))
+    return np.array(slopes), np.array(predicted)
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    per_student = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    groups, days, scores = make_history(students, per_student)
+
+    fit = fit_trends(groups, days, scores)
+    slopes, predicted = polyfit_loop(groups, days, scores)
+    assert np.allclose(fit["slope"], slopes, atol=1e-9), "slopes differ"
+    assert np.allclose(fit["predicted"], predicted, atol=1e-6), "predictions differ"
+
+    batched = min(timeit.repeat(lambda: fit_trends(groups, days, scores), number=1, repeat=5))
+    looped = min(timeit.repeat(lambda: polyfit_loop(groups, days, scores), number=1, repeat=1))
+    print(f"{students} students x {per_student} submissions")
+    print(f"  polyfit per student: {looped * 1000:8.1f} ms")
+    print(f"  fit_trends batched:  {batched * 1000:8.1f} ms  ({looped / batched:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# ScoreWise AI - Report size regression check
+#
+# Renders a fixed corpus of student reports and compares the bytes of each
+# against the recorded budget in report_size_budget.json. Exits non-zero when
+# any report grows more than the allowed tolerance.
+#
+# Usage: python benchmarks/check_report_size.py [--update]
+import os
+import sys
+import json
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_reports import grader, sample_results, render
+
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_size_budget.json")
+DEFAULT_TOLERANCE = 0.05
+
+
+def measure():
+    rubric, results = sample_results()
+    # Accented names and feedback pull extra glyphs into the font subsets
+    results.append(dict(results[1], feedback="Très bien, Zoë: the Ω-dependence and ΔE ≈ 0 are correct. " * 4))
+    with tempfile.TemporaryDirectory() as out_dir:
+        paths = asyncio.run(render(grader.PDFReport, rubric, results, len(results), out_dir))
+        return {f"report_{i}": os.path.getsize(path) for i, path in enumerate(paths)}
+
+
+def main():
+    sizes = measure()
+    mean = sum(sizes.values()) / len(sizes)
+    print(f"{len(sizes)} reports, {mean / 1024:.1f} KB per report on average")
+
+    if "--update" in sys.argv or not os.path.exists(BUDGET_PATH):
+        with open(BUDGET_PATH, "w") as f:
+            json.dump({"tolerance": DEFAULT_TOLERANCE, "bytes_per_report": sizes}, f, indent=2)
+            f.write("\n")
+        print(f"✓ Recorded budget in {BUDGET_PATH}")
+        return 0
+
+    with open(BUDGET_PATH) as f:
+        budget = json.load(f)
+    tolerance = budget.get("tolerance", DEFAULT_TOLERANCE)
+
+    failures = 0
+    for name, size in sizes.items():
+        allowed = budget["bytes_per_report"].get(name)
+        if allowed is None:
+            print(f"⚠️ {name}: {size} bytes, no budget recorded")
+            continue
+        status = "✓" if size <= allowed * (1 + tolerance) else "✗"
+        failures += status == "✗"
+        print(f"{status} {name}: {size} bytes (budget {allowed}, {(size - allowed) / allowed:+.1%})")
+
+    if failures:
+        print(f"✗ {failures} report(s) over budget by more than {tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# ScoreWise AI - S3 task storage check
+#
+# Runs S3Storage against an in-memory S3 (moto) the way a multi-node
+# deployment uses it: a task is published from one node's uploads/, its
+# working copy is removed, and the files are fetched back, evicted locally
+# and finally deleted everywhere. Exits non-zero on the first mismatch.
+#
+# Requires moto (pip install "moto[s3]"); not needed to run the app.
+#
+# Usage: python benchmarks/check_s3_storage.py
+import os
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    print("✗ This check needs boto3 and moto (pip install \"moto[s3]\")")
+    sys.exit(1)
+
+from storage import S3Storage
+
+BUCKET = "scorewise-check"
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+
+def bucket_keys(client):
+    return sorted(obj["Key"] for obj in client.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+
+async def check(root: Path) -> int:
+    storage = S3Storage(BUCKET, prefix="tasks", root=root)
+    failures = 0
+
+    def expect(label, condition):
+        nonlocal failures
+        failures += not condition
+        print(f"{'✓' if condition else '✗'} {label}")
+
+    task_dir = root / "task-1"
+    files = {
+        task_dir / "assignment_a.pdf": b"%PDF-1.3 assignment",
+        task_dir / "reports" / "manifest.json": b"[]",
+        task_dir / "reports" / "Ada_report.pdf": b"%PDF-1.3 report",
+    }
+    for path, content in files.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+    await storage.publish(files)
+    expect("publish uploads every file under the prefix",
+           bucket_keys(storage.client) == sorted(f"tasks/{p.relative_to(root).as_posix()}" for p in files))
+
+    # Another node: nothing local yet
+    await storage.delete_local_dir(task_dir)
+    fetched = await storage.fetch(task_dir / "assignment_a.pdf")
+    expect("fetch downloads a missing file", fetched.read_bytes() == files[task_dir / "assignment_a.pdf"])
+    await storage.fetch_dir(task_dir / "reports")
+    expect("fetch_dir downloads a whole directory",
+           all(p.read_bytes() == c for p, c in files.items() if "reports" in p.parts))
+    expect("downloads leave no partial files behind", not list(root.rglob("*.part")))
+
+    try:
+        await storage.fetch(task_dir / "missing.pdf")
+        expect("fetch of a missing key raises FileNotFoundError", False)
+    except FileNotFoundError:
+        expect("fetch of a missing key raises FileNotFoundError", True)
+
+    freed = await storage.delete_local_dir(task_dir / "reports")
+    expect("delete_local_dir frees local bytes", freed > 0 and not (task_dir / "reports").exists())
+    expect("delete_local_dir keeps the bucket copy", len(bucket_keys(storage.client)) == len(files))
+
+    await storage.delete(task_dir / "assignment_a.pdf")
+    expect("delete removes the local file and its key",
+           not (task_dir / "assignment_a.pdf").exists()
+           and "tasks/task-1/assignment_a.pdf" not in bucket_keys(storage.client))
+
+    await storage.fetch_dir(task_dir)
+    await storage.delete_dir(task_dir)
+    expect("delete_dir removes the directory everywhere",
+           not task_dir.exists() and not bucket_keys(storage.client))
+    return failures
+
+
+def main():
+    with mock_aws(), tempfile.TemporaryDirectory() as root:
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        failures = asyncio.run(check(Path(root)))
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ S3 storage behaves as the local backend expects")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# ScoreWise AI - Billing Outbox Dispatcher
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import stripe
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import BillingOutbox
+
+logger = logging.getLogger(__name__)
+
+RUN_BILLING_DISPATCHER = os.getenv("RUN_BILLING_DISPATCHER", "true").lower() == "true"
+BILLING_POLL_SECONDS = float(os.getenv("BILLING_POLL_SECONDS", "30"))
+BILLING_BATCH_SIZE = int(os.getenv("BILLING_BATCH_SIZE", "100"))
+# Retries back off exponentially from this delay; Stripe keeps idempotency keys for 24 hours
+BILLING_RETRY_SECONDS = int(os.getenv("BILLING_RETRY_SECONDS", "60"))
+MAX_BILLING_ATTEMPTS = int(os.getenv("MAX_BILLING_ATTEMPTS", "8"))
+# Rows a dispatcher claimed but never settled (it died mid-batch) are sent again after this long
+BILLING_CLAIM_LEASE = timedelta(minutes=int(os.getenv("BILLING_CLAIM_LEASE_MINUTES", "10")))
+
+
+class BillingDispatcher:
+    """Delivers outbox rows to Stripe as invoice items.
+
+    Due rows are claimed in batches and grouped by customer and price. Each
+    group gets a batch id, kept on its rows across retries, that is sent as
+    the Stripe idempotency key, so a retried batch never bills twice.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or stripe.InvoiceItem
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def wake(self):
+        """Deliver newly queued items now instead of at the next poll"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    def claim(self, db: Session) -> Dict[str, List[BillingOutbox]]:
+        """Take due rows and group them into batches; returns rows by batch id"""
+        now = datetime.now()
+        db.query(BillingOutbox).filter(
+            BillingOutbox.status == "sending", BillingOutbox.claimed_at < now - BILLING_CLAIM_LEASE
+        ).update({BillingOutbox.status: "pending"}, synchronize_session=False)
+
+        # SKIP LOCKED lets dispatchers on several nodes share the outbox
+        rows = db.query(BillingOutbox).filter(
+            BillingOutbox.status == "pending", BillingOutbox.next_attempt_at <= now
+        ).order_by(BillingOutbox.next_attempt_at).limit(BILLING_BATCH_SIZE).with_for_update(skip_locked=True).all()
+        # A retried batch must go out whole, or its idempotency key would be reused with another quantity
+        for batch_id in {row.batch_id for row in rows if row.batch_id}:
+            try:
+                with db.begin_nested():
+                    siblings = db.query(BillingOutbox).filter(
+                        BillingOutbox.batch_id == batch_id,
+                        BillingOutbox.id.notin_([row.id for row in rows if row.batch_id == batch_id])
+                    ).with_for_update(nowait=True).all()
+            except OperationalError:
+                siblings = None  # partly locked by another dispatcher
+            if siblings is None or any(row.status != "pending" for row in siblings):
+                # Released on commit, for a pass that can take the whole batch
+                rows = [row for row in rows if row.batch_id != batch_id]
+            else:
+                rows += siblings
+
+        new_batches: Dict[Tuple[str, str], str] = {}
+        batches: Dict[str, List[BillingOutbox]] = {}
+        for row in rows:
+            if not row.batch_id:
+                key = (row.stripe_customer_id, row.stripe_price_id)
+                row.batch_id = new_batches.setdefault(key, str(uuid.uuid4()))
+            row.status = "sending"
+            row.claimed_at = now
+            batches.setdefault(row.batch_id, []).append(row)
+        db.commit()
+        return batches
+
+    def _send(self, batch_id: str, rows: List[BillingOutbox]) -> str:
+        item = self.client.create(
+            customer=rows[0].stripe_customer_id,
+            price=rows[0].stripe_price_id,
+            quantity=sum(row.quantity for row in rows),
+            metadata={"outbox_batch": batch_id},
+            idempotency_key=f"scorewise-outbox-{batch_id}",
+        )
+        return item["id"]
+
+    def settle(self, db: Session, rows: List[BillingOutbox], item_id: Optional[str], error: Optional[Exception]):
+        now = datetime.now()
+        for row in rows:
+            row.attempts += 1
+            if error is None:
+                row.status, row.sent_at, row.stripe_invoice_item_id = "sent", now, item_id
+                continue
+            row.last_error = str(error)
+            # Bad requests (unknown customer or price) won't succeed on retry
+            if isinstance(error, stripe.error.InvalidRequestError) or row.attempts >= MAX_BILLING_ATTEMPTS:
+                row.status = "failed"
+            else:
+                row.status = "pending"
+                row.next_attempt_at = now + timedelta(seconds=BILLING_RETRY_SECONDS * 2 ** (row.attempts - 1))
+        db.commit()
+
+    async def dispatch_once(self) -> int:
+        """Deliver one batch of due rows; returns how many rows were settled"""
+        db = SessionLocal()
+        try:
+            batches = self.claim(db)
+            for batch_id, rows in batches.items():
+                quantity = sum(row.quantity for row in rows)
+                try:
+                    # The Stripe client is blocking, so it runs in a thread
+                    item_id = await asyncio.to_thread(self._send, batch_id, rows)
+                    self.settle(db, rows, item_id, None)
+                    logger.info(f"✓ Created Stripe invoice item: {quantity} overage(s) for {rows[0].stripe_customer_id}")
+                except Exception as e:
+                    self.settle(db, rows, None, e)
+                    logger.error(f"✗ Failed to create Stripe invoice item for batch {batch_id}: {str(e)}")
+            return sum(len(rows) for rows in batches.values())
+        finally:
+            db.close()
+
+    async def run_forever(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                # Keep going while full batches come back
+                while await self.dispatch_once() >= BILLING_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                logger.error(f"✗ Billing dispatcher error: {str(e)}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=BILLING_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Initialize billing dispatcher instance
+billing_dispatcher = BillingDispatcher()
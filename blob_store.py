@@ -0,0 +1,148 @@
+# ScoreWise AI - Content-Addressed Upload Store
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from models import Blob
+
+logger = logging.getLogger(__name__)
+
+# Must be on the same filesystem as uploads/ so task files can be hard links
+BLOB_STORE_DIR = Path(os.getenv("BLOB_STORE_DIR", "uploads/.blobs"))
+
+# Derived data cached next to a blob, keyed by the same hash
+EXTRACTED_TEXT = "text-v1.txt"
+
+
+class BlobStore:
+    """Uploads stored once per SHA-256 and hard-linked into every task directory that uses them.
+
+    Reference counts live in the blobs table; a blob and its derived files
+    are deleted when the last task referencing it is released. Linked task
+    files share the blob's inode, so they must never be modified in place.
+    """
+
+    def __init__(self, root: Path = BLOB_STORE_DIR):
+        self.root = Path(root)
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    def derived_path(self, sha256: str, kind: str) -> Path:
+        return self.root / sha256[:2] / f"{sha256}.{kind}"
+
+    def _link_to_blob(self, path: Path, sha256: str) -> bool:
+        """Make path a hard link to the blob, creating the blob from path if it is new"""
+        blob = self.blob_path(sha256)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            try:
+                # New content: the freshly written upload becomes the blob
+                os.link(path, blob)
+                return True
+            except FileExistsError:
+                pass
+            # Known content: swap the fresh copy for a link to the stored one
+            tmp_link = path.with_name(f"{path.name}.{os.getpid()}.link")
+            os.link(blob, tmp_link)
+            os.replace(tmp_link, path)
+            return True
+        except OSError as e:
+            # e.g. the store is on another filesystem; keep the task's own copy
+            logger.warning(f"⚠️ Could not link {path} into blob store: {e}")
+            return False
+
+    def _add_reference(self, db: Session, sha256: str, size: int):
+        updated = db.query(Blob).filter(Blob.sha256 == sha256).update(
+            {Blob.ref_count: Blob.ref_count + 1, Blob.last_referenced_at: func.now()},
+            synchronize_session=False)
+        if updated:
+            return
+        try:
+            with db.begin_nested():
+                db.add(Blob(sha256=sha256, size=size, ref_count=1))
+        except IntegrityError:
+            # Another upload inserted the row first
+            db.query(Blob).filter(Blob.sha256 == sha256).update(
+                {Blob.ref_count: Blob.ref_count + 1, Blob.last_referenced_at: func.now()},
+                synchronize_session=False)
+
+    def adopt_files(self, db: Session, file_checksums: Dict[str, str]) -> int:
+        """Deduplicate a task's freshly written files into the store; returns how many were already stored"""
+        already_stored = 0
+        for path, sha256 in file_checksums.items():
+            path = Path(path)
+            existed = self.blob_path(sha256).exists()
+            if self._link_to_blob(path, sha256):
+                self._add_reference(db, sha256, path.stat().st_size)
+                already_stored += existed
+        db.commit()
+        if already_stored:
+            logger.info(f"✓ {already_stored} of {len(file_checksums)} uploaded files were already stored")
+        return already_stored
+
+    def release_files(self, db: Session, file_checksums: Dict[str, str]) -> int:
+        """Drop a task's references; deletes blobs nobody references any more. Returns bytes freed."""
+        freed = 0
+        for sha256 in file_checksums.values():
+            db.query(Blob).filter(Blob.sha256 == sha256).update(
+                {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False)
+        db.commit()
+
+        for sha256 in set(file_checksums.values()):
+            deleted = db.query(Blob).filter(Blob.sha256 == sha256, Blob.ref_count <= 0).delete(
+                synchronize_session=False)
+            db.commit()
+            if not deleted:
+                continue
+            for path in self.root.glob(f"{sha256[:2]}/{sha256}*"):
+                try:
+                    freed += path.stat().st_size
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not delete blob file {path}: {e}")
+        return freed
+
+    def linked_files(self, task_dir: Path) -> Dict[str, str]:
+        """Checksums of a task directory's files that are links into the store, by path"""
+        linked = {}
+        for path in Path(task_dir).rglob("*"):
+            if not path.is_file() or path.stat().st_nlink < 2:
+                continue
+            sha256 = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256.update(chunk)
+            blob = self.blob_path(sha256.hexdigest())
+            if blob.exists() and os.path.samefile(blob, path):
+                linked[str(path)] = sha256.hexdigest()
+        return linked
+
+    def read_derived(self, sha256: Optional[str], kind: str) -> Optional[str]:
+        if not sha256:
+            return None
+        try:
+            with open(self.derived_path(sha256, kind), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write_derived(self, sha256: Optional[str], kind: str, content: str):
+        if not sha256:
+            return
+        path = self.derived_path(sha256, kind)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+# Initialize blob store instance
+blob_store = BlobStore()
@@ -0,0 +1,77 @@
+# ScoreWise AI - Per-User Dashboard Cache and ETags
+import os
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from models import User
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_CACHE_ENTRIES = int(os.getenv("DASHBOARD_CACHE_ENTRIES", "2000"))
+# Part of every ETag, so a deploy with new templates or payloads doesn't serve stale pages
+CACHE_EPOCH = os.getenv("APP_VERSION") or uuid.uuid4().hex[:8]
+CACHE_CONTROL = "private, no-cache"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check; weak comparison, as for GET"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+class DashboardCache:
+    """Dashboard payloads computed once per user data version.
+
+    users.data_version goes up with every update of the user row (billing
+    events, usage counters) and whenever one of their assignments is queued,
+    finishes or fails. Cached payloads and ETags are keyed by it, so a bump
+    invalidates both on every node. Entries also expire at midnight, since
+    the usage summary counts days remaining.
+    """
+
+    def __init__(self, max_entries: int = DASHBOARD_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bump(self, db: Session, user_ids: Iterable[str]):
+        """Invalidate users' cached dashboards; the caller commits"""
+        user_ids = list(set(user_ids))
+        if user_ids:
+            db.query(User).filter(User.id.in_(user_ids)).update(
+                {User.data_version: User.data_version + 1}, synchronize_session=False)
+
+    def etag(self, user: User, kind: str) -> str:
+        # The user is part of the tag so a shared browser never revalidates another account's page
+        owner = hashlib.sha256(f"{user.id}:{CACHE_EPOCH}".encode()).hexdigest()[:16]
+        return f'W/"{kind}-{owner}-{user.data_version or 0}-{date.today().isoformat()}"'
+
+    def get_or_compute(self, user: User, kind: str, compute: Callable[[], Any]) -> Any:
+        key = (user.id, kind)
+        stamp = (user.data_version or 0, date.today())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+# Initialize dashboard cache instance
+dashboard_cache = DashboardCache()
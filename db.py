@@ -157,6 +157,65 @@ def migrate_database():
                 END IF;
             END $$;
             """,
+            # The column holds the reports manifest since the ZIP is streamed (still a .zip for older tasks)
+            """
+            DO $$ 
+            BEGIN 
+                IF EXISTS (SELECT 1 FROM information_schema.columns 
+                          WHERE table_name='assignments' AND column_name='reports_zip_path')
+                   AND NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                   WHERE table_name='assignments' AND column_name='reports_manifest_path') THEN
+                    ALTER TABLE assignments RENAME COLUMN reports_zip_path TO reports_manifest_path;
+                END IF;
+            END $$;
+            """,
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name='assignments' AND column_name='files_purged_at') THEN
+                    ALTER TABLE assignments ADD COLUMN files_purged_at TIMESTAMP;
+                END IF;
+            END $$;
+            """,
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name='assignments' AND column_name='summary') THEN
+                    ALTER TABLE assignments ADD COLUMN summary JSON;
+                END IF;
+            END $$;
+            """,
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name='users' AND column_name='data_version') THEN
+                    ALTER TABLE users ADD COLUMN data_version INTEGER DEFAULT 0 NOT NULL;
+                END IF;
+            END $$;
+            """,
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name='subscription_events' AND column_name='payload') THEN
+                    ALTER TABLE subscription_events ADD COLUMN stripe_customer_id VARCHAR;
+                    ALTER TABLE subscription_events ADD COLUMN payload JSON;
+                    ALTER TABLE subscription_events ADD COLUMN attempts INTEGER DEFAULT 0 NOT NULL;
+                    ALTER TABLE subscription_events ADD COLUMN next_attempt_at TIMESTAMP DEFAULT now() NOT NULL;
+                    ALTER TABLE subscription_events ADD COLUMN coalesced_into VARCHAR;
+                    CREATE INDEX IF NOT EXISTS idx_subscription_events_pending
+                        ON subscription_events(processed, stripe_customer_id, stripe_created);
+                END IF;
+            END $$;
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_assignments_user_status_created ON assignments(user_id, status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_assignments_user_created ON assignments(user_id, created_at);
+            CREATE INDEX IF NOT EXISTS ix_submissions_assignment_id ON submissions(assignment_id);
+            """,
             # --- Invitation Codes and Beta Testers ---
             """
             CREATE TABLE IF NOT EXISTS invitation_codes (
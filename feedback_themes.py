@@ -0,0 +1,173 @@
+# ScoreWise AI - Feedback Theme Mining
+import os
+import re
+import uuid
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import Assignment, FeedbackTheme, Submission, User
+from wordlist import hash_words
+
+logger = logging.getLogger(__name__)
+
+# Phrases whose fingerprints differ in at most this many of 64 bits are the same theme
+THEME_MAX_DISTANCE = int(os.getenv("THEME_MAX_DISTANCE", "10"))
+# Themes kept per scope and kind; the rarest is replaced when full
+MAX_THEMES_PER_SCOPE = int(os.getenv("MAX_THEMES_PER_SCOPE", "500"))
+TOP_THEMES_SHOWN = 3
+KINDS = ("strengths", "areas_for_improvement")
+
+_STOP_WORDS = frozenset("a all an and are as be by for her his in is it its of on or that the their this to very was "
+                        "with your".split())
+_SUFFIXES = ("ing", "ed", "es", "s")
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _normalize(phrase: str) -> str:
+    """Lower-cased content words with common suffixes dropped, so inflections and filler don't matter"""
+    words = []
+    for word in re.findall(r"[a-z0-9]+", phrase.lower()):
+        if word in _STOP_WORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        words.append(word)
+    return " ".join(words)
+
+
+def fingerprint(phrase: str) -> Optional[int]:
+    """64-bit SimHash over the character trigrams of the normalized phrase"""
+    text = _normalize(phrase)
+    if len(text) < 3:
+        return None
+    shingles = list({text[i:i + 3] for i in range(len(text) - 2)})
+    bits = (hash_words(shingles)[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    value = int(np.packbits(majority, bitorder="little").view("<u8")[0])
+    # Stored in a signed BIGINT column
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _distance(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+def _distances(fingerprints: np.ndarray, value: int) -> np.ndarray:
+    """Hamming distance from value to each fingerprint"""
+    xor = (fingerprints ^ np.int64(value)).view(np.uint8).reshape(-1, 8)
+    return _POPCOUNT[xor].sum(axis=1)
+
+
+class FeedbackThemeService:
+    """Near-duplicate feedback phrases counted as themes per scope.
+
+    Scopes are a teacher ("user:<id>") and one of their classes by subject
+    ("class:<id>:<subject>"), so a scope never mixes feedback from
+    different accounts. Counts are updated as results arrive; top themes
+    are an indexed ORDER BY count LIMIT n.
+    """
+
+    def scopes(self, user: User, subject: Optional[str]) -> List[str]:
+        scopes = [f"user:{user.id}"]
+        if subject:
+            scopes.append(f"class:{user.id}:{subject}")
+        return scopes
+
+    def add_phrases(self, db: Session, scope: str, kind: str, phrases: Iterable) -> int:
+        """Count phrases into a scope's themes; the caller commits. Returns how many were counted."""
+        # Merge the batch locally first so each theme is written once
+        batch: Dict[int, List] = {}
+        for phrase in phrases:
+            if not isinstance(phrase, str):
+                continue
+            value = fingerprint(phrase)
+            if value is None:
+                continue
+            for known, entry in batch.items():
+                if _distance(known, value) <= THEME_MAX_DISTANCE:
+                    entry[1] += 1
+                    break
+            else:
+                batch[value] = [phrase.strip(), 1]
+        if not batch:
+            return 0
+
+        themes = db.query(FeedbackTheme).filter(FeedbackTheme.scope == scope, FeedbackTheme.kind == kind).all()
+        fingerprints = np.array([theme.fingerprint for theme in themes], dtype=np.int64)
+        increments: Dict[int, int] = {}
+        created = set()
+        for value, (label, count) in batch.items():
+            index = None
+            if len(fingerprints):
+                distances = _distances(fingerprints, value)
+                closest = int(distances.argmin())
+                if distances[closest] <= THEME_MAX_DISTANCE:
+                    index = closest
+            if index is None and len(themes) < MAX_THEMES_PER_SCOPE:
+                themes.append(FeedbackTheme(id=str(uuid.uuid4()), scope=scope, kind=kind,
+                                            fingerprint=value, label=label, count=0))
+                db.add(themes[-1])
+                fingerprints = np.append(fingerprints, np.int64(value))
+                index = len(themes) - 1
+                created.add(index)
+            elif index is None:
+                # Space-saving: the new theme takes over the rarest one and inherits its count
+                index = min(range(len(themes)), key=lambda i: themes[i].count + increments.get(i, 0))
+                themes[index].fingerprint, themes[index].label = value, label
+                fingerprints[index] = value
+            increments[index] = increments.get(index, 0) + count
+
+        for index, count in increments.items():
+            if index in created:
+                themes[index].count = count
+            else:
+                # Increment in SQL so concurrent workers don't lose counts
+                themes[index].count = FeedbackTheme.count + count
+        return sum(count for _, count in batch.values())
+
+    def record_results(self, db: Session, user: User, subject: Optional[str], results: Dict):
+        """Count one assignment's strengths and improvements into every scope; the caller commits"""
+        phrases = {kind: [] for kind in KINDS}
+        for result in results.get("individual_results") or []:
+            for kind in KINDS:
+                if isinstance(result.get(kind), list):
+                    phrases[kind].extend(result[kind])
+        for scope in self.scopes(user, subject):
+            for kind in KINDS:
+                self.add_phrases(db, scope, kind, phrases[kind])
+
+    def rebuild(self, db: Session, user: User, exclude_assignment_id: Optional[str] = None):
+        """Recount a teacher's own and class scopes from stored submissions; the caller commits"""
+        db.query(FeedbackTheme).filter(
+            (FeedbackTheme.scope == f"user:{user.id}") | FeedbackTheme.scope.like(f"class:{user.id}:%")
+        ).delete(synchronize_session=False)
+
+        rows = db.query(Assignment.subject, Submission.strengths, Submission.areas_for_improvement).join(
+            Assignment).filter(Assignment.user_id == user.id, Assignment.status == "completed")
+        if exclude_assignment_id:
+            rows = rows.filter(Assignment.id != exclude_assignment_id)
+        phrases: Dict[tuple, List] = {}
+        for subject, strengths, improvements in rows.order_by(Assignment.created_at).yield_per(500):
+            for kind, items in zip(KINDS, (strengths, improvements)):
+                if isinstance(items, list):
+                    phrases.setdefault((f"user:{user.id}", kind), []).extend(items)
+                    phrases.setdefault((f"class:{user.id}:{subject}", kind), []).extend(items)
+        for (scope, kind), items in phrases.items():
+            self.add_phrases(db, scope, kind, items)
+        db.flush()
+
+    def top_themes(self, db: Session, scope: str, kind: str, limit: int = TOP_THEMES_SHOWN) -> List[Dict]:
+        themes = db.query(FeedbackTheme.label, FeedbackTheme.count).filter(
+            FeedbackTheme.scope == scope, FeedbackTheme.kind == kind
+        ).order_by(FeedbackTheme.count.desc()).limit(limit)
+        return [{"theme": label, "count": count} for label, count in themes]
+
+
+# Initialize feedback theme service instance
+feedback_themes = FeedbackThemeService()
@@ -4,12 +4,11 @@ import asyncio
 import aiofiles
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Any
 import requests
 from dotenv import load_dotenv
 import PyPDF2
 import io
-import zipfile
 import shutil
 from fpdf import FPDF
 import re
@@ -19,6 +18,13 @@ import fitz  # PyMuPDF for text percentage detection
 from pdf2image import convert_from_path
 from PIL import Image
 import platform
+import threading
+from wordlist import load_word_index
+from text_quality import TextQualityAnalyzer, clean_ocr_text
+from upload_service import extract_submissions_zip
+from report_archive import write_reports_manifest, report_filename
+from blob_store import blob_store, EXTRACTED_TEXT
+from storage import storage
 
 # Configure logging
 import sys
@@ -48,51 +54,161 @@ HANDWRITING_OCR_API_KEY = os.getenv("HANDWRITING_OCR_API_KEY")
 HANDWRITING_OCR_API_URL = os.getenv("HANDWRITING_OCR_API_URL")
 FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
 
-class PDFReport(FPDF):
+# "eager" renders every report during grading, "lazy" renders them on first download
+REPORT_RENDERING = os.getenv("REPORT_RENDERING", "eager").lower()
+
+# Progress hook for grade_assignment: (stage, status, detail)
+StageCallback = Callable[[str, str, Optional[str]], Awaitable[None]]
+
+# Header logo slot (mm) and the resolution the logo is pre-sized to for it
+REPORT_LOGO_SLOT_MM = (25, 15)
+REPORT_LOGO_DPI = int(os.getenv("REPORT_LOGO_DPI", "300"))
+
+
+def prepare_report_logo(source_path: str) -> str:
+    """Pre-size the logo for the header slot and flatten it onto the white page.
+
+    The full-resolution RGBA logo costs ~140 KB (image plus alpha soft mask)
+    in every report. The derived PNG is written next to the source and
+    rebuilt when the source is newer.
+    """
+    target_path = f"{os.path.splitext(source_path)[0]}.report-{REPORT_LOGO_DPI}dpi.png"
+    if os.path.exists(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+        return target_path
+
+    size = tuple(round(mm / 25.4 * REPORT_LOGO_DPI) for mm in REPORT_LOGO_SLOT_MM)
+    with Image.open(source_path) as logo:
+        logo = logo.convert("RGBA").resize(size, Image.LANCZOS)
+    flattened = Image.new("RGB", size, (255, 255, 255))
+    flattened.paste(logo, mask=logo.split()[3])
+
+    # Write to a temp file and swap it in so concurrent workers never read a partial image
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    flattened.save(tmp_path, "PNG", optimize=True)
+    os.replace(tmp_path, target_path)
+    logger.info(f"✓ Pre-sized report logo to {size[0]}x{size[1]} px: {target_path}")
+    return target_path
+
+
+class ReportResources:
+    """Fonts and logo shared by every PDFReport in the process.
+
+    Built once on first use. fpdf mutates font subsets and image object
+    numbers while writing a document, so each report gets its own shallow
+    copies of the shared entries.
+    """
+    _shared = None
+    _lock = threading.Lock()
+
     def __init__(self):
-        super().__init__()
-        self.set_auto_page_break(auto=True, margin=15)
-        # Clear any existing font cache
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.logo_path = os.path.join(base_dir, "static", "scorewise_logo.png")
+        self.use_builtin_fonts = False
         self.fonts = {}
-        self.core_fonts = {}
-        
-        # Logo path - using the existing logo in static folder
-        self.logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "scorewise_logo.png")
-        
-        # Debug path information
-        current_file = os.path.abspath(__file__)
-        fonts_dir = os.path.join(os.path.dirname(current_file), "fonts")
-        static_dir = os.path.join(os.path.dirname(current_file), "static")
-        
-        logger.info(f"Current file: {current_file}")
-        logger.info(f"Fonts directory: {fonts_dir}")
-        logger.info(f"Static directory: {static_dir}")
+        self.font_files = {}
+        self.logo_file = None
+        self.logo = None
+        self.logo_pdf_version = None
+
+        logger.info(f"Fonts directory: {FONTS_DIR}")
         logger.info(f"Logo path: {self.logo_path}")
-        logger.info(f"Logo exists: {os.path.exists(self.logo_path)}")
-        logger.info(f"Fonts directory exists: {os.path.exists(fonts_dir)}")
-        
-        if os.path.exists(fonts_dir):
-            logger.info(f"Font files: {os.listdir(fonts_dir)}")
-        
-        # Register fonts with absolute paths
+
+        prototype = FPDF()
         try:
-            self.add_font('DejaVu', '', os.path.join(fonts_dir, 'DejaVuSans.ttf'), uni=True)
-            self.add_font('DejaVu', 'B', os.path.join(fonts_dir, 'DejaVuSans-Bold.ttf'), uni=True)
-            self.add_font('DejaVu', 'I', os.path.join(fonts_dir, 'DejaVuSans-Oblique.ttf'), uni=True)
-            self.add_font('DejaVu', 'BI', os.path.join(fonts_dir, 'DejaVuSans-BoldOblique.ttf'), uni=True)
+            prototype.add_font('DejaVu', '', os.path.join(FONTS_DIR, 'DejaVuSans.ttf'), uni=True)
+            prototype.add_font('DejaVu', 'B', os.path.join(FONTS_DIR, 'DejaVuSans-Bold.ttf'), uni=True)
+            prototype.add_font('DejaVu', 'I', os.path.join(FONTS_DIR, 'DejaVuSans-Oblique.ttf'), uni=True)
+            prototype.add_font('DejaVu', 'BI', os.path.join(FONTS_DIR, 'DejaVuSans-BoldOblique.ttf'), uni=True)
+            self.fonts = prototype.fonts
+            self.font_files = prototype.font_files
             logger.info("✓ Successfully registered DejaVu fonts")
         except Exception as e:
             logger.error(f"Font registration failed: {str(e)}")
             # Fallback to system fonts if needed
-            self._use_builtin_fonts = True
+            self.use_builtin_fonts = True
+
+        if os.path.exists(self.logo_path):
+            try:
+                self.logo_file = prepare_report_logo(self.logo_path)
+            except Exception as e:
+                logger.warning(f"Could not pre-size logo, embedding it at full resolution: {str(e)}")
+                self.logo_file = self.logo_path
+            try:
+                # Decoding the PNG is the slow part of a report, do it once
+                prototype.add_page()
+                prototype.image(self.logo_file, x=10, y=8, w=25, h=15)
+                self.logo = {k: v for k, v in prototype.images[self.logo_file].items() if k not in ("i", "n")}
+                # An alpha channel raises the document to PDF 1.4 (soft masks)
+                self.logo_pdf_version = prototype.pdf_version
+                logger.info("✓ Loaded report logo")
+            except Exception as e:
+                logger.warning(f"Could not load logo for PDF reports: {str(e)}")
+        else:
+            logger.warning(f"Logo file not found at: {self.logo_path}")
+
+    @classmethod
+    def shared(cls) -> "ReportResources":
+        if cls._shared is None:
+            with cls._lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def install(self, pdf: FPDF):
+        """Register the shared fonts on a new document"""
+        for fontkey, font in self.fonts.items():
+            pdf.fonts[fontkey] = dict(font, subset=list(font['subset']))
+        for name, info in self.font_files.items():
+            pdf.font_files[name] = dict(info)
+        if self.use_builtin_fonts:
+            pdf._use_builtin_fonts = True
+
+
+class PDFReport(FPDF):
+    def __init__(self):
+        super().__init__()
+        self.set_auto_page_break(auto=True, margin=15)
+        # Clear any existing font cache
+        self.fonts = {}
+        self.core_fonts = {}
+        
+        self.resources = ReportResources.shared()
+        self.logo_path = self.resources.logo_path
+        self.resources.install(self)
+        self.fonts_used = set()
         
         self.add_page()
 
+    def set_font(self, family, style='', size=0):
+        super().set_font(family, style, size)
+        self.fonts_used.add(self._current_fontkey())
+
+    def output(self, name='', dest=''):
+        # fpdf subsets and embeds every registered font, selected or not
+        for fontkey in [k for k in self.fonts if k not in self.fonts_used]:
+            del self.fonts[fontkey]
+        return super().output(name, dest)
+
+    def _add_cached_logo(self):
+        """Register the logo parsed once per process, as image() would on first use"""
+        self.images[self.logo_path] = dict(self.resources.logo, i=len(self.images) + 1)
+        if self.pdf_version < self.resources.logo_pdf_version:
+            self.pdf_version = self.resources.logo_pdf_version
+
+    def _current_fontkey(self):
+        for fontkey, font in self.fonts.items():
+            if font is getattr(self, "current_font", None):
+                return fontkey
+        return None
+
     def header(self):
         """Professional header with ScoreWise AI logo and branding"""
         # Check if logo exists and add it
-        if os.path.exists(self.logo_path):
+        if self.resources.logo:
             try:
+                if self.logo_path not in self.images:
+                    self._add_cached_logo()
+                
                 # Add logo to the top-left
                 self.image(self.logo_path, x=10, y=8, w=25, h=15)  # Adjust dimensions as needed
                 
@@ -119,7 +235,6 @@ class PDFReport(FPDF):
                 # Fallback to text-based header
                 self._text_only_header()
         else:
-            logger.warning(f"Logo file not found at: {self.logo_path}")
             self._text_only_header()
         
         # Reset text color to black for content
@@ -209,10 +324,10 @@ def get_poppler_path():
     return None
 
 class ScoreWiseGrader:
-    # Save the word list (one word per line) as english_words.txt in your project directory
+    # Save the word list (one word per line) as words.txt in your project directory.
+    # It is compiled to words.bin on first use and memory-mapped from then on.
     def load_word_set(self, filepath="words.txt"):
-        with open(filepath, "r") as f:
-            return set(word.strip().lower() for word in f if word.strip())
+        return load_word_index(filepath)
 
 
     def __init__(self):
@@ -222,6 +337,7 @@ class ScoreWiseGrader:
         self.handwriting_ocr_url = HANDWRITING_OCR_API_URL
         self.default_rubrics = self._initialize_rubrics()
         self.COMMON_ENGLISH_WORDS = self.load_word_set()
+        self.text_analyzer = TextQualityAnalyzer(self.COMMON_ENGLISH_WORDS)
     
     def _initialize_rubrics(self):
         # Comprehensive rubric system covering all subjects and assessment types
@@ -440,8 +556,9 @@ class ScoreWiseGrader:
                     logger.warning(f"Error extracting text from page: {e}")
 
             text_length = len(sample_text.strip())
-            garbled_ratio = self._calculate_garbled_ratio(sample_text)
-            valid_word_ratio = self._calculate_valid_word_ratio(sample_text)
+            quality = self.text_analyzer.analyze(sample_text)
+            garbled_ratio = quality["garbled_ratio"]
+            valid_word_ratio = quality["valid_word_ratio"]
 
             is_low_coverage = text_percentage < 0.12
             is_garbled = garbled_ratio > 0.2  # Lowered threshold
@@ -466,51 +583,16 @@ class ScoreWiseGrader:
     def _calculate_valid_word_ratio(self, text: str) -> float:
         """
         Returns the ratio of valid English words to total words in the text,
-        using a fast set lookup (cloud-friendly, no dependencies).
+        using a batched lookup against the memory-mapped word index.
         """
-        words = re.findall(r'\b[a-zA-Z]{2,}\b', text)
-        if not words:
-            return 0.0
-        valid = sum(1 for w in words if w.lower() in self.COMMON_ENGLISH_WORDS)
-        return valid / len(words)
+        return self.text_analyzer.analyze(text)["valid_word_ratio"]
 
     def _calculate_garbled_ratio(self, text: str) -> float:
         """
         Calculate ratio of potentially garbled characters in text.
         Returns a value between 0.0 (clean text) and 1.0 (completely garbled).
         """
-        if not text or len(text) < 10:
-            return 1.0  # Very short or empty text should use OCR
-    
-        # Count suspicious patterns that indicate poor OCR
-        garbled_indicators = 0
-        total_chars = max(len(text), 1)  # Avoid division by zero
-    
-        # Look for patterns that indicate garbled text 
-        # Excessive special characters
-        special_char_matches = re.findall(r'[^\w\s\.\,\!\?\-\(\)\'\":;]', text)
-        special_char_ratio = len(special_char_matches) / total_chars
-        garbled_indicators += min(special_char_ratio * 5, 1.0)  # Weight: 5x
-    
-        # Weird character sequences (more than 3 consonants in a row)
-        consonant_clusters = re.findall(r'[bcdfghjklmnpqrstvwxyzBCDFGHJKLMNPQRSTVWXYZ]{4,}', text)
-        consonant_cluster_ratio = len(consonant_clusters) / max(len(text.split()), 1)
-        garbled_indicators += min(consonant_cluster_ratio * 3, 1.0)  # Weight: 3x
-    
-        # Single characters separated by spaces (common OCR error)
-        isolated_chars = re.findall(r'\b[a-zA-Z]\b', text)
-        isolated_ratio = len(isolated_chars) / max(len(text.split()), 1)
-        garbled_indicators += min(isolated_ratio * 2, 1.0)  # Weight: 2x
-    
-        # Unusual character combinations (like w̅, multiple symbols, etc.)
-        unusual_chars = re.findall(r'[\u0300-\u036f\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]', text)
-        unusual_ratio = len(unusual_chars) / total_chars
-        garbled_indicators += min(unusual_ratio * 10, 1.0)  # Weight: 10x
-    
-        # Final garbled ratio (normalized between 0 and 1)
-        final_ratio = min(garbled_indicators / 4, 1.0)  # Divide by number of indicators
-    
-        return final_ratio
+        return self.text_analyzer.analyze(text)["garbled_ratio"]
 
 
 #    async def convert_pdf_to_images(self, file_path: str) -> List[str]:
@@ -680,7 +762,7 @@ class ScoreWiseGrader:
                     return all_text.strip()
                 else:
                     logger.warning("OCR completed but no text was extracted")
-                    return "OCR processing completed but no text was extracted"
+                    return ""
             
             # Handle direct API response format (from your attached files)
             elif 'documents' in result:
@@ -700,7 +782,7 @@ class ScoreWiseGrader:
                     return all_text.strip()
                 else:
                     logger.warning("OCR completed but no text was extracted")
-                    return "OCR processing completed but no text was extracted"
+                    return ""
             else:
                 logger.warning(f"Unexpected OCR result format: {result}")
                 return str(result)
@@ -713,26 +795,13 @@ class ScoreWiseGrader:
         """
         Clean and format OCR content for better AI grader readability.
         """
-        # Remove excessive unicode characters and formatting
-        content = content.replace('\u2081', '1').replace('\u2082', '2')
-        content = content.replace('\u207b', '-').replace('\u2076', '6')
-        content = content.replace('\u2079', '9').replace('\u00b2', '^2')
-        content = content.replace('\u00b5', 'µ')
-        
-        # Add line breaks for better structure
-        content = content.replace('. ', '.\n')
-        content = content.replace('? ', '?\n')
-        content = content.replace(': ', ':\n')
-        
-        # Clean up multiple newlines
-        content = re.sub(r'\n\s*\n', '\n\n', content)
-        
-        return content.strip()
+        return clean_ocr_text(content)
 
-    async def extract_text_with_ocr_fallback(self, file_path: str) -> str:
+    async def extract_text_with_ocr_fallback(self, file_path: str) -> Tuple[str, bool]:
         """
         Extract text from PDF with OCR fallback for handwritten/scanned documents.
         This is the main entry point that decides whether to use standard extraction or OCR.
+        Returns the text and whether it was extracted; on failure the text describes the problem.
         """
         # First, try standard text extraction
         try:
@@ -752,7 +821,7 @@ class ScoreWiseGrader:
             # Check if we got meaningful text using your existing detection logic
             if text_content.strip() and not self.is_handwritten_or_scanned(file_path):
                 logger.info(f"✓ Standard text extraction successful for {os.path.basename(file_path)}")
-                return text_content.strip()
+                return text_content.strip(), True
             else:
                 print(f"⚠️ FALLBACK TO OCR: {os.path.basename(file_path)}")  # Temporary debug
                 logger.info(f"⚠️ Low text quality detected, falling back to OCR for {os.path.basename(file_path)}")
@@ -766,13 +835,13 @@ class ScoreWiseGrader:
         
             if ocr_text.strip():
                 logger.info(f"✓ OCR extraction successful for {os.path.basename(file_path)}")
-                return ocr_text.strip()
+                return ocr_text.strip(), True
             else:
-                return f"OCR processing completed for {os.path.basename(file_path)} but no text was extracted"
+                return f"OCR processing completed for {os.path.basename(file_path)} but no text was extracted", False
             
         except Exception as e:
             logger.error(f"OCR fallback failed: {str(e)}")
-            return f"Error processing {os.path.basename(file_path)}: {str(e)}"
+            return f"Error processing {os.path.basename(file_path)}: {str(e)}", False
     
     def extract_student_name(self, file_path: str) -> str:
         try:
@@ -783,21 +852,44 @@ class ScoreWiseGrader:
         except:
             return "Unknown Student"
 
-    async def extract_text_from_pdf(self, file_path: str) -> str:
+    async def extract_text_from_pdf(self, file_path: str, sha256: Optional[str] = None) -> str:
         """
         Main text extraction method with OCR integration.
+        With the file's SHA-256, the text is cached next to its blob and reused
+        for every later task that uploads the same file.
         """
-        return await self.extract_text_with_ocr_fallback(file_path)
+        cached = blob_store.read_derived(sha256, EXTRACTED_TEXT)
+        if cached is not None:
+            logger.info(f"✓ Reusing extracted text for {os.path.basename(file_path)}")
+            return cached
+        
+        # The upload may have been received by another node
+        await storage.fetch(file_path)
+        text, extracted = await self.extract_text_with_ocr_fallback(file_path)
+        # Failures are reported as text for the grader; only real extractions are cached
+        if extracted:
+            blob_store.write_derived(sha256, EXTRACTED_TEXT, text)
+        return text
 
     async def generate_pdf_report(self, student_name: str, result: dict,
                                  rubric: dict, subject: str,
                                  assessment_type: str, output_path: str):
+        # Rendering is CPU-bound, so it runs in a thread to keep the event loop responsive
+        await asyncio.to_thread(self.render_pdf_report, student_name, result, rubric, subject,
+                                assessment_type, output_path)
+
+    def render_pdf_report(self, student_name: str, result: dict,
+                          rubric: dict, subject: str,
+                          assessment_type: str, output_path: str,
+                          completed_at: Optional[datetime] = None):
+        """Render one student's report (synchronous, safe to run in a worker thread)"""
         try:
             pdf = PDFReport()
+            completed_at = completed_at or datetime.now()
             
             # Student-facing header
             pdf.chapter_title(f"Dear {student_name},")
-            pdf.chapter_body(f"Here is your feedback for the {subject.title()} {assessment_type.replace('_', ' ').title()} assignment completed on {datetime.now().strftime('%B %d, %Y')}.")
+            pdf.chapter_body(f"Here is your feedback for the {subject.title()} {assessment_type.replace('_', ' ').title()} assignment completed on {completed_at.strftime('%B %d, %Y')}.")
             pdf.ln(5)
             
             # Overall score section with enhanced styling
@@ -914,25 +1006,29 @@ class ScoreWiseGrader:
             print(f"✗ Error generating PDF report: {str(e)}")
             raise
 
-    async def create_reports_zip(self, task_dir: Path) -> str:
+    async def prepare_reports_manifest(self, task_dir: Path) -> str:
+        """Fix the layout of the downloadable reports ZIP, which is streamed on request instead of built here"""
         try:
             reports_dir = task_dir / "reports"
             if not reports_dir.exists():
                 logger.warning(f"No reports directory found at {reports_dir}")
                 return ""
             
-            zip_path = task_dir / "all_reports.zip"
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for report_file in reports_dir.glob("*.pdf"):
-                    zipf.write(report_file, report_file.name)
-            
-            logger.info(f"✓ Created reports ZIP: {zip_path}")
-            return str(zip_path)
+            # CRC-32 over every report is file I/O, keep it off the event loop
+            return await asyncio.get_event_loop().run_in_executor(None, write_reports_manifest, reports_dir)
         except Exception as e:
-            logger.error(f"Error creating reports ZIP: {str(e)}")
+            logger.error(f"Error writing reports manifest: {str(e)}")
             return ""
 
-    async def grade_assignment(self, task_data: Dict) -> Dict:
+    async def grade_assignment(self, task_data: Dict, on_stage: Optional[StageCallback] = None) -> Dict:
+        """Grade every submission of a task; on_stage(stage, status, detail) is awaited as work progresses"""
+        async def report_stage(stage: str, status: str, detail: Optional[str] = None):
+            nonlocal current_stage
+            current_stage = stage
+            if on_stage:
+                await on_stage(stage, status, detail)
+
+        current_stage = None
         try:
             task_id = task_data["task_id"]
             subject = task_data["subject"]
@@ -941,27 +1037,33 @@ class ScoreWiseGrader:
 
             logger.info(f"🎯 Starting grading for task {task_id}")
 
-            task_dir = Path(f"uploads/{task_id}")
+            task_dir = storage.root / task_id
             reports_dir = task_dir / "reports"
-            reports_dir.mkdir(exist_ok=True)
+            reports_dir.mkdir(parents=True, exist_ok=True)
 
+            checksums = task_data.get("file_checksums", {})
+
+            await report_stage("prepare", "running")
             assignment_text = ""
             if "assignment" in files:
-                assignment_text = await self.extract_text_from_pdf(files["assignment"])
+                assignment_text = await self.extract_text_from_pdf(
+                    files["assignment"], checksums.get(files["assignment"]))
 
             solution_text = ""
             if "solution" in files:
-                solution_text = await self.extract_text_from_pdf(files["solution"])
+                solution_text = await self.extract_text_from_pdf(
+                    files["solution"], checksums.get(files["solution"]))
 
             # Get appropriate rubric
             rubric = self.get_appropriate_rubric(subject, assessment_type)
 
             submission_results = []
-            submissions = files.get("submissions", [])
+            await report_stage("prepare", "completed")
 
-            for i, submission_path in enumerate(submissions):
+            await report_stage("grade", "running")
+            async for submission_path in self._iter_submissions(files, task_dir):
                 student_name = self.extract_student_name(submission_path)
-                submission_text = await self.extract_text_from_pdf(submission_path)
+                submission_text = await self.extract_text_from_pdf(submission_path, checksums.get(submission_path))
 
                 individual_result = await self.grade_individual_submission(
                     assignment_text=assignment_text,
@@ -972,24 +1074,36 @@ class ScoreWiseGrader:
                     assessment_type=assessment_type
                 )
 
-                individual_result["submission_id"] = i + 1
+                individual_result["submission_id"] = len(submission_results) + 1
                 individual_result["file_path"] = submission_path
                 individual_result["student_name"] = student_name
+                individual_result["report_filename"] = report_filename(student_name)
                 submission_results.append(individual_result)
 
-                report_filename = f"{student_name.replace(' ', '_')}_report.pdf"
-                report_path = reports_dir / report_filename
-
-                await self.generate_pdf_report(
-                    student_name=student_name,
-                    result=individual_result,
-                    rubric=rubric,
-                    subject=subject,
-                    assessment_type=assessment_type,
-                    output_path=str(report_path)
-                )
-
-            zip_path = await self.create_reports_zip(task_dir)
+                # Lazy mode renders reports on first download instead
+                if REPORT_RENDERING != "lazy":
+                    await self.generate_pdf_report(
+                        student_name=student_name,
+                        result=individual_result,
+                        rubric=rubric,
+                        subject=subject,
+                        assessment_type=assessment_type,
+                        output_path=str(reports_dir / individual_result["report_filename"])
+                    )
+                await report_stage("grade", "running", f"{len(submission_results)} submissions graded")
+            await report_stage("grade", "completed", f"{len(submission_results)} submissions graded")
+
+            await report_stage("reports", "running")
+            manifest_path = None
+            if REPORT_RENDERING != "lazy":
+                manifest_path = await self.prepare_reports_manifest(task_dir)
+                # Downloads may be served by another node
+                if manifest_path:
+                    await storage.publish(sorted(reports_dir.glob("*.pdf")) + [manifest_path])
+            # Kept until now so a retried task can extract it again
+            if files.get("submissions_archive"):
+                await storage.delete(files["submissions_archive"])
+            await report_stage("reports", "completed")
             overall_stats = self.calculate_overall_statistics(submission_results)
 
             results = {
@@ -997,10 +1111,11 @@ class ScoreWiseGrader:
                 "subject": subject,
                 "assessment_type": assessment_type,
                 "rubric_used": rubric,
-                "submission_count": len(submissions),
+                "submission_count": len(submission_results),
                 "individual_results": submission_results,
                 "overall_statistics": overall_stats,
-                "reports_zip_path": zip_path,
+                "reports_manifest_path": manifest_path,
+                "reports_mode": "lazy" if REPORT_RENDERING == "lazy" else "eager",
                 "processed_at": datetime.now().isoformat(),
                 "status": "completed"
             }
@@ -1010,6 +1125,8 @@ class ScoreWiseGrader:
 
         except Exception as e:
             logger.error(f"✗ Grading error for {task_data.get('task_id', 'unknown')}: {str(e)}")
+            if current_stage:
+                await report_stage(current_stage, "error", str(e))
             return {
                 "task_id": task_data.get("task_id", "unknown"),
                 "status": "error",
@@ -1017,6 +1134,26 @@ class ScoreWiseGrader:
                 "processed_at": datetime.now().isoformat()
             }
 
+    async def _iter_submissions(self, files: Dict, task_dir: Path) -> AsyncIterator[str]:
+        """Yield submission paths: uploaded files first, then PDFs as they are extracted from a bulk ZIP"""
+        for submission_path in files.get("submissions", []):
+            yield submission_path
+
+        archive_path = files.get("submissions_archive")
+        if archive_path and await self._fetch_optional(archive_path):
+            submissions_dir = task_dir / "submissions"
+            submissions_dir.mkdir(exist_ok=True)
+            async for submission_path in extract_submissions_zip(archive_path, submissions_dir):
+                yield submission_path
+            logger.info(f"✓ Extracted bulk submissions from {archive_path}")
+
+    async def _fetch_optional(self, path: str) -> bool:
+        try:
+            await storage.fetch(path)
+            return True
+        except FileNotFoundError:
+            return False
+
     def get_appropriate_rubric(self, subject: str, assessment_type: str) -> Dict:
         """
         Get the appropriate rubric for a subject and assessment type.
@@ -1229,6 +1366,17 @@ Be encouraging and supportive in your feedback. Address the student directly and
             "grade_distribution": self.calculate_grade_distribution(scores)
         }
     
+    def summarize_results(self, results: Dict) -> Dict:
+        """Compact part of the results for status polls and lists, stored beside the full results"""
+        return {
+            "status": results.get("status", "completed"),
+            "submission_count": results.get("submission_count", len(results.get("individual_results") or [])),
+            "overall_statistics": results.get("overall_statistics") or {},
+            "reports_mode": results.get("reports_mode", "eager"),
+            "processed_at": results.get("processed_at"),
+            "error": results.get("error"),
+        }
+    
     def calculate_grade_distribution(self, scores: List[int]) -> Dict:
         distribution = {"A": 0, "B": 0, "C": 0, "D": 0, "F": 0}
         for score in scores:
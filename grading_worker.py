@@ -0,0 +1,336 @@
+# ScoreWise AI - Grading Task Queue and Worker
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Assignment, GradingTask, GradingTaskStage, User, TIER_CONFIGS
+from grader import grader
+from subscription_service import subscription_service
+from analytics_service import analytics_service
+from dashboard_cache import dashboard_cache
+from usage_writer import usage_writer
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+# Web processes grade uploads themselves unless dedicated workers are deployed
+RUN_GRADING_WORKER = os.getenv("RUN_GRADING_WORKER", "true").lower() == "true"
+GRADING_CONCURRENCY = int(os.getenv("GRADING_CONCURRENCY", "2"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "5"))
+# A task whose worker has not reported progress for this long is handed to another worker
+TASK_LEASE = timedelta(minutes=int(os.getenv("GRADING_TASK_LEASE_MINUTES", "15")))
+MAX_TASK_ATTEMPTS = int(os.getenv("MAX_GRADING_ATTEMPTS", "3"))
+# Claims are renewed this often while a task runs, so one long stage never outlives the lease
+HEARTBEAT_SECONDS = TASK_LEASE.total_seconds() / 3
+
+
+class TaskQueue:
+    """Grading tasks stored in the database and claimed by workers on any node"""
+
+    def enqueue(self, db: Session, user: User, task_spec: Dict) -> GradingTask:
+        features = TIER_CONFIGS.get(user.subscription_tier, {}).get("features", {})
+        task = GradingTask(
+            id=task_spec["task_id"],
+            user_id=user.id,
+            spec=task_spec,
+            priority=1 if features.get("priority_processing") else 0,
+        )
+        db.add(task)
+        dashboard_cache.bump(db, [user.id])
+        db.commit()
+        return task
+
+    def get_spec(self, db: Session, task_id: str) -> Optional[Dict]:
+        spec = db.query(GradingTask.spec).filter(GradingTask.id == task_id).scalar()
+        return dict(spec) if spec else None
+
+    def claim(self, db: Session) -> Optional[Tuple[str, str]]:
+        """Atomically take the next queued task; returns (task_id, claim token) or None"""
+        token = f"{WORKER_ID}/{uuid.uuid4().hex[:8]}"
+        # SKIP LOCKED lets concurrent workers pass over a row another worker is claiming
+        next_task = (
+            select(GradingTask.id)
+            .where(GradingTask.status == "queued")
+            .order_by(GradingTask.priority.desc(), GradingTask.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        task_id = db.execute(
+            update(GradingTask)
+            .where(GradingTask.id == next_task, GradingTask.status == "queued")
+            .values(status="processing", claimed_by=token, heartbeat_at=datetime.now(),
+                    attempts=GradingTask.attempts + 1)
+            .returning(GradingTask.id)
+        ).scalar()
+        db.commit()
+        return (task_id, token) if task_id else None
+
+    def record_stage(self, db: Session, task_id: str, token: str, stage: str, status: str,
+                     detail: Optional[str] = None):
+        """Record a stage's progress; doubles as the claim's heartbeat"""
+        now = datetime.now()
+        row = db.get(GradingTaskStage, (task_id, stage))
+        if row is None:
+            row = GradingTaskStage(task_id=task_id, stage=stage, started_at=now)
+            db.add(row)
+        row.status = status
+        row.detail = detail
+        row.finished_at = now if status in ("completed", "error") else None
+
+        db.execute(update(GradingTask)
+                   .where(GradingTask.id == task_id, GradingTask.claimed_by == token)
+                   .values(heartbeat_at=now))
+        db.commit()
+
+    def heartbeat(self, db: Session, task_id: str, token: str) -> bool:
+        """Renew a claim; False if it was lost to another worker or the task was cancelled"""
+        renewed = db.execute(
+            update(GradingTask)
+            .where(GradingTask.id == task_id, GradingTask.claimed_by == token,
+                   GradingTask.status == "processing")
+            .values(heartbeat_at=datetime.now())
+        ).rowcount
+        db.commit()
+        return bool(renewed)
+
+    def get_stages(self, db: Session, task_id: str) -> List[Dict]:
+        stages = db.query(GradingTaskStage).filter(GradingTaskStage.task_id == task_id).order_by(
+            GradingTaskStage.started_at)
+        return [{
+            "stage": stage.stage,
+            "status": stage.status,
+            "detail": stage.detail,
+            "seconds": round((stage.finished_at - stage.started_at).total_seconds(), 1)
+            if stage.finished_at and stage.started_at else None,
+        } for stage in stages]
+
+    def finish(self, db: Session, task_id: str, token: str, status: str) -> bool:
+        """Mark a claimed task done, committing pending changes (e.g. results) with it.
+
+        Returns False and rolls those changes back if the claim was lost to
+        another worker or the task was cancelled.
+        """
+        finished = db.execute(
+            update(GradingTask)
+            .where(GradingTask.id == task_id, GradingTask.claimed_by == token,
+                   GradingTask.status == "processing")
+            .values(status=status, finished_at=datetime.now())
+        ).rowcount
+        if not finished:
+            db.rollback()
+            return False
+        db.commit()
+        return True
+
+    def cancel(self, db: Session, task_id: str):
+        """Fail a task that has not finished; the caller commits"""
+        db.query(GradingTask).filter(
+            GradingTask.id == task_id, GradingTask.status.in_(("queued", "processing"))
+        ).update({GradingTask.status: "error", GradingTask.finished_at: datetime.now()},
+                 synchronize_session=False)
+
+    def requeue_expired(self, db: Session) -> int:
+        """Hand tasks of workers that stopped reporting back to the queue, or fail them after too many attempts"""
+        expired = (GradingTask.status == "processing") & (GradingTask.heartbeat_at < datetime.now() - TASK_LEASE)
+        failed_ids = db.execute(
+            update(GradingTask)
+            .where(expired, GradingTask.attempts >= MAX_TASK_ATTEMPTS)
+            .values(status="error", finished_at=datetime.now())
+            .returning(GradingTask.id)
+        ).scalars().all()
+        if failed_ids:
+            db.query(Assignment).filter(Assignment.id.in_(failed_ids)).update(
+                {Assignment.status: "error",
+                 Assignment.error_message: f"Grading did not finish after {MAX_TASK_ATTEMPTS} attempts"},
+                synchronize_session=False)
+            dashboard_cache.bump(db, [user_id for (user_id,) in db.query(Assignment.user_id).filter(
+                Assignment.id.in_(failed_ids))])
+
+        requeued = db.execute(
+            update(GradingTask).where(expired).values(status="queued", claimed_by=None)
+        ).rowcount
+        db.commit()
+        if requeued or failed_ids:
+            logger.warning(f"⚠️ Requeued {requeued} stalled grading tasks, failed {len(failed_ids)}")
+        return requeued
+
+    def fail_orphaned(self, db: Session) -> int:
+        """Fail assignments stuck in processing without a task, left by in-process grading before the queue existed"""
+        has_task = select(GradingTask.id).where(GradingTask.id == Assignment.id).exists()
+        # Older than a lease, so uploads still being published are not touched
+        orphaned = db.query(Assignment.id, Assignment.user_id).filter(
+            Assignment.status == "processing", ~has_task,
+            Assignment.created_at < datetime.now() - TASK_LEASE,
+        ).all()
+        if not orphaned:
+            return 0
+        db.query(Assignment).filter(Assignment.id.in_([task_id for task_id, _ in orphaned])).update(
+            {Assignment.status: "error",
+             Assignment.error_message: "Grading was interrupted by a server restart. Please upload the assignment again."},
+            synchronize_session=False)
+        dashboard_cache.bump(db, [user_id for _, user_id in orphaned])
+        db.commit()
+        logger.warning(f"⚠️ Failed {len(orphaned)} assignments left in processing without a grading task")
+        return len(orphaned)
+
+
+class GradingWorker:
+    """Claims queued grading tasks and runs them through the grader"""
+
+    def __init__(self, queue: TaskQueue):
+        self.queue = queue
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def wake(self):
+        """Start on newly queued work now instead of at the next poll"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _keep_claim(self, task_id: str, token: str):
+        """Renew the claim while the task runs; stages alone may be further apart than the lease"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            db = SessionLocal()
+            try:
+                if not self.queue.heartbeat(db, task_id, token):
+                    logger.warning(f"⚠️ Lost the claim on {task_id}")
+                    return
+            except Exception as e:
+                logger.error(f"✗ Could not renew the claim on {task_id}: {str(e)}")
+            finally:
+                db.close()
+
+    async def process(self, task_id: str, token: str):
+        db = SessionLocal()
+        keep_claim = asyncio.create_task(self._keep_claim(task_id, token))
+        try:
+            task_data = self.queue.get_spec(db, task_id)
+            assignment = db.query(Assignment).filter(Assignment.id == task_id).first()
+            if not task_data or not assignment:
+                self.queue.finish(db, task_id, token, "error")
+                return
+
+            assignment.status = "processing"
+            db.commit()
+
+            async def on_stage(stage: str, status: str, detail: Optional[str] = None):
+                self.queue.record_stage(db, task_id, token, stage, status, detail)
+
+            started = time.monotonic()
+            results = await grader.grade_assignment(task_data, on_stage=on_stage)
+
+            assignment.status = results.get("status", "completed")
+            assignment.results = results
+            assignment.processing_time_seconds = round(time.monotonic() - started, 1)
+            assignment.summary = {
+                **grader.summarize_results(results),
+                "processing_time_seconds": assignment.processing_time_seconds,
+                "stage_seconds": {stage["stage"]: stage["seconds"] for stage in self.queue.get_stages(db, task_id)},
+            }
+            assignment.reports_manifest_path = results.get("reports_manifest_path")
+            assignment.completed_at = datetime.now()
+            if results.get("status") == "error":
+                assignment.error_message = results.get("error", "Unknown error")
+            else:
+                analytics_service.record_completed(db, assignment, results)
+            dashboard_cache.bump(db, [assignment.user_id])
+            if not self.queue.finish(db, task_id, token, assignment.status):
+                logger.warning(f"⚠️ Lost the claim on {task_id}, discarding results")
+                return
+
+            user = db.query(User).filter(User.id == assignment.user_id).first()
+            if user:
+                subscription_service.record_usage(
+                    user, "assignment_completed", db,
+                    resource_used=task_id,
+                    metadata={"submissions_count": assignment.submissions_count}
+                )
+
+        except Exception as e:
+            logger.error(f"✗ Grading task {task_id} failed: {str(e)}")
+            try:
+                db.rollback()
+                db.query(Assignment).filter(Assignment.id == task_id).update(
+                    {Assignment.status: "error", Assignment.error_message: str(e)},
+                    synchronize_session=False)
+                dashboard_cache.bump(db, [user_id for (user_id,) in db.query(Assignment.user_id).filter(
+                    Assignment.id == task_id)])
+                self.queue.finish(db, task_id, token, "error")
+            except Exception as mark_error:
+                logger.error(f"✗ Could not mark grading task {task_id} as failed: {str(mark_error)}")
+        finally:
+            keep_claim.cancel()
+            db.close()
+
+    async def run_once(self) -> int:
+        """Process queued tasks until the queue is empty; returns how many were processed"""
+        processed = 0
+        while True:
+            db = SessionLocal()
+            try:
+                claimed = self.queue.claim(db)
+            finally:
+                db.close()
+            if not claimed:
+                return processed
+            await self.process(*claimed)
+            processed += 1
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"✗ Grading worker error: {str(e)}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=WORKER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reaper(self):
+        db = SessionLocal()
+        try:
+            self.queue.fail_orphaned(db)
+        except Exception as e:
+            logger.error(f"✗ Could not fail orphaned assignments: {str(e)}")
+        finally:
+            db.close()
+        while True:
+            db = SessionLocal()
+            try:
+                self.queue.requeue_expired(db)
+            except Exception as e:
+                logger.error(f"✗ Could not requeue stalled grading tasks: {str(e)}")
+            finally:
+                db.close()
+            await asyncio.sleep(TASK_LEASE.total_seconds() / 3)
+
+    async def run_forever(self, concurrency: int = GRADING_CONCURRENCY):
+        self._wakeup = asyncio.Event()
+        logger.info(f"✓ Grading worker {WORKER_ID} started ({concurrency} concurrent tasks)")
+        await asyncio.gather(self._reaper(), *(self._loop() for _ in range(concurrency)))
+
+
+# Initialize task queue and worker instances
+task_queue = TaskQueue()
+grading_worker = GradingWorker(task_queue)
+
+
+if __name__ == "__main__":
+    # Dedicated worker node: python grading_worker.py
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(grading_worker.run_forever())
+    finally:
+        usage_writer.close()
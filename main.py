@@ -4,26 +4,44 @@ import json
 import uuid
 import asyncio
 import shutil
+import zipfile
 from datetime import datetime, timedelta
 from pathlib import Path
+from urllib.parse import quote
 from typing import Optional, List, Dict, Union, Any
-from collections import Counter
-import aiofiles
 import hashlib
-from fastapi import FastAPI, Request, Response, HTTPException, Depends, Form, File, UploadFile, BackgroundTasks, Header
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, FileResponse
+import hmac
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, Form, File, UploadFile, Header
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.background import BackgroundTask
 import stripe
 import uvicorn
-from sqlalchemy.orm import Session
-import numpy as np
+from sqlalchemy.orm import Session, load_only
 from db import SessionLocal, get_db, create_tables, migrate_database
-from models import User, Assignment, SubscriptionTier, SubscriptionStatus, TIER_CONFIGS
+from models import User, Assignment, Submission, SubscriptionTier, SubscriptionStatus, TIER_CONFIGS
 from subscription_service import subscription_service
 from grader import grader
+from upload_service import (
+    UploadBudget, UploadLimitExceeded, save_upload_file, save_upload_files, inspect_submissions_zip,
+    MAX_UPLOAD_REQUEST_BYTES
+)
+from report_archive import ReportsArchive, load_reports_manifest, read_reports_manifest, iter_segments, parse_range_header
+from report_cache import report_cache
+from blob_store import blob_store
+from storage import storage
+from retention_service import retention_service, STORAGE_GC_ENABLED
+from grading_worker import task_queue, grading_worker, RUN_GRADING_WORKER
+from analytics_service import analytics_service
+from feedback_themes import feedback_themes, KINDS as FEEDBACK_KINDS
+from dashboard_cache import dashboard_cache, etag_matches, CACHE_CONTROL
+from price_catalog import price_catalog
+from billing_outbox import billing_dispatcher, RUN_BILLING_DISPATCHER
+from webhook_processor import webhook_processor, RUN_WEBHOOK_PROCESSOR
+from usage_writer import usage_writer
 from datetime import datetime
 
 # Environment variables
@@ -48,6 +66,21 @@ PRICE_ID_EDUCATOR_ANNUAL = os.getenv("PRICE_ID_EDUCATOR_ANNUAL")
 PRICE_ID_PROFESSIONAL_ANNUAL = os.getenv("PRICE_ID_PROFESSIONAL_ANNUAL")
 PRICE_ID_INSTITUTION_ANNUAL = os.getenv("PRICE_ID_INSTITUTION_ANNUAL")
 
+PRICE_IDS = {
+    "educator": {
+        "monthly": PRICE_ID_EDUCATOR_MONTHLY,
+        "annual": PRICE_ID_EDUCATOR_ANNUAL
+    },
+    "professional": {
+        "monthly": PRICE_ID_PROFESSIONAL_MONTHLY,
+        "annual": PRICE_ID_PROFESSIONAL_ANNUAL
+    },
+    "institution": {
+        "monthly": PRICE_ID_INSTITUTION_MONTHLY,
+        "annual": PRICE_ID_INSTITUTION_ANNUAL
+    }
+}
+
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
@@ -55,6 +88,8 @@ STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
+# Bearer token Prometheus sends to scrape /metrics; the endpoint is disabled without it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 TIER_CONFIGS["educator"]["stripe_price_id_monthly"] = PRICE_ID_EDUCATOR_MONTHLY
 TIER_CONFIGS["educator"]["stripe_price_id_annual"] = PRICE_ID_EDUCATOR_ANNUAL
 TIER_CONFIGS["professional"]["stripe_price_id_monthly"] = PRICE_ID_PROFESSIONAL_MONTHLY
@@ -66,7 +101,7 @@ TIER_CONFIGS["institution"]["stripe_price_id_annual"] = PRICE_ID_INSTITUTION_ANN
 stripe.api_key = STRIPE_SECRET_KEY
 
 # Create directories
-os.makedirs("uploads", exist_ok=True)
+os.makedirs(storage.root, exist_ok=True)
 os.makedirs("static", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
 
@@ -83,6 +118,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads whose declared body is over the request limit before the body is parsed"""
+    if request.method == "POST" and request.url.path.startswith("/api/upload"):
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_REQUEST_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload is larger than the {MAX_UPLOAD_REQUEST_BYTES // (1024 * 1024)} MB per-request limit"}
+            )
+    return await call_next(request)
+
 # Static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -108,10 +155,21 @@ def get_current_user(request: Request, db: Session = None) -> Optional[User]:
     if not session_user or not db:
         return None
     
-    # Get fresh user data from database
+    # Get fresh user data from database; the checks later in the request read its entitlement snapshot
     user = db.query(User).filter(User.id == session_user.get("id")).first()
+    if not user:
+        subscription_service.invalidate_entitlements(session_user.get("id"))
+        return None
+    subscription_service.entitlements_for(user)
     return user
 
+def get_current_entitlements(request: Request, db: Session = None) -> Optional[Dict[str, Any]]:
+    """Cached entitlement snapshot of the session user, for read-only polling endpoints that don't need the User row"""
+    session_user = request.session.get("user")
+    if not session_user or not db:
+        return None
+    return subscription_service.get_entitlements(session_user.get("id"), db)
+
 def require_auth(request: Request, db: Session = Depends(get_db)):
     """Require authentication and return user or redirect"""
     user = get_current_user(request, db)
@@ -121,35 +179,16 @@ def require_auth(request: Request, db: Session = Depends(get_db)):
 
 def has_active_subscription(user: User) -> bool:
     """Check if user has an active subscription or valid trial"""
-    if user.subscription_status in ["active", "trialing"]:
+    entitlements = subscription_service.entitlements_for(user)
+    if entitlements["status"] in ["active", "trialing"]:
         return True
     
     # Check if trial is still valid
-    if user.subscription_tier == SubscriptionTier.TRIAL.value and user.trial_end:
-        return datetime.now() < user.trial_end
+    if entitlements["tier"] == SubscriptionTier.TRIAL.value and entitlements["trial_end"]:
+        return datetime.now() < entitlements["trial_end"]
     
     return False
 
-async def save_task_metadata(task_id: str, task_data: Dict):
-    """Save task metadata to file"""
-    try:
-        task_dir = Path(f"uploads/{task_id}")
-        task_dir.mkdir(exist_ok=True)
-        async with aiofiles.open(task_dir / "metadata.json", "w") as f:
-            await f.write(json.dumps(task_data, default=str))
-    except Exception as e:
-        print(f"Error saving task metadata: {str(e)}")
-        raise
-
-async def load_task_metadata(task_id: str) -> Optional[Dict]:
-    """Load task metadata from file"""
-    try:
-        async with aiofiles.open(f"uploads/{task_id}/metadata.json", "r") as f:
-            content = await f.read()
-            return json.loads(content)
-    except:
-        return None
-
 # Initialize database
 @app.on_event("startup")
 async def startup_event():
@@ -159,6 +198,21 @@ async def startup_event():
         create_tables()
     except Exception as e:
         print(f"Database initialization error: {str(e)}")
+    
+    if STORAGE_GC_ENABLED:
+        asyncio.create_task(retention_service.run_forever())
+    if RUN_GRADING_WORKER:
+        asyncio.create_task(grading_worker.run_forever())
+    if RUN_BILLING_DISPATCHER:
+        asyncio.create_task(billing_dispatcher.run_forever())
+    if RUN_WEBHOOK_PROCESSOR:
+        asyncio.create_task(webhook_processor.run_forever())
+    await price_catalog.start(PRICE_IDS)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write buffered usage events before the process exits"""
+    usage_writer.close()
 
 # Routes
 @app.get("/", response_class=HTMLResponse)
@@ -178,39 +232,10 @@ async def pricing(request: Request, db: Session = Depends(get_db)):
     # Get usage summary if user is logged in
     usage_summary = None
     if user:
-        usage_summary = subscription_service.get_usage_summary(user, db)
-
-    # Fetch Stripe prices dynamically for both monthly and annual
-    PRICE_IDS = {
-        "educator": {
-            "monthly": PRICE_ID_EDUCATOR_MONTHLY,
-            "annual": PRICE_ID_EDUCATOR_ANNUAL
-        },
-        "professional": {
-            "monthly": PRICE_ID_PROFESSIONAL_MONTHLY,
-            "annual": PRICE_ID_PROFESSIONAL_ANNUAL
-        },
-        "institution": {
-            "monthly": PRICE_ID_INSTITUTION_MONTHLY,
-            "annual": PRICE_ID_INSTITUTION_ANNUAL
-        }
-    }
-    stripe_prices = {}
-    for plan, periods in PRICE_IDS.items():
-        stripe_prices[plan] = {}
-        for period, price_id in periods.items():
-            if price_id:
-                price_obj = stripe.Price.retrieve(price_id)
-                amount = price_obj["unit_amount"] / 100
-                currency = price_obj["currency"].upper()
-                interval = price_obj["recurring"]["interval"] if price_obj.get("recurring") else "once"
-                stripe_prices[plan][period] = {
-                    "amount": f"{amount:.2f}",
-                    "currency": currency,
-                    "interval": interval
-                }
-            else:
-                stripe_prices[plan][period] = None
+        usage_summary = get_cached_usage_summary(user, db)
+
+    # Monthly and annual Stripe prices, kept in memory by the price catalog
+    stripe_prices = price_catalog.prices()
 
     # Inject overage prices so Jinja can render them
     overage_prices = {
@@ -240,7 +265,7 @@ async def upload_page(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/pricing?expired=true", status_code=303)
     
     # Get user's tier configuration and usage
-    usage_summary = subscription_service.get_usage_summary(user, db)
+    usage_summary = get_cached_usage_summary(user, db)
     allowed_subjects = subscription_service.get_allowed_subjects(user)
     
     return templates.TemplateResponse("uploadfile.html", {
@@ -252,6 +277,70 @@ async def upload_page(request: Request, db: Session = Depends(get_db)):
         "valid_assessment_types": VALID_ASSESSMENT_TYPES
     })
 
+ASSIGNMENT_HISTORY_PAGE_SIZE = 10
+
+def get_assignment_history(db: Session, user_id: str, before: Optional[str] = None,
+                           limit: int = ASSIGNMENT_HISTORY_PAGE_SIZE):
+    """One page of a user's assignments, newest first; returns (assignments, next cursor or None).
+
+    Keyset pagination on (created_at, id) served by idx_assignments_user_created,
+    so older pages cost the same as the first. Results JSON is not loaded.
+    """
+    query = db.query(Assignment).options(load_only(
+        Assignment.id, Assignment.subject, Assignment.assessment_type, Assignment.status,
+        Assignment.submissions_count, Assignment.created_at, Assignment.completed_at,
+        Assignment.error_message,
+    )).filter(Assignment.user_id == user_id)
+
+    if before:
+        try:
+            created_at, assignment_id = before.split("|", 1)
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(
+            (Assignment.created_at < created_at)
+            | ((Assignment.created_at == created_at) & (Assignment.id < assignment_id))
+        )
+
+    page = query.order_by(Assignment.created_at.desc(), Assignment.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = f"{page[-1].created_at.isoformat()}|{page[-1].id}"
+    return page, next_cursor
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 response when the client's cached copy is still current"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+def get_dashboard_analytics(user: User, db: Session) -> Dict[str, Any]:
+    """Dashboard analytics the user's tier includes, cached until their data changes"""
+    tier = (user.subscription_tier or "").lower()
+    show_basic_analytics = tier in ["educator", "professional", "institution"]
+    show_advanced_analytics = tier in ["professional", "institution"]
+
+    # Aggregates are maintained as assignments complete, so this reads one row
+    basic_analytics = advanced_analytics = None
+    if show_basic_analytics:
+        basic_analytics, advanced_analytics = dashboard_cache.get_or_compute(
+            user, "analytics", lambda: analytics_service.get_dashboard_analytics(db, user.id))
+    if not show_advanced_analytics:
+        advanced_analytics = None
+
+    return {
+        "basic_analytics": basic_analytics,
+        "advanced_analytics": advanced_analytics,
+        "show_basic_analytics": show_basic_analytics,
+        "show_advanced_analytics": show_advanced_analytics,
+    }
+
+def get_cached_usage_summary(user: User, db: Session) -> Dict[str, Any]:
+    return dashboard_cache.get_or_compute(
+        user, "usage_summary", lambda: subscription_service.get_usage_summary(user, db))
+
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, db: Session = Depends(get_db)):
     user = require_auth(request, db)
@@ -261,194 +350,132 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
     if not has_active_subscription(user):
         return RedirectResponse(url="/pricing?expired=true", status_code=303)
 
-    # Get user's recent assignments
-    recent_assignments = db.query(Assignment).filter(
-        Assignment.user_id == user.id
-    ).order_by(Assignment.created_at.desc()).limit(10).all()
-
-    usage_summary = subscription_service.get_usage_summary(user, db)
-
-    # Only completed assignments with results
-    completed_assignments = [a for a in recent_assignments if a.status == "completed" and a.results]
-    all_stats = [a.results.get("overall_statistics") for a in completed_assignments if a.results.get("overall_statistics")]
-    all_individual = []
-    for a in completed_assignments:
-        if a.results.get("individual_results"):
-            for r in a.results["individual_results"]:
-                all_individual.append({
-                    "assignment_id": a.id,
-                    "score": r.get("overall_score"),
-                    "rubric_scores": r.get("rubric_scores", {}),
-                    "student_name": r.get("student_name", "Student"),
-                    "date": a.created_at.strftime("%Y-%m-%d"),
-                })
-
-    # Basic analytics
-    def aggregate_basic_stats(stats_list):
-        if not stats_list:
-            return None
-        scores = [s.get("average_score", 0) for s in stats_list if s]
-        total_assignments = len(stats_list)
-        grade_dist = {"A": 0, "B": 0, "C": 0, "D": 0, "F": 0}
-        for s in stats_list:
-            for k in grade_dist:
-                grade_dist[k] += s.get("grade_distribution", {}).get(k, 0)
-        return {
-            "average_score": round(sum(scores) / len(scores), 1) if scores else None,
-            "total_assignments": total_assignments,
-            "grade_distribution": grade_dist,
-        }
+    etag = dashboard_cache.etag(user, "dashboard")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
 
-    # Advanced analytics
-    def aggregate_advanced_stats(stats_list, completed_assignments):
-        if not completed_assignments:
-            print("DEBUG - No completed assignments for analytics")
-            return None
-
-        # Calculate all_individual from completed_assignments
-        all_individual = []
-        for a in completed_assignments:
-            if a.results and a.results.get("individual_results"):
-                for r in a.results["individual_results"]:
-                    all_individual.append({
-                        "assignment_id": a.id,
-                        "score": r.get("overall_score"),
-                        "rubric_scores": r.get("rubric_scores", {}),
-                        "student_name": r.get("student_name", "Student"),
-                        "date": a.created_at.strftime("%Y-%m-%d"),
-                        "strengths": r.get("strengths", []),
-                        "areas_for_improvement": r.get("areas_for_improvement", [])
-                    })
-    
-        if not all_individual:
-            print("DEBUG - No individual results found for analytics")
-            return None
-
-        scores = [s.get("average_score", 0) for s in stats_list if s]
-        highest = max([s.get("highest_score", 0) for s in stats_list if s], default=None)
-        lowest = min([s.get("lowest_score", 0) for s in stats_list if s], default=None)
-        total_submissions = sum([s.get("total_submissions", 0) for s in stats_list if s])
-
-        # Score distribution for histogram
-        all_scores = [r["score"] for r in all_individual if r["score"] is not None]
-        # Assignment dates for trend chart
-        assignment_dates = [r["date"] for r in all_individual if r["date"]]
-        # Rubric radar: average per criterion
-        rubric_totals = {}
-        rubric_counts = {}
-        for r in all_individual:
-            for criterion, val in r["rubric_scores"].items():
-                rubric_totals[criterion] = rubric_totals.get(criterion, 0) + val
-                rubric_counts[criterion] = rubric_counts.get(criterion, 0) + 1
-        rubric_averages = {k: round(rubric_totals[k]/rubric_counts[k], 1) for k in rubric_totals}
-
-        # AI feedback highlights
-        all_strengths = []
-        all_improvements = []
-    
-        # Get individual results from assignments and extract feedback
-        for assignment in completed_assignments:  # This should be passed as parameter
-            if assignment.results and assignment.results.get("individual_results"):
-                for individual_result in assignment.results["individual_results"]:
-                    # Extract strengths and improvements from individual results
-                    strengths = individual_result.get("strengths", [])
-                    improvements = individual_result.get("areas_for_improvement", [])
-                
-                    if isinstance(strengths, list):
-                        all_strengths.extend(strengths)
-                    if isinstance(improvements, list):
-                        all_improvements.extend(improvements)
-
-        # Get top 3 most common
-        top_strengths = [s for s, _ in Counter(all_strengths).most_common(3)] if all_strengths else []
-        top_improvements = [s for s, _ in Counter(all_improvements).most_common(3)] if all_improvements else []
-
-        # Predictive analytics: forecast next score using linear regression
-        if len(assignment_dates) >= 2:
-            try:
-                # Convert dates to ordinal for regression
-                dates_ord = [datetime.strptime(d, "%Y-%m-%d").toordinal() for d in assignment_dates]
-                scores_np = np.array(all_scores)
-                dates_np = np.array(dates_ord)
-        
-                # Fit a simple linear trend with error handling
-                with np.warnings.catch_warnings():
-                    np.warnings.simplefilter("ignore")
-                    coef = np.polyfit(dates_np, scores_np, 1)
-                    next_date = max(dates_np) + 7 # Predict one week after last assignment
-                    predicted_score = int(np.polyval(coef, next_date))
-            except Exception:
-                predicted_score = None
-        else:
-            predicted_score = None
-
-        return {
-            "highest_score": highest,
-            "lowest_score": lowest,
-            "total_submissions": total_submissions,
-            "score_distribution": all_scores,
-            "assignment_dates": assignment_dates,
-            "rubric_averages": rubric_averages,
-            "top_strengths": top_strengths,
-            "top_improvements": top_improvements,
-            "predicted_score": predicted_score,
-        }
+    # Get user's recent assignments; older ones are loaded from /api/assignments
+    recent_assignments, next_cursor = get_assignment_history(db, user.id)
 
-    tier = (user.subscription_tier or "").lower()
-    show_basic_analytics = tier in ["educator", "professional", "institution"]
-    show_advanced_analytics = tier in ["professional", "institution"]
+    usage_summary = get_cached_usage_summary(user, db)
 
-    basic_analytics = aggregate_basic_stats(all_stats) if show_basic_analytics else None
-    advanced_analytics = aggregate_advanced_stats(all_stats, completed_assignments) if show_advanced_analytics else None
-
-    # Debug output - add this temporarily
-    print(f"DEBUG - User tier: {user.subscription_tier}")
-    print(f"DEBUG - Show advanced analytics: {show_advanced_analytics}")
-    print(f"DEBUG - Completed assignments count: {len(completed_assignments)}")
-    print(f"DEBUG - Advanced analytics: {advanced_analytics}")
-    print(f"DEBUG - Recent assignments count: {len(recent_assignments)}")
-    print(f"DEBUG - Completed assignments with results: {len([a for a in recent_assignments if a.status == 'completed' and a.results])}")
-    print(f"DEBUG - All stats length: {len(all_stats)}")
-    print(f"DEBUG - Sample assignment statuses: {[(a.id[:8], a.status, bool(a.results)) for a in recent_assignments[:3]]}")
-
-    if completed_assignments:
-        sample = completed_assignments[0]
-        print(f"DEBUG - Sample assignment results structure: {list(sample.results.keys()) if sample.results else 'No results'}")
-        if sample.results and sample.results.get('individual_results'):
-            individual_sample = sample.results['individual_results'][0] if sample.results['individual_results'] else {}
-            print(f"DEBUG - Sample individual result keys: {list(individual_sample.keys())}")
-            print(f"DEBUG - Has strengths/improvements: {bool(individual_sample.get('strengths'))}/{bool(individual_sample.get('areas_for_improvement'))}")
-
-    if advanced_analytics:
-        print(f"DEBUG - Top strengths: {advanced_analytics.get('top_strengths', [])}")
-        print(f"DEBUG - Top improvements: {advanced_analytics.get('top_improvements', [])}")
-
-    return templates.TemplateResponse("dashboard.html", {
+    response = templates.TemplateResponse("dashboard.html", {
         "request": request,
         "user": user,
         "assignments": recent_assignments,
+        "next_cursor": next_cursor,
         "usage_summary": usage_summary,
         "tier_configs": TIER_CONFIGS,
-        "basic_analytics": basic_analytics,
-        "advanced_analytics": advanced_analytics,
-        "show_basic_analytics": show_basic_analytics,
-        "show_advanced_analytics": show_advanced_analytics,
+        **get_dashboard_analytics(user, db),
     })
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
 
-@app.get("/api/dashboard-status")
-async def dashboard_status(
+@app.get("/api/analytics/dashboard")
+async def dashboard_analytics(request: Request, db: Session = Depends(get_db)):
+    """Dashboard chart data; revalidated with the same per-user ETag as the page"""
+    user = require_auth(request, db)
+    if isinstance(user, RedirectResponse):
+        raise HTTPException(status_code=401, detail="Auth required")
+
+    etag = dashboard_cache.etag(user, "analytics")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    analytics = get_dashboard_analytics(user, db)
+    return JSONResponse({
+        "basic": analytics["basic_analytics"],
+        "advanced": analytics["advanced_analytics"],
+    }, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+@app.get("/api/assignments")
+async def assignment_history(
+    request: Request,
+    before: Optional[str] = None,
+    limit: int = ASSIGNMENT_HISTORY_PAGE_SIZE,
+    db: Session = Depends(get_db)
+):
+    """Paginated assignment history; htmx requests get the dashboard list rows"""
+    entitlements = get_current_entitlements(request, db)
+    if not entitlements:
+        raise HTTPException(status_code=401, detail="Auth required")
+
+    assignments, next_cursor = get_assignment_history(db, entitlements["user_id"], before, max(1, min(limit, 100)))
+
+    if request.headers.get("HX-Request"):
+        return templates.TemplateResponse("_assignment_rows.html", {
+            "request": request,
+            "assignments": assignments,
+            "next_cursor": next_cursor,
+        })
+
+    return {
+        "items": [{
+            "id": assignment.id,
+            "subject": assignment.subject,
+            "assessment_type": assignment.assessment_type,
+            "status": assignment.status,
+            "submissions_count": assignment.submissions_count,
+            "created_at": assignment.created_at.isoformat(),
+            "completed_at": assignment.completed_at.isoformat() if assignment.completed_at else None,
+            "error_message": assignment.error_message,
+            "download_url": f"/api/download-reports/{assignment.id}" if assignment.status == "completed" else None,
+        } for assignment in assignments],
+        "next_cursor": next_cursor,
+    }
+
+@app.get("/api/analytics/trends")
+async def analytics_trends(request: Request, student: Optional[str] = None, db: Session = Depends(get_db)):
+    """Per-student and per-criterion score trends (advanced analytics tiers)"""
+    entitlements = get_current_entitlements(request, db)
+    if not entitlements:
+        raise HTTPException(status_code=401, detail="Auth required")
+    if (entitlements["tier"] or "").lower() not in ["professional", "institution"]:
+        raise HTTPException(status_code=403, detail="Score trends require a Professional or Institution plan")
+
+    return analytics_service.student_trends(db, entitlements["user_id"], student)
+
+@app.get("/api/analytics/themes")
+async def analytics_themes(
     request: Request,
+    scope: str = "user",
+    subject: Optional[str] = None,
+    limit: int = 10,
     db: Session = Depends(get_db)
 ):
+    """Most common feedback themes for the teacher or one of their classes (subject)"""
     user = require_auth(request, db)
     if isinstance(user, RedirectResponse):
         raise HTTPException(status_code=401, detail="Auth required")
+    if (user.subscription_tier or "").lower() not in ["professional", "institution"]:
+        raise HTTPException(status_code=403, detail="Feedback themes require a Professional or Institution plan")
+
+    scopes = {name.split(":", 1)[0]: name for name in feedback_themes.scopes(user, subject)}
+    if scope == "class" and not subject:
+        raise HTTPException(status_code=400, detail="subject is required for class themes")
+    if scope not in scopes:
+        raise HTTPException(status_code=400, detail=f"Unavailable theme scope: {scope}")
+
+    limit = max(1, min(limit, 50))
+    return {kind: feedback_themes.top_themes(db, scopes[scope], kind, limit) for kind in FEEDBACK_KINDS}
+
+@app.get("/api/dashboard-status")
+async def dashboard_status(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    entitlements = get_current_entitlements(request, db)
+    if not entitlements:
+        raise HTTPException(status_code=401, detail="Auth required")
 
     # refresh any possibly cached rows
     db.expire_all()           # ← forces the next query to hit the DB
 
     processing = db.query(Assignment).filter(
-        Assignment.user_id == user.id,
+        Assignment.user_id == entitlements["user_id"],
         Assignment.status == "processing"
     ).count()
 
@@ -457,10 +484,60 @@ async def dashboard_status(
         "total_processing": processing,
     }
 
+def check_upload_allowed(user: User, subject: str, assessment_type: str, db: Session):
+    """Subscription, quota and input checks shared by the upload endpoints"""
+    if not has_active_subscription(user):
+        raise HTTPException(status_code=402, detail="Active subscription required")
+    
+    # Check if user can create assignment
+    can_create, message = subscription_service.can_create_assignment(user, db)
+    if not can_create:
+        raise HTTPException(status_code=402, detail=message)
+    
+    # Check subject access
+    can_use_subject, subject_message = subscription_service.can_use_subject(user, subject)
+    if not can_use_subject:
+        raise HTTPException(status_code=403, detail=subject_message)
+    
+    # Validate input
+    if subject not in VALID_SUBJECTS:
+        raise HTTPException(status_code=400, detail=f"Invalid subject. Must be one of: {', '.join(VALID_SUBJECTS)}")
+    
+    if assessment_type not in VALID_ASSESSMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid assessment type. Must be one of: {', '.join(VALID_ASSESSMENT_TYPES)}")
+
+async def reserve_upload(user: User, db: Session, task_dir: Path, adopted_checksums: Dict[str, str]):
+    """Count the upload against the monthly limit in the transaction that creates its assignment.
+
+    Runs before the files are published, so a refused upload never reaches shared storage.
+    """
+    reserved, message = subscription_service.reserve_assignment(user, db)
+    if not reserved:
+        # Another upload took the last slot since check_upload_allowed
+        db.rollback()
+        blob_store.release_files(db, adopted_checksums)
+        await storage.delete_dir(task_dir)
+        raise HTTPException(status_code=402, detail=message)
+
+async def publish_upload(db: Session, assignment: Assignment, task_dir: Path,
+                         file_checksums: Dict[str, str], adopted_checksums: Dict[str, str]):
+    """Make a counted upload's files visible to every node; if that fails the assignment is marked as an error"""
+    try:
+        await storage.publish(file_checksums)
+    except Exception as e:
+        # Marked purged so retention doesn't release the blobs a second time
+        assignment.status = "error"
+        assignment.error_message = f"Upload could not be stored: {str(e)}"
+        assignment.files_purged_at = datetime.now()
+        dashboard_cache.bump(db, [assignment.user_id])
+        db.commit()
+        blob_store.release_files(db, adopted_checksums)
+        await storage.delete_dir(task_dir)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
 @app.post("/api/upload")
 async def upload_files(
     request: Request,
-    background_tasks: BackgroundTasks,
     subject: str = Form(...),
     assessment_type: str = Form(...),
     assignment_file: UploadFile = File(...),
@@ -474,18 +551,7 @@ async def upload_files(
         if isinstance(user, RedirectResponse):
             raise HTTPException(status_code=401, detail="Authentication required")
         
-        if not has_active_subscription(user):
-            raise HTTPException(status_code=402, detail="Active subscription required")
-        
-        # Check if user can create assignment
-        can_create, message = subscription_service.can_create_assignment(user, db)
-        if not can_create:
-            raise HTTPException(status_code=402, detail=message)
-        
-        # Check subject access
-        can_use_subject, subject_message = subscription_service.can_use_subject(user, subject)
-        if not can_use_subject:
-            raise HTTPException(status_code=403, detail=subject_message)
+        check_upload_allowed(user, subject, assessment_type, db)
         
         # Validate submissions count
         valid_submissions = [s for s in student_submissions if s.filename]
@@ -493,13 +559,6 @@ async def upload_files(
         if not can_process:
             raise HTTPException(status_code=403, detail=submission_message)
         
-        # Validate input
-        if subject not in VALID_SUBJECTS:
-            raise HTTPException(status_code=400, detail=f"Invalid subject. Must be one of: {', '.join(VALID_SUBJECTS)}")
-        
-        if assessment_type not in VALID_ASSESSMENT_TYPES:
-            raise HTTPException(status_code=400, detail=f"Invalid assessment type. Must be one of: {', '.join(VALID_ASSESSMENT_TYPES)}")
-        
         # File validation
         if not assignment_file or not assignment_file.filename:
             raise HTTPException(status_code=400, detail="Please select an assignment instructions file")
@@ -518,53 +577,63 @@ async def upload_files(
             if not file.filename.lower().endswith('.pdf'):
                 raise HTTPException(status_code=400, detail=f"Only PDF files allowed. '{file.filename}' is not a PDF")
         
+        # Check if user has custom rubrics feature before writing anything
+        if custom_rubric and custom_rubric.filename:
+            if not subscription_service.has_feature_access(user, "custom_rubrics"):
+                raise HTTPException(status_code=403, detail="Custom rubrics not available in your plan. Please upgrade to use this feature.")
+        
+        # Size limits are enforced up front and again while streaming
+        budget = UploadBudget()
+        try:
+            budget.check_declared_sizes(all_files)
+        except UploadLimitExceeded as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        
         # Create task
         task_id = str(uuid.uuid4())
-        task_dir = Path(f"uploads/{task_id}")
+        task_dir = storage.root / task_id
         task_dir.mkdir(exist_ok=True)
         
-        # Save files
+        # Save files (streamed to disk in chunks and hashed while streaming)
         saved_files = {}
+        file_checksums = {}
         
-        # Assignment file
-        assignment_path = task_dir / f"assignment_{assignment_file.filename}"
-        async with aiofiles.open(assignment_path, "wb") as f:
-            content = await assignment_file.read()
-            await f.write(content)
-        saved_files["assignment"] = str(assignment_path)
-        
-        # Student submissions
-        submissions_dir = task_dir / "submissions"
-        submissions_dir.mkdir(exist_ok=True)
-        submission_paths = []
-        
-        for i, submission in enumerate(valid_submissions):
-            submission_path = submissions_dir / f"submission_{i+1}_{submission.filename}"
-            async with aiofiles.open(submission_path, "wb") as f:
-                content = await submission.read()
-                await f.write(content)
-            submission_paths.append(str(submission_path))
-        
-        saved_files["submissions"] = submission_paths
+        try:
+            # Assignment file
+            saved = await save_upload_file(assignment_file, task_dir / f"assignment_{assignment_file.filename}", budget)
+            saved_files["assignment"] = saved["path"]
+            file_checksums[saved["path"]] = saved["sha256"]
+            
+            # Student submissions, several written concurrently
+            submissions_dir = task_dir / "submissions"
+            submissions_dir.mkdir(exist_ok=True)
+            saved_submissions = await save_upload_files([
+                (submission, submissions_dir / f"submission_{i+1}_{submission.filename}")
+                for i, submission in enumerate(valid_submissions)
+            ], budget)
+            submission_paths = [saved["path"] for saved in saved_submissions]
+            file_checksums.update({saved["path"]: saved["sha256"] for saved in saved_submissions})
+            
+            saved_files["submissions"] = submission_paths
+            
+            # Optional files
+            if solution_file and solution_file.filename:
+                saved = await save_upload_file(solution_file, task_dir / f"solution_{solution_file.filename}", budget)
+                saved_files["solution"] = saved["path"]
+                file_checksums[saved["path"]] = saved["sha256"]
+            
+            if custom_rubric and custom_rubric.filename:
+                saved = await save_upload_file(custom_rubric, task_dir / f"rubric_{custom_rubric.filename}", budget)
+                saved_files["rubric"] = saved["path"]
+                file_checksums[saved["path"]] = saved["sha256"]
+        except UploadLimitExceeded as e:
+            shutil.rmtree(task_dir, ignore_errors=True)
+            raise HTTPException(status_code=413, detail=str(e))
         
-        # Optional files
-        if solution_file and solution_file.filename:
-            solution_path = task_dir / f"solution_{solution_file.filename}"
-            async with aiofiles.open(solution_path, "wb") as f:
-                content = await solution_file.read()
-                await f.write(content)
-            saved_files["solution"] = str(solution_path)
+        # Identical files uploaded by earlier tasks are stored once
+        blob_store.adopt_files(db, file_checksums)
         
-        if custom_rubric and custom_rubric.filename:
-            # Check if user has custom rubrics feature
-            if not subscription_service.has_feature_access(user, "custom_rubrics"):
-                raise HTTPException(status_code=403, detail="Custom rubrics not available in your plan. Please upgrade to use this feature.")
-            
-            rubric_path = task_dir / f"rubric_{custom_rubric.filename}"
-            async with aiofiles.open(rubric_path, "wb") as f:
-                content = await custom_rubric.read()
-                await f.write(content)
-            saved_files["rubric"] = str(rubric_path)
+        await reserve_upload(user, db, task_dir, file_checksums)
         
         # Create assignment record
         assignment = Assignment(
@@ -580,25 +649,21 @@ async def upload_files(
         
         db.add(assignment)
         db.commit()
+        billing_dispatcher.wake()
         
-        # Increment usage counter
-        subscription_service.increment_assignment_usage(user, db)
+        # Whichever node grades the task reads the files from shared storage
+        await publish_upload(db, assignment, task_dir, file_checksums, file_checksums)
         
-        # Create task data for processing
-        task_data = {
+        # Queue the task for whichever worker claims it first
+        task_queue.enqueue(db, user, {
             "task_id": task_id,
             "subject": subject,
             "assessment_type": assessment_type,
-            "status": "processing",
-            "created_at": datetime.now().isoformat(),
             "user_id": user.id,
-            "files": saved_files
-        }
-        
-        await save_task_metadata(task_id, task_data)
-        
-        # Start processing in background
-        background_tasks.add_task(process_grading_task, task_id, db)
+            "files": saved_files,
+            "file_checksums": file_checksums
+        })
+        grading_worker.wake()
         
         return RedirectResponse(
             url=f"/dashboard?task_id={task_id}&status=upload_success",
@@ -610,56 +675,147 @@ async def upload_files(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-async def process_grading_task(task_id: str, db: Session):
-    """Process grading task using Perplexity API via grader.py"""
+@app.post("/api/upload-zip")
+async def upload_submissions_zip(
+    request: Request,
+    subject: str = Form(...),
+    assessment_type: str = Form(...),
+    assignment_file: UploadFile = File(...),
+    submissions_zip: UploadFile = File(...),
+    solution_file: Optional[UploadFile] = File(None),
+    custom_rubric: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db)
+):
+    """Bulk upload: student submissions arrive as one ZIP and are extracted while grading runs"""
     try:
-        # Load task data
-        task_data = await load_task_metadata(task_id)
-        if not task_data:
-            return
+        user = require_auth(request, db)
+        if isinstance(user, RedirectResponse):
+            raise HTTPException(status_code=401, detail="Authentication required")
         
-        # Get assignment record
-        assignment = db.query(Assignment).filter(Assignment.id == task_id).first()
-        if not assignment:
-            return
+        if not subscription_service.has_feature_access(user, "bulk_upload"):
+            raise HTTPException(status_code=403, detail="Bulk upload not available in your plan. Please upgrade to use this feature.")
         
-        # Update status
-        assignment.status = "processing"
-        db.commit()
+        check_upload_allowed(user, subject, assessment_type, db)
+        
+        # File validation
+        if not assignment_file or not assignment_file.filename:
+            raise HTTPException(status_code=400, detail="Please select an assignment instructions file")
+        
+        if not submissions_zip or not submissions_zip.filename.lower().endswith('.zip'):
+            raise HTTPException(status_code=400, detail="Please select a ZIP file of student submissions")
+        
+        pdf_files = [assignment_file]
+        if solution_file and solution_file.filename:
+            pdf_files.append(solution_file)
+        if custom_rubric and custom_rubric.filename:
+            pdf_files.append(custom_rubric)
+        
+        for file in pdf_files:
+            if not file.filename.lower().endswith('.pdf'):
+                raise HTTPException(status_code=400, detail=f"Only PDF files allowed. '{file.filename}' is not a PDF")
+        
+        if custom_rubric and custom_rubric.filename:
+            if not subscription_service.has_feature_access(user, "custom_rubrics"):
+                raise HTTPException(status_code=403, detail="Custom rubrics not available in your plan. Please upgrade to use this feature.")
+        
+        # The archive itself is bounded by the per-request limit, its contents by the ZIP limits
+        budget = UploadBudget()
+        try:
+            budget.check_declared_sizes(pdf_files, archives=[submissions_zip])
+        except UploadLimitExceeded as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        
+        # Create task
+        task_id = str(uuid.uuid4())
+        task_dir = storage.root / task_id
+        task_dir.mkdir(exist_ok=True)
+        
+        saved_files = {}
+        file_checksums = {}
+        
+        try:
+            saved = await save_upload_file(assignment_file, task_dir / f"assignment_{assignment_file.filename}", budget)
+            saved_files["assignment"] = saved["path"]
+            file_checksums[saved["path"]] = saved["sha256"]
+            
+            # Keep the archive on disk; it is extracted by the grading task, not here
+            saved = await save_upload_file(submissions_zip, task_dir / "submissions.zip", budget,
+                                           max_file_bytes=budget.max_request_bytes)
+            saved_files["submissions_archive"] = saved["path"]
+            file_checksums[saved["path"]] = saved["sha256"]
+            
+            if solution_file and solution_file.filename:
+                saved = await save_upload_file(solution_file, task_dir / f"solution_{solution_file.filename}", budget)
+                saved_files["solution"] = saved["path"]
+                file_checksums[saved["path"]] = saved["sha256"]
+            
+            if custom_rubric and custom_rubric.filename:
+                saved = await save_upload_file(custom_rubric, task_dir / f"rubric_{custom_rubric.filename}", budget)
+                saved_files["rubric"] = saved["path"]
+                file_checksums[saved["path"]] = saved["sha256"]
+            
+            # Only the central directory is read here, members are inflated later
+            submission_names = await asyncio.get_event_loop().run_in_executor(
+                None, inspect_submissions_zip, Path(saved_files["submissions_archive"]))
+        except UploadLimitExceeded as e:
+            shutil.rmtree(task_dir, ignore_errors=True)
+            raise HTTPException(status_code=413, detail=str(e))
+        except zipfile.BadZipFile:
+            shutil.rmtree(task_dir, ignore_errors=True)
+            raise HTTPException(status_code=400, detail=f"'{submissions_zip.filename}' is not a valid ZIP archive")
         
-        # Use the grader
-        results = await grader.grade_assignment(task_data)
+        if not submission_names:
+            shutil.rmtree(task_dir, ignore_errors=True)
+            raise HTTPException(status_code=400, detail="The ZIP archive does not contain any PDF submissions")
         
-        # Update assignment with results
-        assignment.status = results.get("status", "completed")
-        assignment.results = results
-        assignment.reports_zip_path = results.get("reports_zip_path")
-        assignment.completed_at = datetime.now()
+        can_process, submission_message = subscription_service.can_process_submissions(user, len(submission_names))
+        if not can_process:
+            shutil.rmtree(task_dir, ignore_errors=True)
+            raise HTTPException(status_code=403, detail=submission_message)
         
-        if results.get("status") == "error":
-            assignment.error_message = results.get("error", "Unknown error")
+        # The archive is deleted once extracted, so only the PDFs go into the blob store
+        adopted_checksums = {path: sha256 for path, sha256 in file_checksums.items()
+                             if path != saved_files["submissions_archive"]}
+        blob_store.adopt_files(db, adopted_checksums)
         
+        await reserve_upload(user, db, task_dir, adopted_checksums)
+        
+        assignment = Assignment(
+            id=task_id,
+            user_id=user.id,
+            subject=subject,
+            assessment_type=assessment_type,
+            submissions_count=len(submission_names),
+            assignment_file_path=saved_files["assignment"],
+            solution_file_path=saved_files.get("solution"),
+            rubric_file_path=saved_files.get("rubric")
+        )
+        
+        db.add(assignment)
         db.commit()
+        billing_dispatcher.wake()
         
-        # Record usage
-        user = db.query(User).filter(User.id == assignment.user_id).first()
-        if user:
-            subscription_service.record_usage(
-                user, "assignment_completed", db,
-                resource_used=task_id,
-                metadata={"submissions_count": assignment.submissions_count}
-            )
+        await publish_upload(db, assignment, task_dir, file_checksums, adopted_checksums)
         
+        task_queue.enqueue(db, user, {
+            "task_id": task_id,
+            "subject": subject,
+            "assessment_type": assessment_type,
+            "user_id": user.id,
+            "files": saved_files,
+            "file_checksums": file_checksums
+        })
+        grading_worker.wake()
+        
+        return RedirectResponse(
+            url=f"/dashboard?task_id={task_id}&status=upload_success",
+            status_code=303
+        )
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        # Handle errors
-        try:
-            assignment = db.query(Assignment).filter(Assignment.id == task_id).first()
-            if assignment:
-                assignment.status = "error"
-                assignment.error_message = str(e)
-                db.commit()
-        except:
-            pass
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 @app.post("/api/mark-failed/{task_id}")
 async def mark_failed(
@@ -678,11 +834,42 @@ async def mark_failed(
     assn.status = "error"
     assn.error_message = assn.error_message or "Manually marked failed"
     assn.completed_at = datetime.now()
+    # Keeps a worker from picking the task up, or from saving results if it already has
+    task_queue.cancel(db, task_id)
+    dashboard_cache.bump(db, [user.id])
     db.commit()
     return {"status": "ok"}
 
-@app.get("/api/download-reports/{task_id}")
-async def download_reports(task_id: str, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def ranged_stream_response(request: Request, segments: List, size: int, etag: str,
+                           media_type: str, filename: str) -> Response:
+    """Stream segments as a download, honouring a single Range (and If-Range) for resume"""
+    if filename.isascii():
+        content_disposition = f'attachment; filename="{filename}"'
+    else:
+        content_disposition = f"attachment; filename*=utf-8''{quote(filename)}"
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Content-Disposition": content_disposition}
+    
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range_header(request.headers.get("range"), size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+    
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_segments(segments, 0, size - 1), media_type=media_type, headers=headers)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(iter_segments(segments, start, end), status_code=206,
+                             media_type=media_type, headers=headers)
+
+def get_owned_completed_assignment(task_id: str, request: Request, db: Session) -> Assignment:
+    """Resolve a task owned by the current user whose reports can be downloaded"""
     user = require_auth(request, db)
     if isinstance(user, RedirectResponse):
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -695,36 +882,176 @@ async def download_reports(task_id: str, request: Request, background_tasks: Bac
     if assignment.user_id != user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Check reports ZIP path
-    if not assignment.reports_zip_path or not Path(assignment.reports_zip_path).exists():
+    if assignment.files_purged_at:
+        raise HTTPException(status_code=410, detail="Reports were deleted after the retention period")
+    
+    if is_lazy_reports(assignment):
+        return assignment
+    
+    # reports_manifest_path points at the manifest the archive is laid out from
+    if not assignment.reports_manifest_path:
         raise HTTPException(status_code=404, detail="Reports not available")
     
-    # Schedule cleanup after response
-    def cleanup():
-        try:
-            shutil.rmtree(f"uploads/{task_id}")
-            print(f"✓ Cleaned up uploads/{task_id} after download")
-        except Exception as e:
-            print(f"✗ Error cleaning up uploads/{task_id}: {e}")
+    return assignment
+
+async def fetch_reports_manifest(assignment: Assignment, all_reports: bool = True) -> Path:
+    """Local copy of an eagerly rendered task's manifest, and by default its reports, from shared storage"""
+    manifest_path = Path(assignment.reports_manifest_path)
+    try:
+        if all_reports and manifest_path.suffix != ".zip":
+            await storage.fetch_dir(manifest_path.parent)
+        manifest_path = await storage.fetch(manifest_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Reports not available")
+    # Last access time for the storage GC's eviction order
+    os.utime(manifest_path)
+    return manifest_path
+
+def is_lazy_reports(assignment: Assignment) -> bool:
+    """Reports of lazily graded tasks, or whose rendered reports were reclaimed, are rendered on download"""
+    if assignment.status != "completed":
+        return False
+    # Tasks graded before summaries were stored only have the full results
+    summary = assignment.summary or assignment.results
+    if not summary:
+        return False
+    return summary.get("reports_mode") == "lazy" or not assignment.reports_manifest_path
+
+async def reports_archive_response(request: Request, task_id: str, manifest_path: Path) -> Response:
+    """Stream a task's reports as one ZIP built from its manifest"""
+    # Tasks graded before the archive was streamed still have a pre-built ZIP
+    if manifest_path.suffix == ".zip":
+        return FileResponse(manifest_path, filename=f"reports_{task_id}.zip")
     
-    background_tasks.add_task(cleanup)
+    # May rewrite a stale manifest, so it runs in a thread
+    entries = await asyncio.to_thread(load_reports_manifest, manifest_path)
+    try:
+        archive = ReportsArchive(manifest_path.parent, entries)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    return FileResponse(assignment.reports_zip_path, filename=f"reports_{task_id}.zip")
+    return ranged_stream_response(request, archive.segments, archive.size, archive.etag,
+                                  "application/zip", f"reports_{task_id}.zip")
+
+def report_file_response(request: Request, report_path: Optional[Path]) -> Response:
+    if not report_path:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    stat = report_path.stat()
+    segments = [(None, str(report_path), stat.st_size)]
+    # Not the mtime: cached reports are touched on every access
+    etag = f'"{stat.st_size:x}-{stat.st_ino:x}"'
+    return ranged_stream_response(request, segments, stat.st_size, etag, "application/pdf", report_path.name)
+
+async def lazy_report_response(task_id: str, render) -> Response:
+    """Response for reports served from the render cache, pinned there until it has been sent"""
+    report_cache.pin(task_id)
+    try:
+        response = await render()
+    except BaseException:
+        report_cache.unpin(task_id)
+        raise
+    response.background = BackgroundTask(report_cache.unpin, task_id)
+    return response
+
+@app.get("/api/download-reports/{task_id}")
+async def download_reports(task_id: str, request: Request, db: Session = Depends(get_db)):
+    assignment = get_owned_completed_assignment(task_id, request, db)
+    
+    if is_lazy_reports(assignment):
+        async def render():
+            manifest_path = await report_cache.get_reports_manifest(assignment.results)
+            return await reports_archive_response(request, task_id, manifest_path)
+        return await lazy_report_response(task_id, render)
+    
+    return await reports_archive_response(request, task_id, await fetch_reports_manifest(assignment))
+
+@app.get("/api/download-reports/{task_id}/{report_name}")
+async def download_single_report(task_id: str, report_name: str, request: Request, db: Session = Depends(get_db)):
+    """Download one student's report"""
+    assignment = get_owned_completed_assignment(task_id, request, db)
+    
+    # Only names of this task's reports are served, which rules out path traversal
+    if is_lazy_reports(assignment):
+        async def render():
+            return report_file_response(request, await report_cache.get_report(assignment.results, report_name))
+        return await lazy_report_response(task_id, render)
+    
+    manifest_path = await fetch_reports_manifest(assignment, all_reports=False)
+    if manifest_path.suffix == ".zip":
+        raise HTTPException(status_code=404, detail="Report not found")
+    # Only this report is fetched, so the other entries are not checked against the disk
+    entries = await asyncio.to_thread(read_reports_manifest, manifest_path)
+    entry = next((e for e in entries if e["name"] == report_name), None)
+    try:
+        report_path = await storage.fetch(manifest_path.parent / entry["name"]) if entry else None
+    except FileNotFoundError:
+        report_path = None
+    return report_file_response(request, report_path)
+
+TASK_FIELDS = {"summary", "stages", "results"}
+TASK_RESULTS_PAGE_SIZE = 25
+
+def get_results_summary(db: Session, assignment: Assignment) -> Optional[Dict]:
+    """Results summary, derived once from the full results for tasks graded before summaries were stored"""
+    if assignment.summary is None and assignment.status != "processing" and assignment.results:
+        assignment.summary = grader.summarize_results(assignment.results)
+        db.commit()
+    return assignment.summary
+
+def get_results_page(db: Session, assignment: Assignment, page: int, per_page: int) -> Dict:
+    """One page of per-student results, read from the submissions table"""
+    submissions = db.query(Submission).filter(Submission.assignment_id == assignment.id)
+    total = submissions.count()
+    if not total and assignment.status == "completed" and assignment.results:
+        # Graded before submissions were stored
+        analytics_service.store_submissions(db, assignment, assignment.results)
+        db.commit()
+        total = submissions.count()
+
+    rows = submissions.order_by(Submission.student_name, Submission.id).offset((page - 1) * per_page).limit(per_page)
+    return {
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "items": [{
+            "student_name": row.student_name,
+            "overall_score": row.overall_score,
+            "rubric_scores": row.rubric_scores,
+            "feedback": row.feedback,
+            "detailed_feedback": row.detailed_feedback,
+            "strengths": row.strengths,
+            "areas_for_improvement": row.areas_for_improvement,
+            "graded_at": row.graded_at.isoformat() if row.graded_at else None,
+        } for row in rows],
+    }
 
 @app.get("/api/task/{task_id}")
-async def get_task_status(task_id: str, request: Request, db: Session = Depends(get_db)):
-    user = require_auth(request, db)
-    if isinstance(user, RedirectResponse):
+async def get_task_status(
+    task_id: str,
+    request: Request,
+    fields: str = "summary",
+    page: int = 1,
+    per_page: int = TASK_RESULTS_PAGE_SIZE,
+    db: Session = Depends(get_db)
+):
+    """Task status; `fields` adds any of summary, stages and results (per-student, paginated)"""
+    entitlements = get_current_entitlements(request, db)
+    if not entitlements:
         raise HTTPException(status_code=401, detail="Authentication required")
     
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    if requested - TASK_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(requested - TASK_FIELDS))}")
+    
     assignment = db.query(Assignment).filter(Assignment.id == task_id).first()
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     
-    if assignment.user_id != user.id:
+    if assignment.user_id != entitlements["user_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return {
+    response = {
         "task_id": assignment.id,
         "status": assignment.status,
         "subject": assignment.subject,
@@ -732,9 +1059,15 @@ async def get_task_status(task_id: str, request: Request, db: Session = Depends(
         "submissions_count": assignment.submissions_count,
         "created_at": assignment.created_at.isoformat(),
         "completed_at": assignment.completed_at.isoformat() if assignment.completed_at else None,
-        "results": assignment.results,
         "error_message": assignment.error_message
     }
+    if "summary" in requested:
+        response["summary"] = get_results_summary(db, assignment)
+    if "stages" in requested:
+        response["stages"] = task_queue.get_stages(db, assignment.id)
+    if "results" in requested:
+        response["results"] = get_results_page(db, assignment, max(1, page), max(1, min(per_page, 100)))
+    return response
 
 # Subscription Management Routes
 @app.post("/api/create-checkout-session")
@@ -810,11 +1143,15 @@ async def get_usage_summary(request: Request, db: Session = Depends(get_db)):
     if isinstance(user, RedirectResponse):
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    return subscription_service.get_usage_summary(user, db)
+    etag = dashboard_cache.etag(user, "usage_summary")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return JSONResponse(get_cached_usage_summary(user, db), headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
 
 @app.post("/webhook")
 async def stripe_webhook(request: Request, db: Session = Depends(get_db), stripe_signature: str = Header(None)):
-    """Handle Stripe webhook events"""
+    """Verify and store Stripe webhook events; the webhook processor applies them"""
     payload = await request.body()
     
     try:
@@ -826,13 +1163,17 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db), stripe
     except stripe.error.SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    # Handle the event
-    success = subscription_service.handle_subscription_webhook(event, db)
+    if event["type"].startswith(("price.", "product.")):
+        price_catalog.request_refresh()
     
-    if success:
-        return {"status": "success"}
-    else:
-        raise HTTPException(status_code=500, detail="Webhook processing failed")
+    # Store the raw event and acknowledge; redeliveries of a stored event are acknowledged too
+    try:
+        subscription_service.record_webhook_event(json.loads(payload), db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not store event: {str(e)}")
+    webhook_processor.wake()
+    
+    return {"status": "success"}
 
 @app.get("/success", response_class=HTMLResponse)
 async def success(request: Request, session_id: Optional[str] = None):
@@ -955,6 +1296,7 @@ async def register(
     db.add(user)
     db.commit()
     db.refresh(user)
+    subscription_service.invalidate_entitlements(user.id)
 
     # Create beta tester record if applicable
     if beta_access and used_invitation:
@@ -971,6 +1313,8 @@ async def register(
         # Increment invitation code usage
         used_invitation.current_uses += 1
         db.commit()
+        # The beta tester record changes what the user is entitled to
+        subscription_service.invalidate_entitlements(user.id)
     
     request.session["user"] = {
         "id": user.id,
@@ -1044,6 +1388,33 @@ async def generate_invitation_code(
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Storage GC counters in the Prometheus text format"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    lines = [
+        "# HELP scorewise_storage_reclaimed_bytes_total Bytes freed by the storage garbage collector",
+        "# TYPE scorewise_storage_reclaimed_bytes_total counter",
+    ]
+    for reason in ("expired", "orphaned", "rendered"):
+        lines.append(f'scorewise_storage_reclaimed_bytes_total{{reason="{reason}"}} '
+                     f'{retention_service.reclaimed_bytes[reason]}')
+    lines += [
+        "# HELP scorewise_storage_gc_runs_total Completed storage garbage collection passes",
+        "# TYPE scorewise_storage_gc_runs_total counter",
+        f"scorewise_storage_gc_runs_total {retention_service.runs}",
+        "# HELP scorewise_storage_gc_last_run_timestamp_seconds Time of the last storage garbage collection pass",
+        "# TYPE scorewise_storage_gc_last_run_timestamp_seconds gauge",
+        f"scorewise_storage_gc_last_run_timestamp_seconds {retention_service.last_run_at or 0:.0f}",
+        "# HELP scorewise_storage_disk_used_ratio Used fraction of the uploads filesystem",
+        "# TYPE scorewise_storage_disk_used_ratio gauge",
+        f"scorewise_storage_disk_used_ratio {retention_service.disk_usage_ratio():.4f}",
+    ]
+    return "\n".join(lines) + "\n"
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
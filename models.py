@@ -1,6 +1,7 @@
 # ScoreWise AI - Database Models
-from sqlalchemy import Column, String, DateTime, Integer, Boolean, Float, Text, ForeignKey, JSON
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger, Boolean, Float, Text, ForeignKey, JSON, Index
+from sqlalchemy.orm import relationship, declarative_base, deferred
+from sqlalchemy.sql.expression import literal_column
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -48,6 +49,8 @@ class User(Base):
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    # Goes up with every update of this row and every assignment change; keys dashboard caches and ETags
+    data_version = Column(Integer, default=0, onupdate=literal_column("data_version + 1"), nullable=False)
     
     # Relationships
     assignments = relationship("Assignment", back_populates="user", cascade="all, delete-orphan")
@@ -75,8 +78,9 @@ class Assignment(Base):
     submissions_count = Column(Integer, default=0, nullable=False)
     
     # Results
-    results = Column(JSON, nullable=True)
-    reports_zip_path = Column(String, nullable=True)
+    summary = Column(JSON, nullable=True)  # statistics, counts and timings, see grader.summarize_results
+    results = deferred(Column(JSON, nullable=True))  # full per-student results, loaded on first access
+    reports_manifest_path = Column(String, nullable=True)
     
     # Metadata
     processing_time_seconds = Column(Float, nullable=True)
@@ -86,16 +90,22 @@ class Assignment(Base):
     # Timestamps
     created_at = Column(DateTime, default=func.now(), nullable=False)
     completed_at = Column(DateTime, nullable=True)
+    files_purged_at = Column(DateTime, nullable=True)  # Uploads and rendered reports deleted after retention
     
     # Relationships
     user = relationship("User", back_populates="assignments")
     submissions = relationship("Submission", back_populates="assignment", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("idx_assignments_user_status_created", "user_id", "status", "created_at"),
+        Index("idx_assignments_user_created", "user_id", "created_at"),
+    )
 
 class Submission(Base):
     __tablename__ = "submissions"
     
     id = Column(String, primary_key=True, index=True)
-    assignment_id = Column(String, ForeignKey("assignments.id"), nullable=False)
+    assignment_id = Column(String, ForeignKey("assignments.id"), nullable=False, index=True)
     
     # Submission Details
     student_name = Column(String, nullable=False)
@@ -120,6 +130,19 @@ class Submission(Base):
     
     # Relationships
     assignment = relationship("Assignment", back_populates="submissions")
+    criterion_scores = relationship("SubmissionScore", cascade="all, delete-orphan")
+
+class SubmissionScore(Base):
+    __tablename__ = "submission_scores"
+    
+    # One row per rubric criterion, so per-criterion analytics are plain SQL aggregates
+    submission_id = Column(String, ForeignKey("submissions.id"), primary_key=True)
+    criterion = Column(String, primary_key=True)
+    score = Column(Float, nullable=False)
+    
+    __table_args__ = (
+        Index("idx_submission_scores_criterion", "criterion"),
+    )
 
 class UsageRecord(Base):
     __tablename__ = "usage_records"
@@ -154,6 +177,8 @@ class SubscriptionEvent(Base):
     # Stripe Event Information
     stripe_event_id = Column(String, unique=True, nullable=False, index=True)
     event_type = Column(String, nullable=False)
+    stripe_customer_id = Column(String, nullable=True)  # events of one customer are applied in order
+    payload = Column(JSON, nullable=True)  # the raw event, applied by the webhook processor
     
     # Event Data
     old_tier = Column(String, nullable=True)
@@ -164,11 +189,137 @@ class SubscriptionEvent(Base):
     # Processing Status
     processed = Column(Boolean, default=False, nullable=False)
     error_message = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False)
+    coalesced_into = Column(String, nullable=True)  # stripe_event_id of a later event that superseded this one
     
     # Timestamps
     stripe_created = Column(DateTime, nullable=False)
     received_at = Column(DateTime, default=func.now(), nullable=False)
     processed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("idx_subscription_events_pending", "processed", "stripe_customer_id", "stripe_created"),
+    )
+
+class BillingOutbox(Base):
+    __tablename__ = "billing_outbox"
+    
+    # Stripe calls owed for usage, written in the usage transaction and delivered by the billing dispatcher
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    usage_record_id = Column(String, ForeignKey("usage_records.id"), nullable=True)
+    
+    # Invoice Item
+    stripe_customer_id = Column(String, nullable=False)
+    stripe_price_id = Column(String, nullable=False)
+    quantity = Column(Integer, default=1, nullable=False)
+    
+    # Delivery State
+    status = Column(String, default="pending", nullable=False)  # pending, sending, sent, failed
+    batch_id = Column(String, nullable=True, index=True)  # rows delivered as one invoice item; the idempotency key
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    stripe_invoice_item_id = Column(String, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("idx_billing_outbox_due", "status", "next_attempt_at"),
+    )
+
+class GradingTask(Base):
+    __tablename__ = "grading_tasks"
+    
+    id = Column(String, ForeignKey("assignments.id"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    
+    # Everything a worker needs to grade the task: subject, files, checksums
+    spec = Column(JSON, nullable=False)
+    
+    # Queue State
+    status = Column(String, default="queued", nullable=False)  # queued, processing, completed, error
+    priority = Column(Integer, default=0, nullable=False)  # higher is claimed first
+    attempts = Column(Integer, default=0, nullable=False)
+    claimed_by = Column(String, nullable=True)  # worker id
+    heartbeat_at = Column(DateTime, nullable=True)  # refreshed by the worker at every stage
+    
+    # Timestamps
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Relationships
+    stages = relationship("GradingTaskStage", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("idx_grading_tasks_claim", "status", "priority", "created_at"),
+    )
+
+class GradingTaskStage(Base):
+    __tablename__ = "grading_task_stages"
+    
+    task_id = Column(String, ForeignKey("grading_tasks.id"), primary_key=True)
+    stage = Column(String, primary_key=True)  # prepare, grade, reports
+    
+    status = Column(String, nullable=False)  # running, completed, error
+    detail = Column(Text, nullable=True)  # progress or error message
+    started_at = Column(DateTime, default=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+class UserAnalytics(Base):
+    __tablename__ = "user_analytics"
+    
+    # Running totals over every completed assignment, updated as each one completes
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    assignments_count = Column(Integer, default=0, nullable=False)
+    submissions_count = Column(Integer, default=0, nullable=False)
+    average_score_sum = Column(Float, default=0, nullable=False)  # sum of per-assignment averages
+    highest_score = Column(Float, nullable=True)
+    lowest_score = Column(Float, nullable=True)
+    grade_distribution = Column(JSON, nullable=False)  # {"A": n, ...}
+    score_histogram = Column(JSON, nullable=False)  # submissions per whole score, {"0": n, ..., "100": n}
+    rubric_sums = Column(JSON, nullable=False)  # {criterion: [sum, count]}
+    
+    # Least-squares sums for the score trend (x = days since TREND_EPOCH, y = score)
+    trend_n = Column(Integer, default=0, nullable=False)
+    trend_sum_x = Column(Float, default=0, nullable=False)
+    trend_sum_y = Column(Float, default=0, nullable=False)
+    trend_sum_xx = Column(Float, default=0, nullable=False)
+    trend_sum_xy = Column(Float, default=0, nullable=False)
+    trend_last_x = Column(Integer, nullable=True)
+    
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+class FeedbackTheme(Base):
+    __tablename__ = "feedback_themes"
+    
+    # Near-duplicate strengths/improvements counted together, see feedback_themes
+    id = Column(String, primary_key=True, index=True)
+    scope = Column(String, nullable=False)  # user:<id>, class:<id>:<subject>
+    kind = Column(String, nullable=False)  # strengths, areas_for_improvement
+    fingerprint = Column(BigInteger, nullable=False)  # SimHash of the phrase
+    label = Column(Text, nullable=False)  # first phrase seen for the theme
+    count = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        Index("idx_feedback_themes_scope_count", "scope", "kind", "count"),
+    )
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    
+    # Content-addressed upload: one stored file per distinct SHA-256
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)  # task files linked to this blob
+    
+    # Timestamps
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    last_referenced_at = Column(DateTime, default=func.now(), nullable=False)
 
 class FeatureFlag(Base):
     __tablename__ = "feature_flags"
@@ -234,7 +385,8 @@ TIER_CONFIGS = {
             "email_support": True
         },
         "price_monthly": 0,
-        "trial_days": 7
+        "trial_days": 7,
+        "retention_days": 14
     },
     SubscriptionTier.EDUCATOR.value: {
         "name": "Educator Plan",
@@ -256,6 +408,7 @@ TIER_CONFIGS = {
         "price_monthly": 19,
         "stripe_price_id_monthly": None,  # Patched at runtime from env
         "stripe_price_id_annual": None,  # Patched at runtime from env
+        "retention_days": 90
     },
     SubscriptionTier.PROFESSIONAL.value: {
         "name": "Professional Plan",
@@ -277,6 +430,7 @@ TIER_CONFIGS = {
         "price_monthly": 49,
         "stripe_price_id_monthly": None,  # Patched at runtime from env
         "stripe_price_id_annual": None,  # Patched at runtime from env
+        "retention_days": 180
     },
     SubscriptionTier.INSTITUTION.value: {
         "name": "Institution Plan",
@@ -301,6 +455,7 @@ TIER_CONFIGS = {
         "price_monthly": 199,
         "stripe_price_id_monthly": None,  # Patched at runtime from env
         "stripe_price_id_annual": None,  # Patched at runtime from env
+        "retention_days": 365
     },
     "beta": {
         "name": "Beta Tester",
@@ -320,6 +475,7 @@ TIER_CONFIGS = {
             "beta_features": True  # Special beta feature access
         },
         "price_monthly": 0,  # Free for beta testers
-        "beta_access_days": 30  # 30-day beta access
+        "beta_access_days": 30,  # 30-day beta access
+        "retention_days": 60
     }
 }
\ No newline at end of file
@@ -0,0 +1,116 @@
+# ScoreWise AI - Stripe Price Catalog Cache
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import stripe
+
+logger = logging.getLogger(__name__)
+
+PRICE_REFRESH_SECONDS = int(os.getenv("PRICE_REFRESH_MINUTES", "60")) * 60
+# JSON file of {price_id: {unit_amount, currency, recurring}} served instead of Stripe (local runs and tests)
+STRIPE_PRICES_FILE = os.getenv("STRIPE_PRICES_FILE")
+
+
+class LocalPriceClient:
+    """Stand-in for stripe.Price backed by a dict of price objects"""
+
+    def __init__(self, prices: Dict[str, Dict[str, Any]]):
+        self.prices = prices
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalPriceClient":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def retrieve(self, price_id: str) -> Dict[str, Any]:
+        if price_id not in self.prices:
+            raise KeyError(f"No such price: {price_id}")
+        return self.prices[price_id]
+
+
+def format_price(price_obj) -> Dict[str, str]:
+    """The fields the pricing page shows for a Stripe price"""
+    return {
+        "amount": f"{price_obj['unit_amount'] / 100:.2f}",
+        "currency": price_obj["currency"].upper(),
+        "interval": price_obj["recurring"]["interval"] if price_obj.get("recurring") else "once",
+    }
+
+
+class PriceCatalog:
+    """Plan prices fetched from Stripe off the request path and served from memory.
+
+    Loaded at startup, refreshed every PRICE_REFRESH_MINUTES and whenever a
+    price or product webhook arrives. A price that fails to load keeps its
+    last known value.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or (LocalPriceClient.from_file(STRIPE_PRICES_FILE) if STRIPE_PRICES_FILE else stripe.Price)
+        self.price_ids: Dict[str, Dict[str, Optional[str]]] = {}
+        self.loaded_at: Optional[float] = None
+        self._prices: Dict[str, Dict[str, Optional[Dict]]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_again = False
+
+    def prices(self) -> Dict[str, Dict[str, Optional[Dict]]]:
+        """Formatted prices by plan and billing period; None where not configured or not loaded yet"""
+        return {plan: {period: self._prices.get(plan, {}).get(period) for period in periods}
+                for plan, periods in self.price_ids.items()}
+
+    def _fetch(self) -> Dict[str, Dict[str, Optional[Dict]]]:
+        prices = {}
+        for plan, periods in self.price_ids.items():
+            prices[plan] = {}
+            for period, price_id in periods.items():
+                if not price_id:
+                    prices[plan][period] = None
+                    continue
+                try:
+                    prices[plan][period] = format_price(self.client.retrieve(price_id))
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not load price {price_id}: {str(e)}")
+                    prices[plan][period] = self._prices.get(plan, {}).get(period)
+        return prices
+
+    async def refresh(self):
+        # The Stripe client is blocking, so it runs in a thread
+        self._prices = await asyncio.to_thread(self._fetch)
+        self.loaded_at = time.time()
+
+    def request_refresh(self):
+        """Refresh soon (e.g. after a price webhook); requests during a refresh cause one more"""
+        self._refresh_again = True
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_pending())
+
+    async def _refresh_pending(self):
+        while self._refresh_again:
+            self._refresh_again = False
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"✗ Price catalog refresh failed: {str(e)}")
+
+    async def start(self, price_ids: Dict[str, Dict[str, Optional[str]]]):
+        """Load the catalog for these price IDs, then keep it fresh in the background"""
+        self.price_ids = price_ids
+        try:
+            await self.refresh()
+            logger.info("✓ Price catalog loaded")
+        except Exception as e:
+            logger.error(f"✗ Could not load price catalog: {str(e)}")
+        asyncio.create_task(self.run_forever())
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(PRICE_REFRESH_SECONDS)
+            self.request_refresh()
+
+
+# Initialize price catalog instance
+price_catalog = PriceCatalog()
@@ -0,0 +1,191 @@
+# ScoreWise AI - Streamed Reports Archive
+import os
+import json
+import time
+import zlib
+import struct
+import hashlib
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+STREAM_CHUNK_SIZE = int(os.getenv("REPORT_STREAM_CHUNK_SIZE", str(256 * 1024)))
+
+# Stored (uncompressed) ZIP records, no data descriptors, so every offset is
+# known before the first byte is sent.
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+_ZIP_VERSION = 20
+_UTF8_FLAG = 0x800
+_ZIP32_LIMIT = 0xFFFFFFFF
+
+# A segment is either literal bytes or a (path, length) slice of a file on disk
+Segment = Tuple[Optional[bytes], Optional[str], int]
+
+
+def report_filename(student_name: str) -> str:
+    """File name of a student's report inside the task's reports directory"""
+    return f"{student_name.replace(' ', '_')}_report.pdf"
+
+
+def _file_crc32(path: Path) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(max(mtime, 315532800))  # ZIP timestamps start in 1980
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def write_reports_manifest(reports_dir: Path) -> str:
+    """Record name, size, CRC-32 and timestamp of every report so the archive layout is fixed"""
+    reports_dir = Path(reports_dir)
+    entries = []
+    for report_file in sorted(reports_dir.glob("*.pdf")):
+        stat = report_file.stat()
+        entries.append({
+            "name": report_file.name,
+            "size": stat.st_size,
+            "crc32": _file_crc32(report_file),
+            "mtime": stat.st_mtime,
+        })
+
+    manifest_path = reports_dir / MANIFEST_NAME
+    tmp_path = reports_dir / f"{MANIFEST_NAME}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"entries": entries}, f)
+    os.replace(tmp_path, manifest_path)
+
+    logger.info(f"✓ Wrote reports manifest: {manifest_path} ({len(entries)} reports)")
+    return str(manifest_path)
+
+
+def read_reports_manifest(manifest_path: str) -> List[Dict]:
+    """Manifest entries as written, without checking the reports on disk"""
+    with open(manifest_path) as f:
+        return json.load(f)["entries"]
+
+
+def load_reports_manifest(manifest_path: str) -> List[Dict]:
+    """Load manifest entries, rebuilding the manifest if a report changed on disk since it was written"""
+    manifest_path = Path(manifest_path)
+    entries = read_reports_manifest(manifest_path)
+
+    reports_dir = manifest_path.parent
+    for entry in entries:
+        report_file = reports_dir / entry["name"]
+        if not report_file.exists() or report_file.stat().st_size != entry["size"]:
+            write_reports_manifest(reports_dir)
+            return read_reports_manifest(manifest_path)
+    return entries
+
+
+class ReportsArchive:
+    """A stored ZIP of a task's reports, laid out from its manifest and streamed on demand"""
+
+    def __init__(self, reports_dir: Path, entries: List[Dict]):
+        self.reports_dir = Path(reports_dir)
+        self.segments: List[Segment] = []
+        central_dir = []
+        offset = 0
+
+        for entry in entries:
+            name = entry["name"].encode("utf-8")
+            flags = 0 if entry["name"].isascii() else _UTF8_FLAG
+            dos_time, dos_date = _dos_datetime(entry["mtime"])
+            size, crc = entry["size"], entry["crc32"]
+
+            local_header = _LOCAL_HEADER.pack(
+                0x04034b50, _ZIP_VERSION, flags, 0, dos_time, dos_date,
+                crc, size, size, len(name), 0) + name
+            central_dir.append(_CENTRAL_HEADER.pack(
+                0x02014b50, _ZIP_VERSION, _ZIP_VERSION, flags, 0, dos_time, dos_date,
+                crc, size, size, len(name), 0, 0, 0, 0, 0o644 << 16, offset) + name)
+
+            self.segments.append((local_header, None, len(local_header)))
+            self.segments.append((None, str(self.reports_dir / entry["name"]), size))
+            offset += len(local_header) + size
+
+        central_dir = b"".join(central_dir)
+        if offset + len(central_dir) > _ZIP32_LIMIT or len(entries) > 0xFFFF:
+            raise ValueError("Reports archive is too large for a ZIP32 stream")
+
+        self.segments.append((central_dir + _END_OF_CENTRAL_DIR.pack(
+            0x06054b50, 0, 0, len(entries), len(entries), len(central_dir), offset, 0),
+            None, len(central_dir) + _END_OF_CENTRAL_DIR.size))
+
+        self.size = sum(length for _, _, length in self.segments)
+        # Changes whenever any report does, so If-Range never resumes across different content
+        digest = hashlib.sha256(json.dumps(entries, sort_keys=True).encode()).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+
+
+async def iter_segments(segments: List[Segment], start: int, end: int) -> AsyncIterator[bytes]:
+    """Yield bytes start..end (inclusive) of the concatenated segments, reading files in chunks"""
+    position = 0
+    for data, path, length in segments:
+        segment_start, segment_end = position, position + length - 1
+        position += length
+        if segment_end < start:
+            continue
+        if segment_start > end:
+            break
+
+        first = max(start, segment_start) - segment_start
+        last = min(end, segment_end) - segment_start
+        if data is not None:
+            yield data[first:last + 1]
+            continue
+
+        remaining = last - first + 1
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(first)
+            while remaining > 0:
+                chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"Report changed while streaming: {path}")
+                remaining -= len(chunk)
+                yield chunk
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=' range into inclusive (start, end).
+
+    Returns None when the whole body should be sent (no header, or a
+    multi-range request) and raises ValueError for unsatisfiable ranges.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    if size <= 0:
+        raise ValueError("Range requested on an empty body")
+
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {range_header}")
+
+    if start >= size or end < start:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    return start, min(end, size - 1)
@@ -0,0 +1,175 @@
+# ScoreWise AI - On-demand Report Rendering Cache
+import os
+import shutil
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from grader import grader
+from report_archive import MANIFEST_NAME, report_filename, write_reports_manifest
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+REPORT_CACHE_DIR = Path(os.getenv("REPORT_CACHE_DIR", "report_cache"))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_MB", "500")) * MB
+
+
+class RenderedReportCache:
+    """Reports of lazily graded tasks, rendered on first request and evicted least recently used first.
+
+    Rendered files live under REPORT_CACHE_DIR/<task_id>/ and can always be
+    rendered again from the grading results stored on the assignment. Tasks
+    pinned by a download in progress are never evicted.
+    """
+
+    def __init__(self, root: Path = REPORT_CACHE_DIR, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[Path, int]" = OrderedDict()  # least recently used first
+        self._total_bytes = 0
+        self._loaded = False
+        self._task_locks: Dict[str, asyncio.Lock] = {}
+        self._pins: Counter = Counter()
+
+    def _load_index(self):
+        """Pick up reports rendered by earlier runs, oldest access first"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        reports = sorted(self.root.glob("*/*.pdf"), key=lambda p: p.stat().st_mtime)
+        for path in reports:
+            self._index[path] = path.stat().st_size
+        self._total_bytes = sum(self._index.values())
+        self._loaded = True
+        logger.info(f"✓ Report cache: {len(reports)} reports, {self._total_bytes // MB} MB in {self.root}")
+
+    def _touch(self, path: Path):
+        self._index.move_to_end(path)
+        # mtime doubles as the access clock across restarts
+        os.utime(path)
+
+    def pin(self, task_id: str):
+        """Keep a task's reports from being evicted, e.g. while they are streamed"""
+        self._pins[task_id] += 1
+
+    def unpin(self, task_id: str):
+        self._pins[task_id] -= 1
+        if self._pins[task_id] <= 0:
+            del self._pins[task_id]
+
+    def _evict(self, keep_dir: Path):
+        """Delete least recently used reports until the cache is under its size limit"""
+        for path in list(self._index):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if path.parent == keep_dir or path.parent.name in self._pins:
+                continue
+            try:
+                self.discard(path)
+            except OSError as e:
+                logger.warning(f"Could not evict cached report {path}: {e}")
+
+    async def _ensure_reports(self, task_id: str, results: Dict, individual_results: List[Dict]) -> bool:
+        """Render whichever of the given reports are not cached; returns True if anything was rendered"""
+        if not self._loaded:
+            self._load_index()
+
+        task_dir = self.root / task_id
+        task_dir.mkdir(parents=True, exist_ok=True)
+        completed_at = datetime.fromisoformat(results["processed_at"]) if results.get("processed_at") else None
+        loop = asyncio.get_event_loop()
+        rendered = False
+
+        for result in individual_results:
+            path = task_dir / (result.get("report_filename") or report_filename(result["student_name"]))
+            if path.exists():
+                # Possibly rendered by another worker process
+                if path not in self._index:
+                    self._index[path] = path.stat().st_size
+                    self._total_bytes += self._index[path]
+                self._touch(path)
+                continue
+
+            # Render to a temp name so a concurrent reader never sees a partial PDF
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            await loop.run_in_executor(None, partial(
+                grader.render_pdf_report, result["student_name"], result, results["rubric_used"],
+                results["subject"], results["assessment_type"], str(tmp_path), completed_at))
+            os.replace(tmp_path, path)
+
+            self._total_bytes -= self._index.pop(path, 0)
+            self._index[path] = path.stat().st_size
+            self._total_bytes += self._index[path]
+            rendered = True
+
+        if rendered:
+            self._evict(keep_dir=task_dir)
+        return rendered
+
+    def lru_entries(self) -> List[Tuple[Path, int]]:
+        """Cached reports with their sizes, least recently used first"""
+        if not self._loaded:
+            self._load_index()
+        return list(self._index.items())
+
+    def discard(self, path: Path) -> int:
+        """Delete one cached report (e.g. under disk pressure) unless its task is pinned; returns bytes freed"""
+        if path.parent.name in self._pins:
+            return 0
+        size = self._index.pop(path, 0)
+        self._total_bytes -= size
+        try:
+            os.remove(path)
+            # The task's archive layout no longer matches its files
+            (path.parent / MANIFEST_NAME).unlink(missing_ok=True)
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def discard_task(self, task_id: str) -> int:
+        """Delete every cached report of a task (e.g. when it is purged); returns bytes freed"""
+        if not self._loaded:
+            self._load_index()
+        if task_id in self._pins:
+            # Left to the size limit's eviction once the download is over
+            return 0
+        task_dir = self.root / task_id
+        freed = sum(self.discard(path) for path in list(self._index) if path.parent == task_dir)
+        # Rendered by another worker process and not in this one's index
+        if task_dir.exists():
+            freed += sum(path.stat().st_size for path in task_dir.glob("*.pdf"))
+            shutil.rmtree(task_dir, ignore_errors=True)
+        return freed
+
+    def _lock(self, task_id: str) -> asyncio.Lock:
+        if task_id not in self._task_locks:
+            self._task_locks[task_id] = asyncio.Lock()
+        return self._task_locks[task_id]
+
+    async def get_report(self, results: Dict, name: str) -> Optional[Path]:
+        """Path of one student's report, rendering it if needed; None if no such report"""
+        result = next((r for r in results.get("individual_results", [])
+                       if (r.get("report_filename") or report_filename(r["student_name"])) == name), None)
+        if not result:
+            return None
+        async with self._lock(results["task_id"]):
+            await self._ensure_reports(results["task_id"], results, [result])
+        return self.root / results["task_id"] / name
+
+    async def get_reports_manifest(self, results: Dict) -> Path:
+        """Manifest of a task's full reports archive, rendering any missing reports first"""
+        task_id = results["task_id"]
+        async with self._lock(task_id):
+            rendered = await self._ensure_reports(task_id, results, results.get("individual_results", []))
+            manifest_path = self.root / task_id / MANIFEST_NAME
+            if rendered or not manifest_path.exists():
+                await asyncio.get_event_loop().run_in_executor(None, write_reports_manifest, manifest_path.parent)
+        return manifest_path
+
+
+# Initialize report cache instance
+report_cache = RenderedReportCache()
@@ -0,0 +1,220 @@
+# ScoreWise AI - Upload Retention and Disk Space Reclamation
+import os
+import time
+import shutil
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Assignment, Submission, User, TIER_CONFIGS
+from storage import storage
+from blob_store import blob_store
+from report_cache import report_cache
+from grading_worker import task_queue
+
+logger = logging.getLogger(__name__)
+
+STORAGE_GC_ENABLED = os.getenv("STORAGE_GC_ENABLED", "true").lower() == "true"
+GC_INTERVAL_SECONDS = int(os.getenv("STORAGE_GC_INTERVAL_MINUTES", "60")) * 60
+DEFAULT_RETENTION_DAYS = int(os.getenv("DEFAULT_RETENTION_DAYS", "30"))
+# Task directories without a live assignment (failed uploads, interrupted purges)
+ORPHAN_GRACE = timedelta(hours=int(os.getenv("ORPHAN_GRACE_HOURS", "24")))
+# Above the high-water mark, rendered reports are evicted until usage is back under the low-water mark
+DISK_HIGH_WATER = float(os.getenv("DISK_HIGH_WATER", "0.85"))
+DISK_LOW_WATER = float(os.getenv("DISK_LOW_WATER", "0.75"))
+
+
+class RetentionService:
+    """Scheduled garbage collection of task files.
+
+    - Tasks past their owner's tier retention lose their uploads and
+      reports, which can no longer be downloaded; scores and feedback stay
+      in the database without the paths of the deleted files.
+    - Under disk pressure, rendered reports are evicted least recently used
+      first. Only this node's copies are deleted: with shared storage they
+      are fetched again, otherwise re-rendered from the results on the next
+      download. Source PDFs are never evicted while the task is retained.
+    - Leftover task directories without a live assignment are removed and
+      their blob references released.
+    """
+
+    def __init__(self):
+        self.reclaimed_bytes = Counter()
+        self.runs = 0
+        self.last_run_at = None
+
+    def disk_usage_ratio(self) -> float:
+        usage = shutil.disk_usage(storage.root)
+        return usage.used / usage.total
+
+    async def purge_task(self, db: Session, assignment: Assignment) -> int:
+        """Delete a task's files and release its blobs; returns bytes freed"""
+        # Several nodes may collect at once; only the one that marks the task purges it
+        claimed = db.query(Assignment).filter(
+            Assignment.id == assignment.id, Assignment.files_purged_at.is_(None)
+        ).update({Assignment.files_purged_at: datetime.now(), Assignment.reports_manifest_path: None},
+                 synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return 0
+
+        # The results outlive the files, so they must not point at them
+        results = db.query(Assignment.results).filter(Assignment.id == assignment.id).scalar()
+        if results and results.get("individual_results"):
+            results = dict(results, individual_results=[
+                {key: value for key, value in result.items() if key != "file_path"}
+                for result in results["individual_results"]])
+            db.query(Assignment).filter(Assignment.id == assignment.id).update(
+                {Assignment.results: results}, synchronize_session=False)
+        db.query(Submission).filter(Submission.assignment_id == assignment.id).update(
+            {Submission.file_path: ""}, synchronize_session=False)
+        db.commit()
+
+        # References are released first, so a purge interrupted after this leaves nothing for remove_orphans to release
+        checksums = (task_queue.get_spec(db, assignment.id) or {}).get("file_checksums", {})
+        freed = blob_store.release_files(db, checksums)
+        freed += await storage.delete_dir(storage.root / assignment.id)
+        freed += report_cache.discard_task(assignment.id)
+        return freed
+
+    async def expire_tasks(self, db: Session) -> int:
+        """Purge tasks older than their owner's tier retention"""
+        freed = 0
+        now = datetime.now()
+        # One query per tier, so only tasks actually past their tier's retention are loaded;
+        # tiers without a config entry get the default retention
+        retention = [(User.subscription_tier == tier, config.get("retention_days", DEFAULT_RETENTION_DAYS))
+                     for tier, config in TIER_CONFIGS.items()]
+        retention.append((User.subscription_tier.notin_(list(TIER_CONFIGS)), DEFAULT_RETENTION_DAYS))
+
+        expired = []
+        for tier_filter, days in retention:
+            expired += db.query(Assignment).join(User).filter(
+                tier_filter,
+                Assignment.files_purged_at.is_(None),
+                Assignment.status != "processing",
+                Assignment.created_at < now - timedelta(days=days),
+            ).all()
+
+        for assignment in expired:
+            freed += await self.purge_task(db, assignment)
+
+        if expired:
+            logger.info(f"✓ Retention: purged {len(expired)} expired tasks, freed {freed // 1024} KB")
+        return freed
+
+    def _rendered_candidates(self, db: Session) -> List[Tuple[float, str, object]]:
+        """Evictable rendered reports with their last access time"""
+        candidates = []
+        for path, _ in report_cache.lru_entries():
+            try:
+                candidates.append((path.stat().st_mtime, "cached", path))
+            except FileNotFoundError:
+                continue
+
+        eager = db.query(Assignment).filter(
+            Assignment.status == "completed",
+            Assignment.files_purged_at.is_(None),
+            Assignment.reports_manifest_path.isnot(None),
+            Assignment.reports_manifest_path != "",
+        ).all()
+        for assignment in eager:
+            # The manifest is touched on every download
+            manifest_path = Path(assignment.reports_manifest_path)
+            if manifest_path.exists():
+                candidates.append((manifest_path.stat().st_mtime, "eager", assignment))
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        return candidates
+
+    async def evict_rendered(self, db: Session) -> int:
+        """Evict least recently used rendered reports while the disk is over the high-water mark"""
+        usage = shutil.disk_usage(storage.root)
+        if usage.used / usage.total < DISK_HIGH_WATER:
+            return 0
+
+        to_free = usage.used - int(usage.total * DISK_LOW_WATER)
+        logger.warning(f"⚠️ Disk at {usage.used / usage.total:.0%}, evicting rendered reports to free {to_free // (1024 * 1024)} MB")
+        freed = 0
+        for _, kind, item in self._rendered_candidates(db):
+            if freed >= to_free:
+                break
+            if kind == "cached":
+                freed += report_cache.discard(item)
+                continue
+
+            manifest_path = Path(item.reports_manifest_path)
+            if not storage.has_remote_copy:
+                # These were the only copies; without a manifest path the reports are rendered again on download
+                item.reports_manifest_path = None
+                db.commit()
+            if manifest_path.suffix == ".zip" and manifest_path.exists():
+                freed += manifest_path.stat().st_size
+                manifest_path.unlink(missing_ok=True)
+            freed += await storage.delete_local_dir(storage.root / item.id / "reports")
+
+        if freed < to_free:
+            logger.warning(f"⚠️ Only {freed // (1024 * 1024)} MB of rendered reports could be evicted")
+        return freed
+
+    async def remove_orphans(self, db: Session) -> int:
+        """Remove task directories whose assignment is gone or already purged"""
+        freed = 0
+        cutoff = time.time() - ORPHAN_GRACE.total_seconds()
+        task_dirs = [d for d in storage.root.iterdir()
+                     if d.is_dir() and not d.name.startswith(".") and d.stat().st_mtime < cutoff]
+        if not task_dirs:
+            return 0
+
+        live = {task_id for (task_id,) in db.query(Assignment.id).filter(
+            Assignment.id.in_([d.name for d in task_dirs]),
+            Assignment.files_purged_at.is_(None),
+        )}
+        purged = {task_id for (task_id,) in db.query(Assignment.id).filter(
+            Assignment.id.in_([d.name for d in task_dirs]),
+            Assignment.files_purged_at.isnot(None),
+        )}
+        for task_dir in task_dirs:
+            if task_dir.name in live:
+                continue
+            # A purge releases its task's references before deleting files; anything else still holds them
+            if task_dir.name not in purged:
+                freed += blob_store.release_files(db, blob_store.linked_files(task_dir))
+            freed += await storage.delete_dir(task_dir)
+        return freed
+
+    async def collect(self) -> Counter:
+        """Run one garbage collection pass; returns bytes reclaimed by reason"""
+        reclaimed = Counter()
+        db = SessionLocal()
+        try:
+            reclaimed["expired"] = await self.expire_tasks(db)
+            reclaimed["orphaned"] = await self.remove_orphans(db)
+            reclaimed["rendered"] = await self.evict_rendered(db)
+        finally:
+            db.close()
+
+        self.reclaimed_bytes.update(reclaimed)
+        self.runs += 1
+        self.last_run_at = time.time()
+        if sum(reclaimed.values()):
+            logger.info(f"✓ Storage GC reclaimed {sum(reclaimed.values()) // 1024} KB: {dict(reclaimed)}")
+        return reclaimed
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.error(f"✗ Storage GC failed: {str(e)}")
+            await asyncio.sleep(GC_INTERVAL_SECONDS)
+
+
+# Initialize retention service instance
+retention_service = RetentionService()
@@ -0,0 +1,164 @@
+# ScoreWise AI - Shared Task File Storage
+import os
+import shutil
+import asyncio
+import logging
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# "local" keeps task files only in uploads/; "s3" mirrors them to a bucket
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOADS_DIR = Path("uploads")
+
+
+def _dir_size(path: Path) -> int:
+    """Bytes freed by deleting path; files hard-linked into the blob store are freed when their blob is released"""
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file() and f.stat().st_nlink == 1)
+
+
+class LocalStorage:
+    """Task files in the local uploads/ directory.
+
+    Paths passed in are the usual uploads/<task_id>/... paths. With this
+    backend every node must see the same directory (one host or a shared
+    mount): publishing is a no-op and fetching only checks the file exists.
+    """
+
+    # Whether files deleted locally can be fetched again
+    has_remote_copy = False
+
+    def __init__(self, root: Path = UPLOADS_DIR):
+        self.root = Path(root)
+
+    async def publish(self, paths: Iterable):
+        """Make locally written files visible to other nodes"""
+
+    async def fetch(self, path) -> Path:
+        """Make sure a task file is present locally and return its path"""
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"{path} not found")
+        return path
+
+    async def fetch_dir(self, path) -> Path:
+        """Make sure every file under a task directory is present locally"""
+        return Path(path)
+
+    async def delete(self, path):
+        Path(path).unlink(missing_ok=True)
+
+    async def delete_local_dir(self, path) -> int:
+        """Remove only this node's copy of a directory; returns bytes freed"""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        freed = _dir_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        return freed
+
+    async def delete_dir(self, path) -> int:
+        """Remove a task directory everywhere; returns local bytes freed"""
+        return await self.delete_local_dir(path)
+
+
+class S3Storage(LocalStorage):
+    """Task files mirrored to an S3-compatible bucket (AWS S3, MinIO, ...).
+
+    uploads/ becomes a per-node working copy: files are uploaded once
+    written and downloaded by whichever node needs them. Task files are
+    written once, so a local copy never goes stale.
+    """
+
+    has_remote_copy = True
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, root: Path = UPLOADS_DIR):
+        super().__init__(root)
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        # Credentials and region come from the usual AWS_* environment variables
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    def key(self, path) -> str:
+        return self.prefix + Path(path).relative_to(self.root).as_posix()
+
+    async def _run(self, func, *args, **kwargs):
+        # boto3 is blocking; clients are safe to share between threads
+        return await asyncio.get_event_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+    def _is_missing(self, error) -> bool:
+        return getattr(error, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey")
+
+    async def publish(self, paths: Iterable):
+        for path in paths:
+            await self._run(self.client.upload_file, str(path), self.bucket, self.key(path))
+
+    def _download(self, key: str, path: Path):
+        """Download to a temp file next to path so readers never see a partial file"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            os.remove(tmp_path)
+            if self._is_missing(e):
+                raise FileNotFoundError(f"{key} not found in bucket {self.bucket}")
+            raise
+
+    async def fetch(self, path) -> Path:
+        path = Path(path)
+        if not path.exists():
+            await self._run(self._download, self.key(path), path)
+            logger.info(f"✓ Fetched {path} from storage")
+        return path
+
+    async def fetch_dir(self, path) -> Path:
+        path = Path(path)
+        prefix = self.key(path) + "/"
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = await self._run(lambda: list(paginator.paginate(Bucket=self.bucket, Prefix=prefix)))
+        for page in pages:
+            for obj in page.get("Contents", []):
+                local_path = path / obj["Key"][len(prefix):]
+                if not local_path.exists() or local_path.stat().st_size != obj["Size"]:
+                    await self._run(self._download, obj["Key"], local_path)
+        return path
+
+    async def delete(self, path):
+        await super().delete(path)
+        await self._run(self.client.delete_object, Bucket=self.bucket, Key=self.key(path))
+
+    async def delete_dir(self, path) -> int:
+        freed = await super().delete_dir(path)
+        prefix = self.key(path) + "/"
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = await self._run(lambda: list(paginator.paginate(Bucket=self.bucket, Prefix=prefix)))
+        for page in pages:
+            objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if objects:
+                # A page holds at most 1000 keys, the delete_objects limit
+                await self._run(self.client.delete_objects, Bucket=self.bucket,
+                                Delete={"Objects": objects, "Quiet": True})
+        return freed
+
+
+def create_storage() -> LocalStorage:
+    if STORAGE_BACKEND == "s3":
+        logger.info("✓ Using S3 task storage")
+        return S3Storage(os.getenv("S3_BUCKET", ""), os.getenv("S3_PREFIX", ""), os.getenv("S3_ENDPOINT_URL"))
+    return LocalStorage()
+
+
+# Initialize storage instance
+storage = create_storage()
@@ -1,16 +1,22 @@
 # ScoreWise AI - Subscription Management Service
 import os
+import time
+import uuid
 import stripe
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, List, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, case, func, update
+from sqlalchemy.exc import IntegrityError
 
 from models import (
-    User, Assignment, UsageRecord, SubscriptionEvent, 
+    User, Assignment, UsageRecord, SubscriptionEvent, BillingOutbox,
     SubscriptionTier, SubscriptionStatus, TIER_CONFIGS
 )
+from usage_writer import usage_writer, usage_record_id
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,89 +32,148 @@ OVERAGE_PRICE_IDS = {
     'institution': os.getenv('PRICE_ID_INSTITUTION_OVERAGE'),
 }
 
+# Every subject offered on the plans whose config lists "all"
+ALL_SUBJECTS = (
+    "algebra", "biology", "calculus", "chemistry", "engineering", "physics",
+    "english_literature", "history", "philosophy", "creative_writing",
+    "psychology", "economics", "sociology", "political_science",
+    "music_theory", "art_history", "creative_arts", "drama",
+    "spanish", "french", "german", "chinese", "japanese"
+)
+
+# Entitlement snapshots are reused for this long in each process. Billing changes reach every process
+# within this time; only the process that applies a webhook drops its snapshot at once.
+ENTITLEMENT_TTL_SECONDS = float(os.getenv("ENTITLEMENT_TTL_SECONDS", "30"))
+ENTITLEMENT_CACHE_SIZE = int(os.getenv("ENTITLEMENT_CACHE_SIZE", "10000"))
+
 class SubscriptionService:
     """Service for managing user subscriptions and enforcing tier limits"""
     
     def __init__(self):
         self.tier_configs = TIER_CONFIGS
+        self._entitlements = OrderedDict()  # user_id -> (expires_at, snapshot)
+        self._entitlements_lock = threading.Lock()
     
-    def get_user_tier_config(self, user: User) -> Dict[str, Any]:
-        """Get the configuration for a user's current tier"""
-        return self.tier_configs.get(user.subscription_tier, self.tier_configs[SubscriptionTier.TRIAL.value])
+    def get_entitlements(self, user_id: str, db: Session) -> Optional[Dict[str, Any]]:
+        """Cached entitlement snapshot for a user id; None if the user no longer exists"""
+        snapshot = self._cached_entitlements(user_id)
+        if snapshot:
+            return snapshot
+        
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            self.invalidate_entitlements(user_id)
+            return None
+        return self.entitlements_for(user)
     
-    def has_feature_access(self, user: User, feature_name: str) -> bool:
-        """Check if user has access to a specific feature"""
+    def entitlements_for(self, user: User) -> Dict[str, Any]:
+        """Entitlement snapshot for a loaded user: tier, status, limits, features and beta state.
+
+        A cached snapshot is reused while it matches the row's tier and status,
+        so the tier config and the beta profile are read at most once per TTL.
+        """
+        snapshot = self._cached_entitlements(user.id)
+        if snapshot and snapshot["tier"] == user.subscription_tier and snapshot["status"] == user.subscription_status:
+            return snapshot
+        
+        snapshot = self._build_entitlements(user)
+        with self._entitlements_lock:
+            self._entitlements[user.id] = (time.monotonic() + ENTITLEMENT_TTL_SECONDS, snapshot)
+            self._entitlements.move_to_end(user.id)
+            while len(self._entitlements) > ENTITLEMENT_CACHE_SIZE:
+                self._entitlements.popitem(last=False)
+        return snapshot
+    
+    def invalidate_entitlements(self, user_id: str) -> None:
+        """Drop a user's snapshot in this process only; other processes see the change within ENTITLEMENT_TTL_SECONDS"""
+        with self._entitlements_lock:
+            self._entitlements.pop(user_id, None)
+    
+    def _cached_entitlements(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._entitlements_lock:
+            entry = self._entitlements.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+        return None
+    
+    def _build_entitlements(self, user: User) -> Dict[str, Any]:
         config = self.get_user_tier_config(user)
-        features = config.get("features", {})
         
-        if feature_name not in features:
-            return False
-            
-        feature_value = features[feature_name]
+        features = {}
+        for feature_name, feature_value in config.get("features", {}).items():
+            # Boolean features, or string levels (like analytics) where "none" means no access
+            if isinstance(feature_value, bool):
+                features[feature_name] = feature_value
+            else:
+                features[feature_name] = isinstance(feature_value, str) and feature_value not in ("none", "")
         
-        # Handle boolean features
-        if isinstance(feature_value, bool):
-            return feature_value
-        
-        # Handle string features (like analytics levels)
-        if isinstance(feature_value, str):
-            return feature_value != "none" and feature_value != ""
+        subjects = config.get("subjects", [])
+        if subjects == "all":
+            subjects = list(ALL_SUBJECTS)
         
-        return False
+        beta_profile = user.beta_profile
+        return {
+            "user_id": user.id,
+            "tier": user.subscription_tier,
+            "status": user.subscription_status,
+            "trial_end": user.trial_end,
+            "plan_name": config["name"],
+            "monthly_assignment_limit": self._parse_limit(config.get("assignments_per_month", 0)),
+            "submissions_per_assignment_limit": self._parse_limit(config.get("submissions_per_assignment", 0)),
+            "allowed_subjects": tuple(subjects) if isinstance(subjects, list) else (),
+            "features": features,
+            "beta_access_expires": beta_profile.access_expires if beta_profile else None,
+        }
     
-    def get_monthly_assignment_limit(self, user: User) -> int:
-        """Get the monthly assignment limit for a user"""
-        config = self.get_user_tier_config(user)
-        limit = config.get("assignments_per_month", 0)
-        
+    def _parse_limit(self, limit: Any):
         if limit == "unlimited":
             return float('inf')
-        
         return int(limit)
     
+    def get_user_tier_config(self, user: User) -> Dict[str, Any]:
+        """Get the configuration for a user's current tier"""
+        return self.tier_configs.get(user.subscription_tier, self.tier_configs[SubscriptionTier.TRIAL.value])
+    
+    def has_feature_access(self, user: User, feature_name: str) -> bool:
+        """Check if user has access to a specific feature"""
+        return self.entitlements_for(user)["features"].get(feature_name, False)
+    
+    def get_monthly_assignment_limit(self, user: User) -> int:
+        """Get the monthly assignment limit for a user"""
+        return self.entitlements_for(user)["monthly_assignment_limit"]
+    
     def get_submissions_per_assignment_limit(self, user: User) -> int:
         """Get the submissions per assignment limit for a user"""
-        config = self.get_user_tier_config(user)
-        limit = config.get("submissions_per_assignment", 0)
-        
-        if limit == "unlimited":
-            return float('inf')
-        
-        return int(limit)
+        return self.entitlements_for(user)["submissions_per_assignment_limit"]
     
     def get_allowed_subjects(self, user: User) -> List[str]:
         """Get the list of subjects a user can access"""
-        config = self.get_user_tier_config(user)
-        subjects = config.get("subjects", [])
-        
-        if subjects == "all":
-            # Return all available subjects
-            return [
-                "algebra", "biology", "calculus", "chemistry", "engineering", "physics",
-                "english_literature", "history", "philosophy", "creative_writing",
-                "psychology", "economics", "sociology", "political_science",
-                "music_theory", "art_history", "creative_arts", "drama",
-                "spanish", "french", "german", "chinese", "japanese"
-            ]
-        
-        return subjects if isinstance(subjects, list) else []
+        return list(self.entitlements_for(user)["allowed_subjects"])
     
     def can_create_assignment(self, user: User, db: Session) -> tuple[bool, str]:
-        """Check if user can create a new assignment this month"""
-        # Reset usage counter if month has changed
-        self._reset_monthly_usage_if_needed(user, db)
-        
+        """Check if user can create a new assignment this month (read-only; reserve_assignment enforces it)"""
         monthly_limit = self.get_monthly_assignment_limit(user)
         
         if monthly_limit == float('inf'):
             return True, ""
         
-        if user.assignments_this_month >= monthly_limit:
-            config = self.get_user_tier_config(user)
-            return False, f"Monthly assignment limit of {monthly_limit} reached for {config['name']} plan. Please upgrade to continue."
+        if self.get_assignments_used(user) >= monthly_limit:
+            return False, self._limit_reached_message(user, monthly_limit)
         
         return True, ""
     
+    def _limit_reached_message(self, user: User, monthly_limit: int) -> str:
+        plan_name = self.entitlements_for(user)["plan_name"]
+        return f"Monthly assignment limit of {monthly_limit} reached for {plan_name} plan. Please upgrade to continue."
+    
+    def get_assignments_used(self, user: User) -> int:
+        """Assignments counted this month; a counter left from an earlier month reads as 0"""
+        reset_date = user.usage_reset_date
+        now = datetime.now()
+        if not reset_date or (reset_date.year, reset_date.month) != (now.year, now.month):
+            return 0
+        return user.assignments_this_month or 0
+    
     def can_process_submissions(self, user: User, submission_count: int) -> tuple[bool, str]:
         """Check if user can process the given number of submissions"""
         submissions_limit = self.get_submissions_per_assignment_limit(user)
@@ -117,8 +182,8 @@ class SubscriptionService:
             return True, ""
         
         if submission_count > submissions_limit:
-            config = self.get_user_tier_config(user)
-            return False, f"Submission limit of {submissions_limit} per assignment exceeded for {config['name']} plan. You submitted {submission_count} files."
+            plan_name = self.entitlements_for(user)["plan_name"]
+            return False, f"Submission limit of {submissions_limit} per assignment exceeded for {plan_name} plan. You submitted {submission_count} files."
         
         return True, ""
     
@@ -129,111 +194,110 @@ class SubscriptionService:
         if subject in allowed_subjects:
             return True, ""
         
-        config = self.get_user_tier_config(user)
-        if config['name'] == "Free Trial":
+        plan_name = self.entitlements_for(user)["plan_name"]
+        if plan_name == "Free Trial":
             return False, "Subject access limited to STEM subjects in Free Trial. Please upgrade to access all subjects."
         
-        return False, f"Subject '{subject}' not available in {config['name']} plan."
+        return False, f"Subject '{subject}' not available in {plan_name} plan."
     
-    def increment_assignment_usage(self, user: User, db: Session) -> None:
-        """Increment usage counter and create overage if limit exceeded."""
-        self._reset_monthly_usage_if_needed(user, db)
+    def reserve_assignment(self, user: User, db: Session) -> tuple[bool, str]:
+        """Count a new assignment against the monthly limit; the caller commits.
 
-        user.assignments_this_month += 1
-        db.commit()
+        One conditional UPDATE ... RETURNING starts a new month's count and
+        enforces the limit, so parallel uploads on any number of workers can
+        neither exceed it nor lose counts. The usage record is committed
+        with it.
+        """
+        now = datetime.now()
+        new_month = User.usage_reset_date < now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        limit = self.get_monthly_assignment_limit(user)
+        
+        conditions = [User.id == user.id]
+        if limit != float('inf'):
+            conditions.append(new_month | (User.assignments_this_month < limit))
+        
+        used = db.execute(
+            update(User).where(*conditions).values(
+                assignments_this_month=case((new_month, 1), else_=User.assignments_this_month + 1),
+                usage_reset_date=case((new_month, now), else_=User.usage_reset_date),
+            ).returning(User.assignments_this_month).execution_options(synchronize_session=False)
+        ).scalar()
+        db.expire(user, ["assignments_this_month", "usage_reset_date", "data_version"])
+        if used is None:
+            return False, self._limit_reached_message(user, limit)
 
         # Always record the creation event
-        self.record_usage(user, "assignment_created", db)
-
-        # Check for overage
-        limit = self.get_monthly_assignment_limit(user)
-        if limit != float('inf') and user.assignments_this_month > limit:
-            self._charge_assignment_overage(user, db, extra_qty=1)
-            logger.info(f"⚠️ User {user.email} exceeded assignment limit ({user.assignments_this_month}/{limit})")
+        db.add(self._usage_record(user, "assignment_created"))
+        return True, ""
  
-    def record_usage(self, user: User, event_type: str, db: Session, 
-                    resource_used: Optional[str] = None, quantity: int = 1, 
-                    metadata: Optional[Dict] = None) -> None:
-        """Record a usage event"""
-        usage_record = UsageRecord(
-            id=f"usage_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{user.id}_{event_type}",
+    def _usage_record(self, user: User, event_type: str, resource_used: Optional[str] = None,
+                      quantity: int = 1, metadata: Optional[Dict] = None) -> UsageRecord:
+        return UsageRecord(
+            id=usage_record_id(user.id, event_type),
             user_id=user.id,
             event_type=event_type,
             resource_used=resource_used,
             quantity=quantity,
             tier_at_time=user.subscription_tier,
-            metadata=metadata or {}
+            usage_metadata=metadata or {}
         )
-        
-        db.add(usage_record)
-        db.commit()
     
-    def _reset_monthly_usage_if_needed(self, user: User, db: Session) -> None:
-        """Reset monthly usage counters if the month has changed"""
-        now = datetime.now()
-        
-        # Check if we need to reset (different month or year)
-        if (user.usage_reset_date.month != now.month or 
-            user.usage_reset_date.year != now.year):
-            
-            user.assignments_this_month = 0
-            user.usage_reset_date = now
-            db.commit()
-
+    def record_usage(self, user: User, event_type: str, db: Session, 
+                    resource_used: Optional[str] = None, quantity: int = 1, 
+                    metadata: Optional[Dict] = None) -> None:
+        """Record a usage event; buffered and written in batches by the usage writer"""
+        usage_writer.add({
+            "user_id": user.id,
+            "event_type": event_type,
+            "resource_used": resource_used,
+            "quantity": quantity,
+            "billable": True,
+            "tier_at_time": user.subscription_tier,
+            "usage_metadata": metadata or {},
+        })
+    
     def _charge_assignment_overage(self, user: User, db: Session, extra_qty: int) -> None:
-        """Create UsageRecord + Stripe invoice item for assignment overages."""
+        """Create UsageRecord + outbox entry for the Stripe invoice item of assignment overages; the caller commits.
+
+        Not reached from reserve_assignment, which stops every limited tier at its monthly limit.
+        """
         cfg = self.get_user_tier_config(user)
         price = cfg.get("overage_price_per_assignment", 0)
         if price == 0 or extra_qty <= 0:
             return  # nothing to charge
 
-        subtotal = round(price * extra_qty, 2)
-
-        # 1. Create a usage record
-        self.record_usage(
+        # 1. Create a usage record with pricing info
+        usage_record = self._usage_record(
             user, event_type="assignment_overage",
-            db=db,
-            resource_used=None,
             quantity=extra_qty,
             metadata={"unit_price": price},
         )
-    
-        # 2. Update the usage record with pricing info
-        latest_record = db.query(UsageRecord).filter(
-            UsageRecord.user_id == user.id,
-            UsageRecord.event_type == "assignment_overage"
-        ).order_by(UsageRecord.timestamp.desc()).first()
-    
-        if latest_record:
-            latest_record.unit_price = price
-            latest_record.subtotal = subtotal
-            db.commit()
+        usage_record.unit_price = price
+        usage_record.subtotal = round(price * extra_qty, 2)
+        db.add(usage_record)
 
-        # 3. Bill through Stripe using price ID (more reliable)
+        # 2. Queue the Stripe invoice item (by price ID) for the billing dispatcher
         if user.stripe_customer_id and user.subscription_tier in OVERAGE_PRICE_IDS:
-            try:
-                price_id = OVERAGE_PRICE_IDS[user.subscription_tier]
-                if price_id:
-                    stripe.InvoiceItem.create(
-                        customer=user.stripe_customer_id,
-                        price=price_id,
-                        quantity=extra_qty
-                    )
-                    logger.info(f"✓ Created Stripe invoice item: {extra_qty} overage(s) for {user.subscription_tier}")
-                else:
-                    logger.warning(f"No overage price ID configured for tier: {user.subscription_tier}")
-            except Exception as e:
-                logger.error(f"Failed to create Stripe invoice item: {str(e)}")
+            price_id = OVERAGE_PRICE_IDS[user.subscription_tier]
+            if price_id:
+                db.add(BillingOutbox(
+                    id=str(uuid.uuid4()),
+                    user_id=user.id,
+                    usage_record_id=usage_record.id,
+                    stripe_customer_id=user.stripe_customer_id,
+                    stripe_price_id=price_id,
+                    quantity=extra_qty
+                ))
+            else:
+                logger.warning(f"No overage price ID configured for tier: {user.subscription_tier}")
     
     def get_usage_summary(self, user: Any, db: Any) -> Dict[str, Any]:
         """Get user's current usage summary with overage information"""
-        self._reset_monthly_usage_if_needed(user, db)
-
         config = self.get_user_tier_config(user)
 
         # Calculate remaining assignments
         monthly_limit = self.get_monthly_assignment_limit(user)
-        assignments_used = getattr(user, 'assignments_this_month', 0)
+        assignments_used = self.get_assignments_used(user)
 
         if monthly_limit == float('inf'):
             assignments_remaining = "Unlimited"
@@ -254,8 +318,11 @@ class SubscriptionService:
         if submissions_limit == float('inf'):
             submissions_limit_display = "Unlimited"
 
-        assignments = db.query(Assignment).filter(Assignment.user_id == user.id).all()
-        submissions_processed = sum(getattr(a, 'submissions_count', 0) for a in assignments if a.status == "completed")
+        # One indexed aggregate (idx_assignments_user_status_created); callers cache the summary per data version
+        submissions_processed = db.query(func.coalesce(func.sum(Assignment.submissions_count), 0)).filter(
+            Assignment.user_id == user.id,
+            Assignment.status == "completed"
+        ).scalar()
 
         # Calculate days remaining and period_end as a string
         days_remaining = 0
@@ -379,48 +446,49 @@ class SubscriptionService:
             logger.error(f"Error creating customer portal session: {str(e)}")
             raise
     
-    def handle_subscription_webhook(self, event: Dict[str, Any], db: Session) -> bool:
-        """Handle subscription-related webhook events from Stripe"""
+    def record_webhook_event(self, event: Dict[str, Any], db: Session) -> bool:
+        """Store a verified Stripe event for the webhook processor; False if it was already received"""
+        customer = event["data"]["object"].get("customer")
+        if isinstance(customer, dict):
+            customer = customer.get("id")
+        
+        subscription_event = SubscriptionEvent(
+            id=f"evt_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{event['id']}",
+            stripe_event_id=event["id"],
+            event_type=event["type"],
+            stripe_customer_id=customer,
+            payload=event,
+            stripe_created=datetime.fromtimestamp(event["created"]),
+            processed=False
+        )
+        
+        db.add(subscription_event)
         try:
-            event_type = event["type"]
-            event_data = event["data"]["object"]
-            
-            # Record the event
-            subscription_event = SubscriptionEvent(
-                id=f"evt_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{event['id']}",
-                stripe_event_id=event["id"],
-                event_type=event_type,
-                stripe_created=datetime.fromtimestamp(event["created"]),
-                processed=False
-            )
-            
-            db.add(subscription_event)
             db.commit()
-            
-            # Handle different event types
-            if event_type == "customer.subscription.created":
-                return self._handle_subscription_created(event_data, subscription_event, db)
-            elif event_type == "customer.subscription.updated":
-                return self._handle_subscription_updated(event_data, subscription_event, db)
-            elif event_type == "customer.subscription.deleted":
-                return self._handle_subscription_deleted(event_data, subscription_event, db)
-            elif event_type == "invoice.payment_succeeded":
-                return self._handle_payment_succeeded(event_data, subscription_event, db)
-            elif event_type == "invoice.payment_failed":
-                return self._handle_payment_failed(event_data, subscription_event, db)
-            
-            subscription_event.processed = True
-            subscription_event.processed_at = datetime.now()
-            db.commit()
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error handling webhook: {str(e)}")
-            if 'subscription_event' in locals():
-                subscription_event.error_message = str(e)
-                db.commit()
+        except IntegrityError:
+            # Stripe redelivered an event we already have
+            db.rollback()
             return False
+        return True
+    
+    def apply_webhook_event(self, subscription_event: SubscriptionEvent, db: Session) -> bool:
+        """Apply a stored Stripe event; the caller commits. False if it can't be applied yet (unknown user or price)."""
+        event_type = subscription_event.event_type
+        event_data = subscription_event.payload["data"]["object"]
+        
+        # Handle different event types
+        if event_type == "customer.subscription.created":
+            return self._handle_subscription_created(event_data, subscription_event, db)
+        elif event_type == "customer.subscription.updated":
+            return self._handle_subscription_updated(event_data, subscription_event, db)
+        elif event_type == "customer.subscription.deleted":
+            return self._handle_subscription_deleted(event_data, subscription_event, db)
+        elif event_type == "invoice.payment_succeeded":
+            return self._handle_payment_succeeded(event_data, subscription_event, db)
+        elif event_type == "invoice.payment_failed":
+            return self._handle_payment_failed(event_data, subscription_event, db)
+        
+        return True
     
     def _handle_subscription_created(self, subscription_data: Dict, event: SubscriptionEvent, db: Session) -> bool:
         """Handle subscription creation"""
@@ -454,8 +522,6 @@ class SubscriptionService:
         event.new_tier = tier
         event.new_status = subscription_data["status"]
         
-        db.commit()
-        
         logger.info(f"✓ Subscription created for user {user.id}: {tier}")
         return True
     
@@ -489,8 +555,6 @@ class SubscriptionService:
         event.old_status = old_status
         event.new_status = subscription_data["status"]
         
-        db.commit()
-        
         logger.info(f"✓ Subscription updated for user {user.id}: {user.subscription_tier} ({user.subscription_status})")
         return True
     
@@ -520,8 +584,6 @@ class SubscriptionService:
         event.old_status = old_status
         event.new_status = SubscriptionStatus.CANCELED.value
         
-        db.commit()
-        
         logger.info(f"✓ Subscription canceled for user {user.id}")
         return True
     
@@ -538,7 +600,6 @@ class SubscriptionService:
         # Ensure subscription is active
         if user.subscription_status != SubscriptionStatus.ACTIVE.value:
             user.subscription_status = SubscriptionStatus.ACTIVE.value
-            db.commit()
         
         event.user_id = user.id
         logger.info(f"✓ Payment succeeded for user {user.id}")
@@ -561,8 +622,6 @@ class SubscriptionService:
         event.old_status = old_status
         event.new_status = SubscriptionStatus.PAST_DUE.value
         
-        db.commit()
-        
         logger.warning(f"⚠️ Payment failed for user {user.id}")
         return True
     
@@ -578,18 +637,13 @@ class SubscriptionService:
 
     def is_beta_tester(self, user: User, db: Session) -> bool:
         """Check if user is a beta tester"""
-        if user.subscription_tier == "beta":
+        snapshot = self.entitlements_for(user)
+        if snapshot["tier"] == "beta":
             return True
     
-        from models import BetaTester
-        beta_profile = db.query(BetaTester).filter(BetaTester.user_id == user.id).first()
-    
-        if beta_profile:
-            # Check if beta access hasn't expired
-            if beta_profile.access_expires and beta_profile.access_expires > datetime.now():
-                return True
-    
-        return False
+        # Check if beta access hasn't expired
+        access_expires = snapshot["beta_access_expires"]
+        return bool(access_expires and access_expires > datetime.now())
 
     def get_beta_features(self, user: User, db: Session) -> Dict[str, Any]:
         """Get special beta features for beta testers"""
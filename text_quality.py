@@ -0,0 +1,75 @@
+# ScoreWise AI - Text Quality Analysis and OCR Normalization
+import re
+from typing import Dict, Any
+
+# Precompiled patterns for the quality indicators. Letter runs feed both the
+# isolated-letter indicator and the dictionary check, and combining marks are
+# counted on the (short) list of special characters instead of the whole text.
+# These are separate regex passes on purpose: a single finditer scan is slower
+# in CPython (see benchmarks/bench_text_quality.py).
+_LETTER_RUN = re.compile(r"(?<!\w)[a-zA-Z]+(?!\w)")  # same matches as \b[a-zA-Z]+\b
+_SPECIAL_CHAR = re.compile(r"[^\w\s\.\,\!\?\-\(\)\'\":;]")
+_CONSONANT_CLUSTER = re.compile(r"[bcdfghjklmnpqrstvwxyzBCDFGHJKLMNPQRSTVWXYZ]{4,}")
+_UNUSUAL_CHAR = re.compile(r"[\u0300-\u036f\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+# OCR normalization table: sub/superscript digits folded to plain text, then
+# sentence breaks. Chained str.replace; str.translate cannot map the two-character
+# breaks, and a single regex with a replacement callback measured several times slower.
+_OCR_REPLACEMENTS = (
+    ("\u2081", "1"), ("\u2082", "2"), ("\u207b", "-"),
+    ("\u2076", "6"), ("\u2079", "9"), ("\u00b2", "^2"),
+    (". ", ".\n"), ("? ", "?\n"), (": ", ":\n"),
+)
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+
+def clean_ocr_text(content: str) -> str:
+    """Normalize OCR transcript text: fold special digits, break sentences, collapse blank lines"""
+    for old, new in _OCR_REPLACEMENTS:
+        content = content.replace(old, new)
+    content = _BLANK_LINES.sub("\n\n", content)
+    return content.strip()
+
+
+class TextQualityAnalyzer:
+    """Computes the text quality indicators used by the OCR decision"""
+
+    def __init__(self, word_index):
+        self.word_index = word_index
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """Return garbled ratio, valid word ratio and counts for a text sample"""
+        letter_runs = _LETTER_RUN.findall(text)
+        words = [w for w in letter_runs if len(w) > 1]
+
+        if words:
+            valid = self.word_index.count_valid([w.lower() for w in words])
+            valid_word_ratio = valid / len(words)
+        else:
+            valid_word_ratio = 0.0
+
+        token_count = len(text.split())
+        if len(text) < 10:
+            garbled_ratio = 1.0  # Very short or empty text should use OCR
+        else:
+            total_chars = len(text)
+            per_token = max(token_count, 1)
+            specials = _SPECIAL_CHAR.findall(text)
+            unusual_count = len(_UNUSUAL_CHAR.findall("".join(specials))) if specials else 0
+            cluster_count = len(_CONSONANT_CLUSTER.findall(text))
+            isolated_count = len(letter_runs) - len(words)
+
+            # Same weights as the original indicators: special 5x, clusters 3x,
+            # isolated letters 2x, combining marks 10x, averaged over 4 indicators
+            garbled_indicators = min(len(specials) / total_chars * 5, 1.0)
+            garbled_indicators += min(cluster_count / per_token * 3, 1.0)
+            garbled_indicators += min(isolated_count / per_token * 2, 1.0)
+            garbled_indicators += min(unusual_count / total_chars * 10, 1.0)
+            garbled_ratio = min(garbled_indicators / 4, 1.0)
+
+        return {
+            "garbled_ratio": garbled_ratio,
+            "valid_word_ratio": valid_word_ratio,
+            "word_count": len(words),
+            "token_count": token_count,
+        }
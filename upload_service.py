@@ -0,0 +1,236 @@
+# ScoreWise AI - Streaming Upload Ingestion
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import AsyncIterator, Dict, Iterator, List, Tuple, Any
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Upload limits (override in .env)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1 * MB)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_MB", "25")) * MB
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_MB", "600")) * MB
+UPLOAD_WRITE_CONCURRENCY = int(os.getenv("UPLOAD_WRITE_CONCURRENCY", "4"))
+
+# Bulk ZIP limits (zip-bomb protection)
+MAX_ZIP_ENTRIES = int(os.getenv("MAX_ZIP_ENTRIES", "1000"))
+MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv("MAX_ZIP_UNCOMPRESSED_MB", "2000")) * MB
+MAX_ZIP_COMPRESSION_RATIO = int(os.getenv("MAX_ZIP_COMPRESSION_RATIO", "100"))
+
+
+class UploadLimitExceeded(Exception):
+    """Raised when a file or a whole upload request is over its size limit"""
+
+
+class UploadBudget:
+    """Tracks bytes written across every file of one upload request"""
+
+    def __init__(self, max_request_bytes: int = MAX_UPLOAD_REQUEST_BYTES,
+                 max_file_bytes: int = MAX_UPLOAD_FILE_BYTES):
+        self.max_request_bytes = max_request_bytes
+        self.max_file_bytes = max_file_bytes
+        self.used = 0
+
+    def check_declared_sizes(self, uploads: List[Any], archives: List[Any] = ()) -> None:
+        """Reject oversized files before anything is written, using the sizes the parser recorded.
+
+        Archives are only bounded by the request limit; their members are checked when extracted.
+        """
+        declared_total = 0
+        for upload in list(uploads) + list(archives):
+            size = getattr(upload, "size", None)
+            if size is None:
+                continue
+            if size > self.max_file_bytes and upload not in archives:
+                raise UploadLimitExceeded(
+                    f"'{upload.filename}' is larger than the {self.max_file_bytes // MB} MB per-file limit")
+            declared_total += size
+        if declared_total > self.max_request_bytes:
+            raise UploadLimitExceeded(
+                f"Upload is larger than the {self.max_request_bytes // MB} MB per-request limit")
+
+    def consume(self, filename: str, file_bytes: int, chunk_bytes: int, max_file_bytes: int = None) -> None:
+        """Account for a chunk that is about to be written"""
+        max_file_bytes = max_file_bytes or self.max_file_bytes
+        if file_bytes > max_file_bytes:
+            raise UploadLimitExceeded(
+                f"'{filename}' is larger than the {max_file_bytes // MB} MB per-file limit")
+        self.used += chunk_bytes
+        if self.used > self.max_request_bytes:
+            raise UploadLimitExceeded(
+                f"Upload is larger than the {self.max_request_bytes // MB} MB per-request limit")
+
+
+async def save_upload_file(upload: Any, dest_path: Path, budget: UploadBudget,
+                           max_file_bytes: int = None) -> Dict[str, Any]:
+    """Stream an uploaded file to disk in fixed-size chunks, hashing it on the way.
+
+    max_file_bytes overrides the budget's per-file limit, e.g. for an archive.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    loop = asyncio.get_event_loop()
+
+    try:
+        async with aiofiles.open(dest_path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                budget.consume(upload.filename, size, len(chunk), max_file_bytes)
+                # hashlib releases the GIL on large buffers, so hash off the event loop
+                await loop.run_in_executor(None, hasher.update, chunk)
+                await f.write(chunk)
+    except BaseException:
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+        raise
+
+    return {"path": str(dest_path), "sha256": hasher.hexdigest(), "size": size}
+
+
+async def save_upload_files(files: List[Tuple[Any, Path]], budget: UploadBudget,
+                            concurrency: int = UPLOAD_WRITE_CONCURRENCY) -> List[Dict[str, Any]]:
+    """Write several uploads concurrently (bounded), preserving input order in the result"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _save(upload, dest_path):
+        async with semaphore:
+            return await save_upload_file(upload, dest_path, budget)
+
+    tasks = [asyncio.ensure_future(_save(upload, path)) for upload, path in files]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        # Stop the remaining writers so nothing keeps writing into a rejected upload
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def _submission_entries(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """PDF members of a submissions archive, ignoring folders and macOS metadata"""
+    entries = []
+    for info in archive.infolist():
+        name = PurePosixPath(info.filename.replace("\\", "/"))
+        if info.is_dir() or "__MACOSX" in name.parts or name.name.startswith("."):
+            continue
+        if name.name.lower().endswith(".pdf"):
+            entries.append(info)
+    return entries
+
+
+def inspect_submissions_zip(zip_path: Path) -> List[str]:
+    """Validate a submissions archive from its central directory and return the PDF member names.
+
+    Raises UploadLimitExceeded for archives over the entry, size or ratio limits
+    and zipfile.BadZipFile for archives that cannot be read.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        infos = archive.infolist()
+        if len(infos) > MAX_ZIP_ENTRIES:
+            raise UploadLimitExceeded(f"ZIP archive has more than {MAX_ZIP_ENTRIES} entries")
+
+        entries = _submission_entries(archive)
+        declared_total = 0
+        for info in entries:
+            if info.flag_bits & 0x1:
+                raise UploadLimitExceeded(f"'{info.filename}' is encrypted")
+            if info.file_size > MAX_UPLOAD_FILE_BYTES:
+                raise UploadLimitExceeded(
+                    f"'{info.filename}' is larger than the {MAX_UPLOAD_FILE_BYTES // MB} MB per-file limit")
+            if info.file_size > max(info.compress_size, 1) * MAX_ZIP_COMPRESSION_RATIO:
+                raise UploadLimitExceeded(f"'{info.filename}' has a suspicious compression ratio")
+            declared_total += info.file_size
+        if declared_total > MAX_ZIP_UNCOMPRESSED_BYTES:
+            raise UploadLimitExceeded(
+                f"ZIP archive expands to more than {MAX_ZIP_UNCOMPRESSED_BYTES // MB} MB")
+
+        return [info.filename for info in entries]
+
+
+def _extract_submission_entries(zip_path: Path, dest_dir: Path, stop: threading.Event) -> Iterator[str]:
+    """Extract PDF members one at a time in fixed-size chunks, counting the bytes actually inflated"""
+    extracted_total = 0
+    with zipfile.ZipFile(zip_path) as archive:
+        for i, info in enumerate(_submission_entries(archive)):
+            filename = PurePosixPath(info.filename.replace("\\", "/")).name
+            dest_path = dest_dir / f"submission_{i+1}_{filename}"
+            written = 0
+            complete = False
+            try:
+                with archive.open(info) as src, open(dest_path, "wb") as dst:
+                    while not stop.is_set():
+                        chunk = src.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            complete = True
+                            break
+                        written += len(chunk)
+                        extracted_total += len(chunk)
+                        # Header sizes can lie, so the limits are enforced on real output
+                        if written > MAX_UPLOAD_FILE_BYTES or written > max(info.compress_size, 1) * MAX_ZIP_COMPRESSION_RATIO:
+                            raise UploadLimitExceeded(f"'{info.filename}' expands beyond the allowed size")
+                        if extracted_total > MAX_ZIP_UNCOMPRESSED_BYTES:
+                            raise UploadLimitExceeded(
+                                f"ZIP archive expands to more than {MAX_ZIP_UNCOMPRESSED_BYTES // MB} MB")
+                        dst.write(chunk)
+            except BaseException:
+                try:
+                    os.remove(dest_path)
+                except OSError:
+                    pass
+                raise
+
+            if not complete:
+                # Stopped part-way through this member
+                try:
+                    os.remove(dest_path)
+                except OSError:
+                    pass
+                return
+            yield str(dest_path)
+
+
+async def extract_submissions_zip(zip_path: Path, dest_dir: Path) -> AsyncIterator[str]:
+    """Yield extracted submission paths as soon as each one is on disk.
+
+    Extraction runs in a worker thread, so grading can start on the first
+    submissions while the rest of the archive is still being unpacked.
+    """
+    loop = asyncio.get_event_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+    stop = threading.Event()
+
+    def _extract():
+        try:
+            for path in _extract_submission_entries(Path(zip_path), Path(dest_dir), stop):
+                loop.call_soon_threadsafe(queue.put_nowait, path)
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    worker = loop.run_in_executor(None, _extract)
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        await worker
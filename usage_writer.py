@@ -0,0 +1,111 @@
+# ScoreWise AI - Buffered Usage Event Writer
+import os
+import uuid
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import UsageRecord
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_SIZE = int(os.getenv("USAGE_FLUSH_SIZE", "200"))
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+# Events kept for another try when the database is unavailable; beyond this the oldest are dropped
+USAGE_BUFFER_LIMIT = int(os.getenv("USAGE_BUFFER_LIMIT", "10000"))
+
+
+def usage_record_id(user_id: str, event_type: str) -> str:
+    return f"usage_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{user_id}_{event_type}_{uuid.uuid4().hex[:8]}"
+
+
+class UsageWriter:
+    """Usage events buffered in memory and written with multi-row inserts.
+
+    Flushes when USAGE_FLUSH_SIZE events are buffered, every
+    USAGE_FLUSH_SECONDS from a background thread, and on shutdown. Only for
+    informational events: usage that is billed is written in the
+    transaction that queues its billing.
+    """
+
+    def __init__(self):
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def add(self, row: Dict[str, Any]):
+        """Buffer one usage_records row"""
+        row.setdefault("id", usage_record_id(row["user_id"], row["event_type"]))
+        row.setdefault("timestamp", datetime.now())
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= USAGE_FLUSH_SIZE
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+                self._thread.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write everything buffered; returns how many rows were written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+
+            db = SessionLocal()
+            try:
+                try:
+                    db.execute(insert(UsageRecord), rows)
+                    db.commit()
+                    return len(rows)
+                except IntegrityError as e:
+                    # Retrying the batch would fail again; keep every row the database accepts
+                    db.rollback()
+                    logger.warning(f"⚠️ {len(rows)} usage events rejected as a batch, writing them one by one: {str(e.orig)}")
+                    return self._write_each(db, rows)
+            except Exception as e:
+                db.rollback()
+                with self._lock:
+                    self._buffer[:0] = rows
+                    dropped = max(0, len(self._buffer) - USAGE_BUFFER_LIMIT)
+                    del self._buffer[:dropped]
+                logger.error(f"✗ Could not write {len(rows)} usage events (dropped {dropped}): {str(e)}")
+                return 0
+            finally:
+                db.close()
+
+    def _write_each(self, db: Session, rows: List[Dict[str, Any]]) -> int:
+        """Insert rows one at a time, dropping and logging the ones the database rejects"""
+        written = 0
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(UsageRecord), [row])
+                written += 1
+            except IntegrityError as e:
+                logger.error(f"✗ Dropped usage event {row['id']}: {str(e.orig)}")
+        db.commit()
+        return written
+
+    def _run(self):
+        while not self._stop.wait(USAGE_FLUSH_SECONDS):
+            self.flush()
+
+    def close(self):
+        """Stop the flush thread and write what is left"""
+        self._stop.set()
+        self.flush()
+
+
+# Initialize usage writer instance
+usage_writer = UsageWriter()
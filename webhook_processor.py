@@ -0,0 +1,176 @@
+# ScoreWise AI - Stripe Webhook Event Processor
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import SubscriptionEvent
+from subscription_service import subscription_service
+
+logger = logging.getLogger(__name__)
+
+RUN_WEBHOOK_PROCESSOR = os.getenv("RUN_WEBHOOK_PROCESSOR", "true").lower() == "true"
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "10"))
+WEBHOOK_CUSTOMERS_PER_PASS = int(os.getenv("WEBHOOK_CUSTOMERS_PER_PASS", "50"))
+# Events that can't be applied yet (e.g. the subscription arrived before checkout linked the customer) are retried
+WEBHOOK_RETRY_SECONDS = int(os.getenv("WEBHOOK_RETRY_SECONDS", "30"))
+# After this many attempts an event is left with its error and no longer holds up the customer's later events
+MAX_WEBHOOK_ATTEMPTS = int(os.getenv("MAX_WEBHOOK_ATTEMPTS", "8"))
+
+SUBSCRIPTION_EVENTS = (
+    "customer.subscription.created",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+)
+
+
+def superseded_updates(events: List[SubscriptionEvent]) -> Dict[str, SubscriptionEvent]:
+    """Subscription updates made redundant by a later event for the same subscription.
+
+    Every subscription event carries the whole subscription, so only the
+    last one of a run needs applying. Returns superseding events by the id
+    of the event they replace.
+    """
+    latest: Dict[str, SubscriptionEvent] = {}
+    superseded = {}
+    for event in reversed(events):
+        if event.event_type not in SUBSCRIPTION_EVENTS:
+            continue
+        subscription_id = event.payload["data"]["object"].get("id")
+        if event.event_type == "customer.subscription.updated" and subscription_id in latest:
+            superseded[event.id] = latest[subscription_id]
+        latest.setdefault(subscription_id, event)
+    return superseded
+
+
+class WebhookProcessor:
+    """Applies Stripe events stored by the webhook endpoint.
+
+    A customer's pending events are applied in Stripe's order in one
+    transaction that holds their row locks, so processors on several nodes
+    never interleave one customer's events.
+    """
+
+    def __init__(self):
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def wake(self):
+        """Apply newly received events now instead of at the next poll"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _pending(self):
+        return (SubscriptionEvent.processed.is_(False),
+                SubscriptionEvent.payload.isnot(None),
+                SubscriptionEvent.attempts < MAX_WEBHOOK_ATTEMPTS)
+
+    def due_customers(self, db: Session) -> List[Optional[str]]:
+        """Customers with events ready to apply, oldest first"""
+        rows = db.query(SubscriptionEvent.stripe_customer_id).filter(
+            *self._pending(), SubscriptionEvent.next_attempt_at <= datetime.now()
+        ).group_by(SubscriptionEvent.stripe_customer_id).order_by(
+            func.min(SubscriptionEvent.stripe_created)
+        ).limit(WEBHOOK_CUSTOMERS_PER_PASS)
+        return [customer_id for (customer_id,) in rows]
+
+    def process_customer(self, db: Session, customer_id: Optional[str]) -> int:
+        """Apply one customer's pending events in order and commit; returns how many were settled"""
+        customer = (SubscriptionEvent.stripe_customer_id == customer_id if customer_id
+                    else SubscriptionEvent.stripe_customer_id.is_(None))
+        try:
+            events = db.query(SubscriptionEvent).filter(*self._pending(), customer).order_by(
+                SubscriptionEvent.stripe_created, SubscriptionEvent.received_at
+            ).with_for_update(nowait=True).all()
+        except OperationalError:
+            # Another processor holds this customer
+            db.rollback()
+            return 0
+
+        now = datetime.now()
+        superseded = superseded_updates(events)
+        settled = 0
+        user_ids: Set[str] = set()
+        for event in events:
+            if event.next_attempt_at > now:
+                break  # waiting to retry; later events must not overtake it
+
+            if event.id in superseded:
+                event.coalesced_into = superseded[event.id].stripe_event_id
+                applied, error = True, None
+            else:
+                savepoint = db.begin_nested()
+                try:
+                    applied = subscription_service.apply_webhook_event(event, db)
+                    error = None if applied else "Could not apply event (unknown customer, subscription or price)"
+                    savepoint.commit()
+                except Exception as e:
+                    savepoint.rollback()
+                    applied, error = False, str(e)
+
+            event.attempts += 1
+            if applied:
+                event.processed = True
+                event.processed_at = now
+                event.error_message = None
+                settled += 1
+                if event.user_id:
+                    user_ids.add(event.user_id)
+                continue
+
+            event.error_message = error
+            event.next_attempt_at = now + timedelta(seconds=WEBHOOK_RETRY_SECONDS * 2 ** (event.attempts - 1))
+            if event.attempts < MAX_WEBHOOK_ATTEMPTS:
+                logger.warning(f"⚠️ Stripe event {event.stripe_event_id} not applied, retrying: {error}")
+                break
+            logger.error(f"✗ Giving up on Stripe event {event.stripe_event_id}: {error}")
+            settled += 1
+
+        db.commit()
+        # Immediate in this process only; every other web process catches up within ENTITLEMENT_TTL_SECONDS
+        for user_id in user_ids:
+            subscription_service.invalidate_entitlements(user_id)
+        return settled
+
+    def run_once(self) -> int:
+        """Apply every due event; returns how many were settled"""
+        settled = 0
+        db = SessionLocal()
+        try:
+            while True:
+                customers = self.due_customers(db)
+                settled_in_pass = 0
+                for customer_id in customers:
+                    db.rollback()
+                    settled_in_pass += self.process_customer(db, customer_id)
+                settled += settled_in_pass
+                # Keep going through a burst while passes come back full and make progress
+                if len(customers) < WEBHOOK_CUSTOMERS_PER_PASS or not settled_in_pass:
+                    break
+        finally:
+            db.close()
+        return settled
+
+    async def run_forever(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            # Cleared first so events received while a pass runs trigger another one
+            self._wakeup.clear()
+            try:
+                # Blocking database work; kept off the event loop so requests aren't stalled by a burst
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"✗ Webhook processor error: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=WEBHOOK_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Initialize webhook processor instance
+webhook_processor = WebhookProcessor()
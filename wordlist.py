@@ -0,0 +1,134 @@
+# ScoreWise AI - Compiled Word List for OCR Quality Checks
+import os
+import sys
+import logging
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Binary layout: 8-byte magic, little-endian uint64 word count, then the
+# sorted 64-bit hashes of every (lower-cased) word in the source list.
+WORD_INDEX_MAGIC = b"SWWORDS2"
+WORD_INDEX_HEADER_SIZE = 16
+
+_HASH_BASE = np.uint64(0x100000001b3)
+_LENGTH_MIX = np.uint64(0x9e3779b97f4a7c15)
+
+
+def hash_words(words: List[str]) -> np.ndarray:
+    """Stable 64-bit hashes for a batch of words, computed without a per-word Python loop.
+
+    Each word is a polynomial over its UTF-8 bytes, mixed with its length and
+    finished with the splitmix64 avalanche. The bytes of all words are
+    concatenated rather than padded to the longest word, so memory grows
+    with the total length of the batch.
+    """
+    encoded = [w.encode("utf-8") for w in words]
+    if not encoded:
+        return np.empty(0, dtype="<u8")
+
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    chars = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    starts = np.cumsum(lengths) - lengths
+    # Position of every byte within its own word
+    offsets = np.arange(len(chars)) - np.repeat(starts, lengths)
+    powers = np.cumprod(np.full(int(lengths.max()), _HASH_BASE, dtype=np.uint64))
+
+    hashes = np.zeros(len(encoded), dtype=np.uint64)
+    nonempty = lengths > 0
+    if nonempty.any():
+        hashes[nonempty] = np.add.reduceat(chars * powers[offsets], starts[nonempty])
+    hashes ^= lengths.astype(np.uint64) * _LENGTH_MIX
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= np.uint64(0xbf58476d1ce4e5b9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94d049bb133111eb)
+    hashes ^= hashes >> np.uint64(31)
+    return hashes
+
+
+def compile_word_list(source_path: str, index_path: str) -> int:
+    """Compile a one-word-per-line text file into a sorted hash index"""
+    with open(source_path, "r") as f:
+        words = {word.strip().lower() for word in f if word.strip()}
+
+    hashes = np.unique(hash_words(list(words))).astype("<u8")
+
+    # Write to a temp file and swap it in so concurrent workers never map a partial index
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(WORD_INDEX_MAGIC)
+        f.write(int(len(hashes)).to_bytes(8, "little"))
+        f.write(hashes.tobytes())
+    os.replace(tmp_path, index_path)
+
+    logger.info(f"✓ Compiled {len(hashes)} words from {source_path} into {index_path}")
+    return len(hashes)
+
+
+class WordIndex:
+    """Read-only, memory-mapped set of words backed by a compiled hash index.
+
+    The mapping is shared through the OS page cache, so every worker process
+    that loads the same index file adds almost nothing to resident memory.
+    """
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as f:
+            header = f.read(WORD_INDEX_HEADER_SIZE)
+        if len(header) != WORD_INDEX_HEADER_SIZE or header[:8] != WORD_INDEX_MAGIC:
+            raise ValueError(f"Not a compiled word index: {index_path}")
+
+        count = int.from_bytes(header[8:], "little")
+        self.path = index_path
+        if count:
+            self._hashes = np.memmap(index_path, dtype="<u8", mode="r",
+                                     offset=WORD_INDEX_HEADER_SIZE, shape=(count,))
+        else:
+            self._hashes = np.empty(0, dtype="<u8")
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, word: str) -> bool:
+        return self.count_valid([word]) == 1
+
+    def count_valid(self, words: List[str]) -> int:
+        """Count how many of the given (lower-cased) words are in the index"""
+        query = hash_words(words)
+        if not len(query) or not len(self._hashes):
+            return 0
+        positions = np.searchsorted(self._hashes, query)
+        positions[positions == len(self._hashes)] = 0
+        return int(np.count_nonzero(self._hashes[positions] == query))
+
+
+def load_word_index(source_path: str = "words.txt", index_path: str = None) -> WordIndex:
+    """Load the compiled index for a word list, (re)building it when missing or stale"""
+    index_path = index_path or os.path.splitext(source_path)[0] + ".bin"
+
+    source_exists = os.path.exists(source_path)
+    if not os.path.exists(index_path) or (
+            source_exists and os.path.getmtime(source_path) > os.path.getmtime(index_path)):
+        if not source_exists:
+            raise FileNotFoundError(f"Word list not found: {source_path}")
+        compile_word_list(source_path, index_path)
+
+    try:
+        return WordIndex(index_path)
+    except ValueError:
+        # Index written by an older format version
+        if not source_exists:
+            raise
+        compile_word_list(source_path, index_path)
+        return WordIndex(index_path)
+
+
+if __name__ == "__main__":
+    # Usage: python wordlist.py [words.txt] [words.bin]
+    logging.basicConfig(level=logging.INFO)
+    source = sys.argv[1] if len(sys.argv) > 1 else "words.txt"
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".bin"
+    compile_word_list(source, target)